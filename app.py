@@ -16,6 +16,11 @@ from dynamodb_models import (
     USER_DATA_TABLE_SETTINGS,
     NEXT_JS_AUTH_TABLE_SETTINGS,
     FEEDBACK_TABLE_SETTINGS,
+    OPENAI_RATE_LIMIT_TABLE_SETTINGS,
+    SANDBOX_CHAT_MESSAGES_TABLE_SETTINGS,
+    SANDBOX_CONVERSATIONS_TABLE_SETTINGS,
+    SANDBOX_CHAT_CONNECTIONS_TABLE_SETTINGS,
+    FEEDBACK_AGGREGATES_TABLE_SETTINGS,
 )
 from dynamodb_stack import DynamodbStack
 
@@ -41,6 +46,36 @@ dynamo_db_feedback_stack = DynamodbStack(
     dynamodb_settings=FEEDBACK_TABLE_SETTINGS,
 )
 
+dynamo_db_openai_rate_limit_stack = DynamodbStack(
+    scope=app,
+    stack_id="dynamo-stack-openai-rate-limit",
+    dynamodb_settings=OPENAI_RATE_LIMIT_TABLE_SETTINGS,
+)
+
+dynamo_db_sandbox_chat_messages_stack = DynamodbStack(
+    scope=app,
+    stack_id="dynamo-stack-sandbox-chat-messages",
+    dynamodb_settings=SANDBOX_CHAT_MESSAGES_TABLE_SETTINGS,
+)
+
+dynamo_db_sandbox_conversations_stack = DynamodbStack(
+    scope=app,
+    stack_id="dynamo-stack-sandbox-conversations",
+    dynamodb_settings=SANDBOX_CONVERSATIONS_TABLE_SETTINGS,
+)
+
+dynamo_db_sandbox_chat_connections_stack = DynamodbStack(
+    scope=app,
+    stack_id="dynamo-stack-sandbox-chat-connections",
+    dynamodb_settings=SANDBOX_CHAT_CONNECTIONS_TABLE_SETTINGS,
+)
+
+dynamo_db_feedback_aggregates_stack = DynamodbStack(
+    scope=app,
+    stack_id="dynamo-stack-feedback-aggregates",
+    dynamodb_settings=FEEDBACK_AGGREGATES_TABLE_SETTINGS,
+)
+
 # arn:aws:secretsmanager:us-east-1:645860363137:secret:openai/apikey-fMd6JZ
 # arn:aws:secretsmanager:us-west-2:645860363137:secret:openai/apikey-gXnzTj
 lambda_settings = AIToolsLambdaSettings(
@@ -67,6 +102,11 @@ read_only_tables = [
 read_write_tables = [
     dynamo_db_user_data_stack.table,
     dynamo_db_feedback_stack.table,
+    dynamo_db_openai_rate_limit_stack.table,
+    dynamo_db_sandbox_chat_messages_stack.table,
+    dynamo_db_sandbox_conversations_stack.table,
+    dynamo_db_sandbox_chat_connections_stack.table,
+    dynamo_db_feedback_aggregates_stack.table,
 ]
 
 AIToolsStack(
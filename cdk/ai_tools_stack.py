@@ -14,6 +14,7 @@ from constructs import Construct
 import aws_cdk.aws_lambda as lambda_
 import aws_cdk.aws_dynamodb as dynamodb
 import aws_cdk.aws_apigateway as api_gateway
+import aws_cdk.aws_apigatewayv2 as api_gateway_v2
 import aws_cdk.aws_iam as iam
 import aws_cdk.aws_secretsmanager as secretsmanager
 
@@ -22,7 +23,7 @@ sys.path.append(os.path.join(parent_dir, "../src/api/lambda/lambda_dependencies"
 sys.path.append(os.path.join(parent_dir, "../src/api/lambda/ai_tools_api"))
 
 from ai_tools_lambda_settings import AIToolsLambdaSettings # pylint: disable=import-error
-from api_gateway_settings import APIGatewaySettings # pylint: disable=import-error
+from api_gateway_settings import APIGatewaySettings, BINARY_MEDIA_TYPES # pylint: disable=import-error
 
 
 class AIToolsStackSettings(BaseSettings):
@@ -97,6 +98,12 @@ class AIToolsStack(Stack):
             default_integration=api_gateway.LambdaIntegration(openai_lambda, proxy=True),
             default_cors_preflight_options=self.cors_options
         )
+        self.websocket_api = self._create_websocket_api(
+            openai_lambda=openai_lambda,
+            api_gateway_settings=api_gateway_settings,
+            stack_settings=stack_settings,
+            role=role,
+        )
 
 
     def _create_rest_api(self, api_gateway_settings: APIGatewaySettings) -> tuple[api_gateway.RestApi, api_gateway.CorsOptions]:
@@ -113,10 +120,58 @@ class AIToolsStack(Stack):
         )
         rest_api = api_gateway.RestApi(self, "RestApi",
             rest_api_name=self.namer("rest-api"),
-            default_cors_preflight_options=cors_options
+            default_cors_preflight_options=cors_options,
+            # the compressed responses are base64 encoded by mangum, a catch-all type would also break the cors preflight mocks
+            binary_media_types=BINARY_MEDIA_TYPES,
         )
         return rest_api, cors_options
 
+    def _create_websocket_api(
+        self,
+        openai_lambda: lambda_.Function,
+        api_gateway_settings: APIGatewaySettings,
+        stack_settings: AIToolsStackSettings,
+        role: iam.Role,
+    ) -> api_gateway_v2.CfnApi:
+        """Create a websocket api sending the $connect, $default and $disconnect routes to the lambda."""
+        websocket_api = api_gateway_v2.CfnApi(self, self.namer("websocket-api"),
+            name=self.namer("websocket-api"),
+            protocol_type="WEBSOCKET",
+            route_selection_expression="$request.body.action",
+        )
+        integration = api_gateway_v2.CfnIntegration(self, self.namer("websocket-integration"),
+            api_id=websocket_api.ref,
+            integration_type="AWS_PROXY",
+            integration_uri=f"arn:aws:apigateway:{stack_settings.aws_region}:lambda:path/2015-03-31/functions/{openai_lambda.function_arn}/invocations",
+        )
+        routes = []
+        for route_key in ["$connect", "$default", "$disconnect"]:
+            routes.append(api_gateway_v2.CfnRoute(self, self.namer(f"websocket-route-{route_key.strip('$')}"),
+                api_id=websocket_api.ref,
+                route_key=route_key,
+                target=f"integrations/{integration.ref}",
+            ))
+        deployment = api_gateway_v2.CfnDeployment(self, self.namer("websocket-deployment"), api_id=websocket_api.ref)
+        for route in routes:
+            deployment.add_dependency(route)
+        api_gateway_v2.CfnStage(self, self.namer("websocket-stage"),
+            api_id=websocket_api.ref,
+            deployment_id=deployment.ref,
+            stage_name=api_gateway_settings.deployment_stage,
+        )
+        openai_lambda.add_permission(self.namer("websocket-invoke"),
+            principal=iam.ServicePrincipal("apigateway.amazonaws.com"),
+            source_arn=f"arn:aws:execute-api:{stack_settings.aws_region}:{stack_settings.aws_account}:{websocket_api.ref}/*",
+        )
+        # replies are sent to the clients through the management api of the websocket api
+        role.add_to_policy(
+            statement=iam.PolicyStatement(
+                actions=["execute-api:ManageConnections"],
+                resources=[f"arn:aws:execute-api:{stack_settings.aws_region}:{stack_settings.aws_account}:{websocket_api.ref}/*"]
+            )
+        )
+        return websocket_api
+
     def _create_aiforu_tools_lambda(self, lambda_settings: AIToolsLambdaSettings, gateway_settings: APIGatewaySettings, role: iam.Role) -> lambda_.Function:
         """Create a lambda function with the provided id and environment variables."""
         id_ = lambda_settings.openai_lambda_id
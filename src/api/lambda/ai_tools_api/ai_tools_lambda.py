@@ -1,8 +1,11 @@
+import asyncio
 import logging
+import math
 import os
 import sys
 import traceback
 from enum import Enum
+from typing import Optional
 from uuid import UUID
 from pathlib import Path
 from pydantic import BaseModel
@@ -11,6 +14,7 @@ from mangum import Mangum
 from fastapi import FastAPI, APIRouter, Request, status , Response
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
+from starlette.concurrency import run_in_threadpool
 from pynamodb.models import Model
 
 dir_path = Path(__file__).parent
@@ -22,6 +26,16 @@ sys.path.append(Path(__file__, "../dynamodb_models"))
 from api_gateway_settings import APIGatewaySettings, DeploymentStage
 from ai_tools_lambda_settings import AIToolsLambdaSettings
 from dynamodb_models import UserDataTableModel
+from custom_exceptions import OpenAIRateLimitExceededError
+from feedback_buffer import feedback_buffer, feedback_buffer_settings
+from openapi_schema import add_openapi_routes, get_unique_id_generator
+from response_compression import CompressionMiddleware, compression_settings
+from sandbox_chat_websocket import (
+    SANDBOX_CHAT_WEBSOCKET_PATH,
+    add_local_websocket_route,
+    is_websocket_event,
+    websocket_handler,
+)
 from routers import (
     text_revisor,
     cover_letter_writer,
@@ -41,6 +55,7 @@ from utils import (
     is_user_authenticated,
     EXAMPLES_ENDPOINT_POSTFIX,
     get_user_uuid_from_jwt_token,
+    initialize_user_db,
 )
 
 logger = logging.getLogger()
@@ -53,6 +68,8 @@ use OpenAI's GPT-3 API to generate text. All requests must include a uuid header
 This uuid is used to check if the user is authenticated and to track usage of the API.
 """
 
+RATE_LIMIT_RETRY_AFTER_SECONDS = 20
+
 lambda_settings = AIToolsLambdaSettings()
 api_gateway_settings = APIGatewaySettings()
 router = APIRouter()
@@ -72,11 +89,17 @@ def get_error_message(error: Exception) -> str:
         return traceback_str
     return str(error)
 
-def get_error_response(request: Request, content: dict) -> Response:
+def get_error_response(
+    request: Request,
+    content: dict,
+    status_code: int = status.HTTP_500_INTERNAL_SERVER_ERROR,
+    headers: Optional[dict] = None,
+) -> Response:
     """Return error response."""
     response = JSONResponse(
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        content=content
+        status_code=status_code,
+        content=content,
+        headers=headers,
     )
     prepare_response(response, request)
     return response
@@ -103,16 +126,22 @@ def handle_rate_limit_exception(request: Request, exc: RateLimitError):
     """Handle exception."""
     msg = get_error_message(exc)
     content = {"Rate Limit Exception": msg}
-    return get_error_response(request, content)
+    return get_error_response(
+        request,
+        content,
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(RATE_LIMIT_RETRY_AFTER_SECONDS)},
+    )
 
-def initialize_user_db(uuid: UUID, is_user_authenticated: bool):
-    try:
-        user_data_model: UserDataTableModel = UserDataTableModel.get(str(uuid))
-    except (Model.DoesNotExist):
-        user_data_model = UserDataTableModel(str(uuid), authenticated_user=is_user_authenticated)
-        user_data_model.save()
-    if is_user_authenticated:
-        user_data_model.update(actions=[UserDataTableModel.authenticated_user.set(True)])
+def handle_openai_rate_limit_exceeded_exception(request: Request, exc: OpenAIRateLimitExceededError):
+    """Handle exception."""
+    content = {"Rate Limit Exception": exc.message}
+    return get_error_response(
+        request,
+        content,
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
 
 def create_fastapi_app():
     """Create FastAPI app."""
@@ -120,13 +149,17 @@ def create_fastapi_app():
     if api_gateway_settings.deployment_stage == DeploymentStage.LOCAL.value:
         root_path = ""
 
+    # the schema and docs routes are added by add_openapi_routes, to serve the schema generated at build time
     app = FastAPI(
         root_path=root_path,
-        docs_url=f"/{api_gateway_settings.openai_route_prefix}/docs",
-        openapi_url=f"/{api_gateway_settings.openai_route_prefix}/openapi.json",
+        docs_url=None,
+        openapi_url=None,
         redoc_url=None,
         description=API_DESCRIPTION,
+        # the operation ids do not depend on the route prefix, so neither does the schema file
+        generate_unique_id_function=get_unique_id_generator(api_gateway_settings.openai_route_prefix),
     )
+    add_openapi_routes(app, api_gateway_settings.openai_route_prefix)
 
     @app.middleware("http")
     async def check_if_header_is_present(request: Request, call_next):
@@ -166,6 +199,9 @@ def create_fastapi_app():
         prepare_response(response, request)
         return response
 
+    # added last to wrap the middleware above, so it compresses the responses prepared by prepare_response
+    app.add_middleware(CompressionMiddleware, settings=compression_settings)
+
     routers = [
         router,
         text_summarizer.router,
@@ -179,19 +215,46 @@ def create_fastapi_app():
     initialize_openai()
     for router_ in routers:
         add_router_with_prefix(app, router_, f"/{api_gateway_settings.openai_route_prefix}")
+    if api_gateway_settings.deployment_stage == DeploymentStage.LOCAL.value:
+        # deployed stages receive WebSocket connections from API Gateway through lambda_handler
+        add_local_websocket_route(app, f"/{api_gateway_settings.openai_route_prefix}/{SANDBOX_CHAT_WEBSOCKET_PATH}")
+        add_feedback_flush_events(app)
     app.add_exception_handler(RequestValidationError, handle_request_validation_error)
     app.add_exception_handler(Exception, handle_generic_exception)
     app.add_exception_handler(UserTokenNotFoundError, handle_user_token_error)
     app.add_exception_handler(RateLimitError, handle_rate_limit_exception)
+    app.add_exception_handler(OpenAIRateLimitExceededError, handle_openai_rate_limit_exceeded_exception)
     
     return app
 
+def add_feedback_flush_events(app: FastAPI) -> None:
+    """Flush the buffered feedback on a timer and at shutdown when the app is served by uvicorn."""
+    flush_task: Optional[asyncio.Task] = None
+
+    @app.on_event("startup")
+    async def start_flushing_feedback():
+        nonlocal flush_task
+        flush_task = asyncio.create_task(
+            feedback_buffer.flush_periodically(feedback_buffer_settings.feedback_flush_interval_seconds)
+        )
+
+    @app.on_event("shutdown")
+    async def flush_feedback():
+        if flush_task:
+            flush_task.cancel()
+        await run_in_threadpool(feedback_buffer.flush)
+
 def add_router_with_prefix(app: FastAPI, router: APIRouter, prefix: str) -> None:
     """Add router with prefix."""
     app.include_router(router, prefix=prefix)
 
 def lambda_handler(event, context):
     """Lambda handler that starts a FastAPI server with uvicorn."""
+    if is_websocket_event(event):
+        return websocket_handler(event, context)
     app = create_fastapi_app()
     handler = Mangum(app=app)
-    return handler(event, context)
+    response = handler(event, context)
+    # the feedback buffered during the invocation is written before the container is frozen
+    feedback_buffer.flush()
+    return response
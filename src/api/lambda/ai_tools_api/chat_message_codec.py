@@ -0,0 +1,60 @@
+"""
+Compact binary encoding of stored chat messages.
+
+A message is encoded as a version byte followed by a compact JSON array holding a role
+code and the content, deflated when that makes it smaller. Short messages are stored
+uncompressed since the deflate overhead would outweigh the savings. The version byte
+lets the encoding evolve while older items remain readable.
+"""
+import json
+import zlib
+
+
+ENCODING_VERSION_JSON = 1
+ENCODING_VERSION_DEFLATED_JSON = 2
+ROLE_CODES = {"user": 0, "assistant": 1, "system": 2}
+ROLES_BY_CODE = {code: role for role, code in ROLE_CODES.items()}
+# raw deflate stream, the zlib header and checksum are redundant inside a versioned payload
+DEFLATE_WINDOW_BITS = -15
+
+
+def encode_chat_message(role: str, content: str) -> bytes:
+    """
+    Encode a chat message into its compact binary form.
+
+    Args:
+        role: The role of the author of the message.
+        content: The content of the message.
+
+    Returns:
+        payload: The encoded message.
+    """
+    data = json.dumps([ROLE_CODES[role], content], separators=(",", ":"), ensure_ascii=False).encode()
+    compressor = zlib.compressobj(level=9, wbits=DEFLATE_WINDOW_BITS)
+    compressed_data = compressor.compress(data) + compressor.flush()
+    if len(compressed_data) < len(data):
+        return bytes([ENCODING_VERSION_DEFLATED_JSON]) + compressed_data
+    return bytes([ENCODING_VERSION_JSON]) + data
+
+
+def decode_chat_message(payload: bytes) -> tuple[str, str]:
+    """
+    Decode a chat message from its compact binary form.
+
+    Args:
+        payload: The encoded message.
+
+    Returns:
+        role: The role of the author of the message.
+        content: The content of the message.
+
+    Raises:
+        ValueError: If the payload was encoded with an unsupported version.
+    """
+    version, data = payload[0], payload[1:]
+    if version == ENCODING_VERSION_DEFLATED_JSON:
+        data = zlib.decompress(data, wbits=DEFLATE_WINDOW_BITS)
+    elif version != ENCODING_VERSION_JSON:
+        raise ValueError(f"Unsupported chat message encoding version: {version}")
+    role_code, content = json.loads(data)
+    return ROLES_BY_CODE[role_code], content
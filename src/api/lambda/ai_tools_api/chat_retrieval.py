@@ -0,0 +1,99 @@
+"""
+Relevance retrieval over the earlier turns of a conversation.
+
+Recency truncation and the rolling summary keep the prompt small but can lose specific
+facts mentioned long ago. This module builds a small in-process BM25 index over earlier
+turns and selects the turns that best match the new user message within a token budget,
+so they can be added back to the prompt without sending the whole history.
+"""
+import math
+from collections import Counter, defaultdict
+from typing import Sequence
+from extractive_compression import tokenize_words
+
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class BM25Index:
+    """Okapi BM25 index over a small collection of documents, backed by an inverted index."""
+
+    def __init__(self, documents: Sequence[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.document_lengths: list[int] = []
+        self.postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        for document_index, document in enumerate(documents):
+            words = tokenize_words(document)
+            self.document_lengths.append(len(words))
+            for word, count in Counter(words).items():
+                self.postings[word].append((document_index, count))
+        self.average_document_length = sum(self.document_lengths) / len(self.document_lengths) if documents else 0.0
+
+    def get_inverse_document_frequency(self, word: str) -> float:
+        """Return the BM25 inverse document frequency of a word (always positive)."""
+        document_count = len(self.document_lengths)
+        document_frequency = len(self.postings.get(word, ()))
+        return math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def score(self, query: str) -> list[float]:
+        """
+        Score every document against a query.
+
+        Args:
+            query: The text to match the documents against.
+
+        Returns:
+            scores: The score of each document (parallel to the documents), 0 if no word matches.
+        """
+        scores = [0.0] * len(self.document_lengths)
+        if not self.average_document_length:
+            return scores
+        for word in set(tokenize_words(query)):
+            postings = self.postings.get(word)
+            if not postings:
+                continue
+            inverse_document_frequency = self.get_inverse_document_frequency(word)
+            for document_index, count in postings:
+                length_ratio = self.document_lengths[document_index] / self.average_document_length
+                normalized_count = count * (self.k1 + 1) / (count + self.k1 * (1 - self.b + self.b * length_ratio))
+                scores[document_index] += inverse_document_frequency * normalized_count
+        return scores
+
+
+def select_relevant_turns(
+    turn_texts: Sequence[str],
+    turn_token_counts: Sequence[int],
+    query: str,
+    token_budget: int,
+    max_turns: int,
+) -> list[int]:
+    """
+    Select the turns most relevant to a query that fit in a token budget.
+
+    Turns are taken from the highest score down, skipping turns that would exceed the
+    budget, and turns that share no word with the query are never selected.
+
+    Args:
+        turn_texts: The text of each turn.
+        turn_token_counts: The token count of each turn (parallel to the texts).
+        query: The text to match the turns against (e.g. the new user message).
+        token_budget: The maximum total token count of the selected turns.
+        max_turns: The maximum number of turns to select.
+
+    Returns:
+        turn_indexes: The indexes of the selected turns in chronological order.
+    """
+    scores = BM25Index(turn_texts).score(query)
+    ranked_indexes = sorted((index for index, score in enumerate(scores) if score > 0), key=lambda index: -scores[index])
+    selected_indexes = []
+    selected_token_count = 0
+    for index in ranked_indexes:
+        if len(selected_indexes) >= max_turns:
+            break
+        if selected_token_count + turn_token_counts[index] > token_budget:
+            continue
+        selected_indexes.append(index)
+        selected_token_count += turn_token_counts[index]
+    return sorted(selected_indexes)
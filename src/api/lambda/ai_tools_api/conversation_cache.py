@@ -0,0 +1,100 @@
+"""
+In-memory cache of conversations for warm containers and workers.
+
+Consecutive turns of a conversation usually land on the same warm lambda container or
+uvicorn worker. Keeping the conversation state in a size bounded LRU cache lets a turn
+skip reading it again. Entries carry the version of the stored conversation: writes go
+through to DynamoDB conditionally on that version, so a stale entry is detected when it
+is saved and is then invalidated.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, NamedTuple, Optional, TypeVar
+from pydantic import BaseSettings, conint
+
+
+T = TypeVar("T")
+
+
+class ConversationCacheSettings(BaseSettings):
+    """Define the settings of the conversation cache."""
+
+    conversation_cache_max_entries: conint(ge=0) = 256
+    conversation_cache_max_size: conint(ge=0) = 8 * 1024 * 1024
+
+    class Config:
+        case_sensitive = False
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    version: Optional[int]
+    size: int
+
+
+class ConversationCache(Generic[T]):
+    """Size bounded LRU cache of versioned values."""
+
+    def __init__(self, max_entries: int, max_size: int, get_size: Callable[[T], int]):
+        """
+        Args:
+            max_entries: The maximum number of values kept, 0 disables the cache.
+            max_size: The maximum total size of the values kept.
+            get_size: Returns the approximate size of a value (e.g. the length of its content).
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.get_size = get_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: ConversationCacheSettings, get_size: Callable[[T], int]) -> "ConversationCache[T]":
+        return cls(settings.conversation_cache_max_entries, settings.conversation_cache_max_size, get_size)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[T]:
+        """Get a value and mark it as the most recently used, None if it is not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: Hashable, value: T, version: Optional[int]) -> None:
+        """
+        Cache a value, evicting the least recently used values to stay within the bounds.
+
+        A value older than the cached one (lower version) is ignored so that a slow request
+        cannot replace the state saved by a faster one.
+        """
+        size = self.get_size(value)
+        with self._lock:
+            cached_entry = self._entries.get(key)
+            if cached_entry is not None:
+                if version is not None and cached_entry.version is not None and version < cached_entry.version:
+                    return
+                self._remove(key)
+            if self.max_entries == 0 or size > self.max_size:
+                return
+            self._entries[key] = CacheEntry(value, version, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, key: Hashable) -> None:
+        """Remove a value from the cache (e.g. after it was found to be stale)."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key: Hashable) -> None:
+        self.size -= self._entries.pop(key).size
@@ -0,0 +1,19 @@
+"""Define the custom exceptions raised by the AI tools API."""
+
+
+class OpenAIRateLimitExceededError(Exception):
+    """
+    The OpenAI organization quota is exhausted and the request was shed.
+
+    Attributes:
+        retry_after: The number of seconds the client should wait before retrying.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__(self.message)
+
+
+class RecordedCompletionNotFoundError(Exception):
+    """No completion was recorded for a request replayed by the record/replay LLM backend."""
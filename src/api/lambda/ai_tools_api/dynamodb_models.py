@@ -3,11 +3,13 @@ import pytz
 from typing import Optional
 import sys
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum
 from pynamodb.models import Model
-from pynamodb.attributes import UnicodeAttribute, BooleanAttribute, NumberAttribute, JSONAttribute, UTCDateTimeAttribute
+from pynamodb.indexes import GlobalSecondaryIndex, AllProjection
+from pynamodb.attributes import UnicodeAttribute, BooleanAttribute, NumberAttribute, JSONAttribute, UTCDateTimeAttribute, TTLAttribute, BinaryAttribute, VersionAttribute
 from pydantic import BaseSettings, AnyUrl, constr, validator
+from chat_message_codec import decode_chat_message, encode_chat_message
 
 
 CDK_DEFAULT_REGION_VAR_NAME = "CDK_DEFAULT_REGION"
@@ -57,8 +59,13 @@ class DynamoDBSettings(BaseSettings):
 USER_DATA_TABLE_SETTINGS = DynamoDBSettings(
     table_name="user-data",
     partition_key="UUID",
+    secondary_index_name="subscribers-index",
+    secondary_partition_key="subscription_status",
+    secondary_sort_key="email_address",
 )
 
+SUBSCRIBED_STATUS = "subscribed"
+
 NEXT_JS_AUTH_TABLE_SETTINGS = DynamoDBSettings(
     table_name="next-auth",
     partition_key="pk",
@@ -73,6 +80,67 @@ FEEDBACK_TABLE_SETTINGS = DynamoDBSettings(
     partition_key="feedback_UUID",
 )
 
+OPENAI_RATE_LIMIT_TABLE_SETTINGS = DynamoDBSettings(
+    table_name="openai-rate-limit",
+    partition_key="window_key",
+)
+
+SANDBOX_CHAT_MESSAGES_TABLE_SETTINGS = DynamoDBSettings(
+    table_name="sandbox-chat-messages",
+    partition_key="conversation_key",
+    sort_key="message_index",
+    sort_key_type=SupportedKeyTypes.NUMBER,
+)
+
+SANDBOX_CONVERSATIONS_TABLE_SETTINGS = DynamoDBSettings(
+    table_name="sandbox-conversations",
+    partition_key="user_uuid",
+    sort_key="conversation_uuid",
+    secondary_index_name="last-updated-index",
+    secondary_partition_key="user_uuid",
+    secondary_sort_key="last_updated",
+)
+
+SANDBOX_CHAT_CONNECTIONS_TABLE_SETTINGS = DynamoDBSettings(
+    table_name="sandbox-chat-connections",
+    partition_key="connection_id",
+)
+
+FEEDBACK_AGGREGATES_TABLE_SETTINGS = DynamoDBSettings(
+    table_name="feedback-aggregates",
+    partition_key="ai_tool_name",
+    sort_key="day",
+)
+
+class RawBinaryAttribute(BinaryAttribute):
+    """
+    Binary attribute stored as is.
+
+    BinaryAttribute base64 encodes values before they are sent, so they are stored a third larger.
+    """
+
+    def serialize(self, value):
+        return value
+
+    def deserialize(self, value):
+        return value
+
+
+class UserDataSubscribersIndex(GlobalSecondaryIndex):
+    """
+    Sparse index of the subscribed users by email address.
+
+    Only the items with a subscription_status are in the index, so listing the subscribers
+    or finding the users of an email address is a query on the subscribers alone.
+    """
+    class Meta:
+        index_name = USER_DATA_TABLE_SETTINGS.secondary_index_name
+        projection = AllProjection()
+
+    subscription_status = UnicodeAttribute(hash_key=True, attr_name=USER_DATA_TABLE_SETTINGS.secondary_partition_key)
+    email_address = UnicodeAttribute(range_key=True, attr_name=USER_DATA_TABLE_SETTINGS.secondary_sort_key)
+
+
 class UserDataTableModel(Model):
     class Meta:
         region = USER_DATA_TABLE_SETTINGS.aws_region
@@ -84,8 +152,11 @@ class UserDataTableModel(Model):
     token_count_last_reset_date = UTCDateTimeAttribute(default=get_eastern_time_previous_day_midnight())
     is_subscribed = BooleanAttribute(null=True)
     sandbox_chat_history = JSONAttribute(null=True)
-    email_address = UnicodeAttribute(null=True)
+    email_address = UnicodeAttribute(null=True, attr_name=USER_DATA_TABLE_SETTINGS.secondary_sort_key)
     authenticated_user = BooleanAttribute(null=True)
+    expires = TTLAttribute(null=True)
+    subscription_status = UnicodeAttribute(null=True, attr_name=USER_DATA_TABLE_SETTINGS.secondary_partition_key)
+    subscribers_index = UserDataSubscribersIndex()
 
 
 class NextJsAuthTableModel(Model):
@@ -121,10 +192,134 @@ class FeedbackTableModel(Model):
         host = FEEDBACK_TABLE_SETTINGS.host
 
     feedback_UUID = UnicodeAttribute(hash_key=True, attr_name=FEEDBACK_TABLE_SETTINGS.partition_key)
-    timestamp = NumberAttribute(default=datetime.utcnow())
+    timestamp = NumberAttribute(default_for_new=lambda: datetime.now(timezone.utc).timestamp())
     ai_tool_name = UnicodeAttribute()
     user_UUID = UnicodeAttribute()
     user_prompt_feedback_context = JSONAttribute()
     ai_response_feedback_context = JSONAttribute()
     rating = NumberAttribute()
     written_feedback = UnicodeAttribute(null=True)
+    expires = TTLAttribute(null=True)
+
+
+class FeedbackAggregateTableModel(Model):
+    """
+    Rating counters of an AI tool for a day (YYYY-MM-DD, UTC), updated with atomic ADD actions.
+
+    The average rating is rating_sum / rating_count, rating_N_count counts the N star ratings.
+    """
+    class Meta:
+        region = FEEDBACK_AGGREGATES_TABLE_SETTINGS.aws_region
+        table_name = FEEDBACK_AGGREGATES_TABLE_SETTINGS.table_name
+        host = FEEDBACK_AGGREGATES_TABLE_SETTINGS.host
+
+    ai_tool_name = UnicodeAttribute(hash_key=True, attr_name=FEEDBACK_AGGREGATES_TABLE_SETTINGS.partition_key)
+    day = UnicodeAttribute(range_key=True, attr_name=FEEDBACK_AGGREGATES_TABLE_SETTINGS.sort_key)
+    rating_count = NumberAttribute(default=0)
+    rating_sum = NumberAttribute(default=0)
+    rating_1_count = NumberAttribute(default=0)
+    rating_2_count = NumberAttribute(default=0)
+    rating_3_count = NumberAttribute(default=0)
+    rating_4_count = NumberAttribute(default=0)
+    rating_5_count = NumberAttribute(default=0)
+
+
+class OpenAIRateLimitTableModel(Model):
+    """Usage counters for the OpenAI organization quota, one item per rate limit window."""
+    class Meta:
+        region = OPENAI_RATE_LIMIT_TABLE_SETTINGS.aws_region
+        table_name = OPENAI_RATE_LIMIT_TABLE_SETTINGS.table_name
+        host = OPENAI_RATE_LIMIT_TABLE_SETTINGS.host
+
+    window_key = UnicodeAttribute(hash_key=True, attr_name=OPENAI_RATE_LIMIT_TABLE_SETTINGS.partition_key)
+    token_count = NumberAttribute(default=0)
+    request_count = NumberAttribute(default=0)
+    expires = TTLAttribute(null=True)
+
+
+class SandboxChatMessageTableModel(Model):
+    """
+    A single message of a sandbox-chatgpt conversation.
+
+    The role and content are stored in the compact binary payload. Items written before the
+    payload was introduced store them as plain attributes and are still read transparently.
+    """
+    class Meta:
+        region = SANDBOX_CHAT_MESSAGES_TABLE_SETTINGS.aws_region
+        table_name = SANDBOX_CHAT_MESSAGES_TABLE_SETTINGS.table_name
+        host = SANDBOX_CHAT_MESSAGES_TABLE_SETTINGS.host
+
+    conversation_key = UnicodeAttribute(hash_key=True, attr_name=SANDBOX_CHAT_MESSAGES_TABLE_SETTINGS.partition_key)
+    message_index = NumberAttribute(range_key=True, attr_name=SANDBOX_CHAT_MESSAGES_TABLE_SETTINGS.sort_key)
+    payload = RawBinaryAttribute(null=True)
+    role = UnicodeAttribute(null=True)
+    content = UnicodeAttribute(null=True)
+    token_count = NumberAttribute(default=0)
+    cumulative_token_count = NumberAttribute(default=0)
+    created_at = UTCDateTimeAttribute(default_for_new=datetime.utcnow)
+    expires = TTLAttribute(null=True)
+
+    @classmethod
+    def from_message(cls, conversation_key: str, message_index: int, role: str, content: str, **attributes) -> "SandboxChatMessageTableModel":
+        """Create a message item storing the role and content in the compact binary payload."""
+        return cls(conversation_key, message_index, payload=encode_chat_message(role, content), **attributes)
+
+    def get_role_and_content(self) -> tuple[str, str]:
+        """Get the role and content of the message, whichever way the item stores them."""
+        if self.payload is not None:
+            return decode_chat_message(self.payload)
+        return self.role, self.content
+
+
+class SandboxConversationLastUpdatedIndex(GlobalSecondaryIndex):
+    """Index of the sandbox-chatgpt conversations of a user ordered by when they were last updated."""
+    class Meta:
+        index_name = SANDBOX_CONVERSATIONS_TABLE_SETTINGS.secondary_index_name
+        projection = AllProjection()
+
+    user_uuid = UnicodeAttribute(hash_key=True, attr_name=SANDBOX_CONVERSATIONS_TABLE_SETTINGS.secondary_partition_key)
+    last_updated = UTCDateTimeAttribute(range_key=True, attr_name=SANDBOX_CONVERSATIONS_TABLE_SETTINGS.secondary_sort_key)
+
+
+class SandboxConversationTableModel(Model):
+    """
+    Metadata of a sandbox-chatgpt conversation, the messages are stored in the messages table.
+
+    The rolling summary condenses the messages before summarized_through_index. The version
+    makes every update conditional on the item not having changed since it was read.
+    """
+    class Meta:
+        region = SANDBOX_CONVERSATIONS_TABLE_SETTINGS.aws_region
+        table_name = SANDBOX_CONVERSATIONS_TABLE_SETTINGS.table_name
+        host = SANDBOX_CONVERSATIONS_TABLE_SETTINGS.host
+
+    user_uuid = UnicodeAttribute(hash_key=True, attr_name=SANDBOX_CONVERSATIONS_TABLE_SETTINGS.partition_key)
+    conversation_uuid = UnicodeAttribute(range_key=True, attr_name=SANDBOX_CONVERSATIONS_TABLE_SETTINGS.sort_key)
+    last_updated = UTCDateTimeAttribute(attr_name=SANDBOX_CONVERSATIONS_TABLE_SETTINGS.secondary_sort_key)
+    title = UnicodeAttribute(default="")
+    token_count = NumberAttribute(default=0)
+    message_count = NumberAttribute(default=0)
+    summary = UnicodeAttribute(null=True)
+    summary_token_count = NumberAttribute(default=0)
+    summarized_through_index = NumberAttribute(default=0)
+    version = VersionAttribute()
+    expires = TTLAttribute(null=True)
+    last_updated_index = SandboxConversationLastUpdatedIndex()
+
+
+class SandboxChatConnectionTableModel(Model):
+    """An open sandbox-chatgpt WebSocket connection and the user authenticated when it was opened."""
+    class Meta:
+        region = SANDBOX_CHAT_CONNECTIONS_TABLE_SETTINGS.aws_region
+        table_name = SANDBOX_CHAT_CONNECTIONS_TABLE_SETTINGS.table_name
+        host = SANDBOX_CHAT_CONNECTIONS_TABLE_SETTINGS.host
+
+    connection_id = UnicodeAttribute(hash_key=True, attr_name=SANDBOX_CHAT_CONNECTIONS_TABLE_SETTINGS.partition_key)
+    user_uuid = UnicodeAttribute()
+    authenticated = BooleanAttribute(default=False)
+    expires = TTLAttribute(null=True)
+
+
+def get_sandbox_conversation_key(user_uuid: str, conversation_uuid: str) -> str:
+    """Get the partition key of the messages of a sandbox-chatgpt conversation."""
+    return f"{user_uuid}#{conversation_uuid}"
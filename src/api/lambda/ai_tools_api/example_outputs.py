@@ -0,0 +1,125 @@
+"""
+Reference outputs of the examples of the AI tools, served without calling the LLM.
+
+The examples endpoints return payloads that users post to the tools as they are, so the
+outputs of every example are generated at build time by generate_example_outputs.py and
+stored in example_outputs.json with the tokens they used. A tool receiving a request
+with the canonical hash of an example returns its stored output instead, and charges the
+user the stored token count scaled by the configured ratio.
+"""
+import json
+import logging
+import math
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Type, Union
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, BaseSettings, confloat
+from gpt_turbo import charge_user_for_example_output
+from utils import (
+    TOKENS_EXHAUSTED_FOR_DAY_JSON_RESPONSE,
+    TOKENS_EXHAUSTED_LOGIN_JSON_RESPONSE,
+    TokensExhaustedException,
+    get_canonical_request_hash,
+)
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+EXAMPLE_OUTPUTS_PATH = Path(__file__).parent / "example_outputs.json"
+
+
+class ExampleOutputSettings(BaseSettings):
+    """
+    Define the settings of the stored example outputs.
+
+    Attributes:
+        example_outputs_enabled: Whether requests matching an example are served their stored output.
+        example_output_charge_ratio: The share of the tokens used to generate an output that users are charged,
+            1 charges like a request to the LLM and 0 serves the examples for free.
+    """
+
+    example_outputs_enabled: bool = True
+    example_output_charge_ratio: confloat(ge=0) = 1.0
+
+    class Config:
+        case_sensitive = False
+
+
+class ExampleOutput(NamedTuple):
+    """The stored output of an example."""
+    endpoint_name: str
+    example_name: str
+    response: Dict[str, Any]
+    token_count: int
+
+
+class ExampleOutputStore:
+    """Stored example outputs by the canonical hash of their request."""
+
+    def __init__(self, outputs: Optional[Dict[str, ExampleOutput]] = None, charge_ratio: float = 1.0):
+        self.outputs = outputs if outputs is not None else {}
+        self.charge_ratio = charge_ratio
+
+    @classmethod
+    def load(cls, path: Path, charge_ratio: float = 1.0) -> "ExampleOutputStore":
+        """Load the outputs written by generate_example_outputs.py, none if the file was not generated."""
+        if not path.exists():
+            logger.info("No example outputs at %s, examples are sent to the LLM.", path)
+            return cls(charge_ratio=charge_ratio)
+        saved = json.loads(path.read_text(encoding="utf-8"))
+        return cls({request_hash: ExampleOutput(**output) for request_hash, output in saved.items()}, charge_ratio)
+
+    @classmethod
+    def from_settings(cls, settings: ExampleOutputSettings, path: Path = EXAMPLE_OUTPUTS_PATH) -> "ExampleOutputStore":
+        if not settings.example_outputs_enabled:
+            return cls(charge_ratio=settings.example_output_charge_ratio)
+        return cls.load(path, settings.example_output_charge_ratio)
+
+    def save(self, path: Path) -> None:
+        path.write_text(
+            json.dumps({request_hash: output._asdict() for request_hash, output in self.outputs.items()}, indent=2, sort_keys=True) + "\n",
+            encoding="utf-8",
+        )
+
+    def get(self, request_hash: str) -> Optional[ExampleOutput]:
+        return self.outputs.get(request_hash)
+
+    def get_charge(self, output: ExampleOutput) -> int:
+        """Get the number of tokens a user is charged for a stored output."""
+        return math.ceil(output.token_count * self.charge_ratio)
+
+
+example_output_settings = ExampleOutputSettings()
+example_output_store = ExampleOutputStore.from_settings(example_output_settings)
+
+
+def get_example_output_response(
+    endpoint_name: str,
+    request_model: BaseModel,
+    uuid: str,
+    response_model: Type[BaseModel],
+) -> Optional[Union[BaseModel, JSONResponse]]:
+    """
+    Get the stored output of the example a request matches, charging the user for it.
+
+    Args:
+        endpoint_name: The name of the endpoint the request was made to.
+        request_model: The body of the request.
+        uuid: The UUID of the user.
+        response_model: The response model of the endpoint.
+
+    Returns:
+        response: The stored output, a tokens exhausted response if the user cannot be
+            charged for it, None if the request does not match an example.
+    """
+    example_output = example_output_store.get(get_canonical_request_hash(endpoint_name, request_model))
+    if example_output is None:
+        return None
+    try:
+        charge_user_for_example_output(uuid, example_output_store.get_charge(example_output))
+    except TokensExhaustedException as e:
+        if e.login:
+            return TOKENS_EXHAUSTED_LOGIN_JSON_RESPONSE
+        return TOKENS_EXHAUSTED_FOR_DAY_JSON_RESPONSE
+    logger.info(f"Returning the stored output of the {example_output.example_name} example.")
+    return response_model.parse_obj(example_output.response)
@@ -0,0 +1,141 @@
+"""
+Extractive pre-compression of long texts.
+
+This module ranks the sentences of a text with TF-IDF scoring and keeps the highest
+value sentences (in their original order) until a token budget is filled. It runs
+locally and only depends on the standard library so it can be used before a prompt
+is built without paying for an extra LLM call.
+"""
+import math
+import re
+from collections import Counter
+from typing import Callable, NamedTuple
+
+
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in into is it its "
+    "of on or our she so that the their them they this to was we were what when which "
+    "who will with you your".split()
+)
+
+
+class CompressionResult(NamedTuple):
+    """
+    Result of compressing a text.
+
+    Attributes:
+        text: The compressed text.
+        original_token_count: The token count of the text before compression.
+        compressed_token_count: The token count of the text after compression.
+    """
+
+    text: str
+    original_token_count: int
+    compressed_token_count: int
+
+    @property
+    def tokens_saved(self) -> int:
+        """Return the number of tokens removed from the text."""
+        return self.original_token_count - self.compressed_token_count
+
+
+def split_into_sentences(text: str) -> list[str]:
+    """Split a text into sentences, dropping empty fragments."""
+    return [sentence.strip() for sentence in SENTENCE_SPLIT_PATTERN.split(text) if sentence and sentence.strip()]
+
+
+def tokenize_words(sentence: str) -> list[str]:
+    """Return the lower cased words of a sentence with stop words removed."""
+    return [word for word in WORD_PATTERN.findall(sentence.lower()) if word not in STOP_WORDS]
+
+
+def score_sentences(sentences: list[str]) -> list[float]:
+    """
+    Score each sentence by the average TF-IDF weight of its words.
+
+    Each sentence is treated as a document, so words that are frequent in a sentence
+    but rare across the text score highest. The first sentence gets a small boost as
+    it usually introduces the topic of the text.
+
+    Args:
+        sentences: The sentences to score.
+
+    Returns:
+        scores: The score of each sentence (parallel to the sentences).
+    """
+    sentence_words = [tokenize_words(sentence) for sentence in sentences]
+    document_frequency = Counter()
+    for words in sentence_words:
+        document_frequency.update(set(words))
+    sentence_count = len(sentences)
+    scores = []
+    for words in sentence_words:
+        if not words:
+            scores.append(0.0)
+            continue
+        term_frequency = Counter(words)
+        score = sum(
+            (count / len(words)) * (math.log((1 + sentence_count) / (1 + document_frequency[word])) + 1)
+            for word, count in term_frequency.items()
+        )
+        scores.append(score)
+    if scores:
+        scores[0] *= 1.25
+    return scores
+
+
+def truncate_to_token_budget(text: str, token_budget: int, count_tokens: Callable[[str], int]) -> str:
+    """Keep the longest run of leading words of a text that fits in a token budget."""
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+
+def compress_text_to_token_budget(
+    text: str,
+    token_budget: int,
+    count_tokens: Callable[[str], int],
+) -> CompressionResult:
+    """
+    Keep the highest scoring sentences of a text within a token budget.
+
+    If the text already fits in the budget it is returned unchanged. Otherwise the
+    sentences are added greedily by score while they fit and are then joined back
+    together in the order they appeared in the original text. When no sentence fits,
+    e.g. in an unpunctuated transcript, the highest scoring one is truncated to the budget.
+
+    Args:
+        text: The text to compress.
+        token_budget: The maximum number of tokens the compressed text should contain.
+        count_tokens: Function used to count the tokens of a string.
+
+    Returns:
+        result: The compressed text along with the token counts before and after.
+    """
+    original_token_count = count_tokens(text)
+    if original_token_count <= token_budget:
+        return CompressionResult(text, original_token_count, original_token_count)
+    sentences = split_into_sentences(text)
+    scores = score_sentences(sentences)
+    ranked_indexes = sorted(range(len(sentences)), key=lambda index: (-scores[index], index))
+    selected_indexes = []
+    used_tokens = 0
+    for index in ranked_indexes:
+        sentence_token_count = count_tokens(sentences[index]) + 1
+        if used_tokens + sentence_token_count > token_budget:
+            continue
+        selected_indexes.append(index)
+        used_tokens += sentence_token_count
+    if selected_indexes:
+        compressed_text = " ".join(sentences[index] for index in sorted(selected_indexes))
+    else:
+        compressed_text = truncate_to_token_budget(sentences[ranked_indexes[0]], token_budget, count_tokens)
+    return CompressionResult(compressed_text, original_token_count, count_tokens(compressed_text))
@@ -0,0 +1,106 @@
+"""
+Daily rating aggregates of the feedback of each AI tool.
+
+Every flush of the feedback buffer adds its ratings to one counter item per AI tool and
+day with atomic ADD actions, so the rating statistics of a period are read from a few
+items instead of scanning the feedback table.
+
+Usage:
+    python feedback_aggregates.py --tool text-revisor [--tool sandbox-chatgpt] [--days 7]
+"""
+import argparse
+import datetime as dt
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from dynamodb_models import FeedbackAggregateTableModel, FeedbackTableModel
+
+RATING_VALUES = (1, 2, 3, 4, 5)
+DEFAULT_PERIOD_DAYS = 7
+
+
+class FeedbackRatingSummary(NamedTuple):
+    """The rating statistics of an AI tool over a period."""
+    ai_tool_name: str
+    start_day: str
+    end_day: str
+    rating_count: int
+    rating_sum: int
+    rating_value_counts: Dict[int, int]
+
+    @property
+    def average_rating(self) -> Optional[float]:
+        if self.rating_count == 0:
+            return None
+        return self.rating_sum / self.rating_count
+
+
+def get_feedback_day(timestamp: float) -> str:
+    """Get the UTC day of a feedback timestamp as YYYY-MM-DD."""
+    return dt.datetime.fromtimestamp(timestamp, dt.timezone.utc).date().isoformat()
+
+
+def count_feedback_ratings(records: Iterable[FeedbackTableModel]) -> Dict[Tuple[str, str], Counter]:
+    """Count the ratings of feedback records by AI tool and day."""
+    rating_counts: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+    for record in records:
+        rating_counts[(record.ai_tool_name, get_feedback_day(record.timestamp))][int(record.rating)] += 1
+    return rating_counts
+
+
+def update_feedback_aggregates(records: Iterable[FeedbackTableModel]) -> None:
+    """Add the ratings of feedback records to the aggregates, with one update per AI tool and day."""
+    for (ai_tool_name, day), rating_counts in count_feedback_ratings(records).items():
+        actions = [
+            FeedbackAggregateTableModel.rating_count.add(sum(rating_counts.values())),
+            FeedbackAggregateTableModel.rating_sum.add(sum(rating * count for rating, count in rating_counts.items())),
+        ]
+        for rating, count in rating_counts.items():
+            actions.append(getattr(FeedbackAggregateTableModel, f"rating_{rating}_count").add(count))
+        FeedbackAggregateTableModel(ai_tool_name, day).update(actions=actions)
+
+
+def get_feedback_rating_summary(ai_tool_name: str, start_day: dt.date, end_day: dt.date) -> FeedbackRatingSummary:
+    """
+    Get the rating statistics of an AI tool between two days, included.
+
+    Args:
+        ai_tool_name: The endpoint name of the AI tool.
+        start_day: The first day of the period (UTC).
+        end_day: The last day of the period (UTC).
+
+    Returns:
+        summary: The rating statistics of the period, read from one item per day with feedback.
+    """
+    aggregates: List[FeedbackAggregateTableModel] = list(FeedbackAggregateTableModel.query(
+        ai_tool_name,
+        FeedbackAggregateTableModel.day.between(start_day.isoformat(), end_day.isoformat()),
+    ))
+    return FeedbackRatingSummary(
+        ai_tool_name=ai_tool_name,
+        start_day=start_day.isoformat(),
+        end_day=end_day.isoformat(),
+        rating_count=sum(aggregate.rating_count or 0 for aggregate in aggregates),
+        rating_sum=sum(aggregate.rating_sum or 0 for aggregate in aggregates),
+        rating_value_counts={
+            rating: sum(getattr(aggregate, f"rating_{rating}_count") or 0 for aggregate in aggregates)
+            for rating in RATING_VALUES
+        },
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tool", action="append", required=True, help="Endpoint name of an AI tool, e.g. text-revisor.")
+    parser.add_argument("--days", type=int, default=DEFAULT_PERIOD_DAYS, help="Number of days up to today (UTC).")
+    args = parser.parse_args()
+    end_day = dt.datetime.now(dt.timezone.utc).date()
+    start_day = end_day - dt.timedelta(days=args.days - 1)
+    for ai_tool_name in args.tool:
+        summary = get_feedback_rating_summary(ai_tool_name, start_day, end_day)
+        average_rating = "n/a" if summary.average_rating is None else f"{summary.average_rating:.2f}"
+        rating_value_counts = " ".join(f"{rating}*:{count}" for rating, count in summary.rating_value_counts.items())
+        print(f"{ai_tool_name} {summary.start_day}..{summary.end_day} ratings: {summary.rating_count} average: {average_rating} {rating_value_counts}")
+
+
+if __name__ == "__main__":
+    main()
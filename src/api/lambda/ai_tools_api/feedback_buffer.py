@@ -0,0 +1,121 @@
+"""
+Buffer feedback records and write them in batches, off the response path.
+
+The feedback endpoint only validates a record and adds it to the buffer. The buffer is
+flushed with BatchWriteItem after the lambda invocation has produced its response, or on
+a timer and at shutdown when the app is served by uvicorn. The same flush adds the
+ratings to the daily aggregates of each AI tool. Unprocessed items are retried by the
+batch write, and records whose batch failed are put back in the buffer for the next
+flush. The buffer is bounded: once full, the record that fills it flushes the buffer in
+the request, and records are only dropped when the table keeps rejecting writes.
+"""
+import asyncio
+import logging
+import threading
+from typing import Callable, List, Optional
+from pydantic import BaseSettings, conint, confloat
+from pynamodb.exceptions import PutError, UpdateError
+from starlette.concurrency import run_in_threadpool
+from dynamodb_models import FeedbackTableModel
+from feedback_aggregates import update_feedback_aggregates
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class FeedbackBufferSettings(BaseSettings):
+    """Define the settings of the feedback buffer."""
+
+    feedback_buffer_max_size: conint(ge=1) = 100
+    feedback_flush_interval_seconds: confloat(gt=0) = 5.0
+
+    class Config:
+        case_sensitive = False
+
+
+class FeedbackBuffer:
+    """Bounded buffer of feedback records written in batches."""
+
+    def __init__(
+        self,
+        max_size: int,
+        write_batch: Optional[Callable[[List[FeedbackTableModel]], None]] = None,
+    ):
+        """
+        Args:
+            max_size: The maximum number of records held before they are written.
+            write_batch: Writes a batch of records, raises if it could not write all of them.
+        """
+        self.max_size = max_size
+        self.write_batch = write_batch or write_feedback_batch
+        self._records: List[FeedbackTableModel] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: FeedbackBufferSettings) -> "FeedbackBuffer":
+        return cls(settings.feedback_buffer_max_size)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, record: FeedbackTableModel) -> None:
+        """Add a record to the buffer, writing the buffer if it is full."""
+        with self._lock:
+            self._records.append(record)
+            is_full = len(self._records) >= self.max_size
+        if is_full:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write the buffered records.
+
+        Returns:
+            written_count: The number of records written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                records, self._records = self._records, []
+            if not records:
+                return 0
+            try:
+                self.write_batch(records)
+            except PutError as e:
+                self._requeue(records)
+                logger.error("failed to write %s feedback records: %s", len(records), e)
+                return 0
+            logger.info("wrote %s feedback records", len(records))
+            return len(records)
+
+    def _requeue(self, records: List[FeedbackTableModel]) -> None:
+        """Put records that failed to be written back in front of the buffer, within its bound."""
+        with self._lock:
+            self._records = records + self._records
+            dropped_count = len(self._records) - self.max_size
+            if dropped_count > 0:
+                # the oldest records are dropped first
+                self._records = self._records[dropped_count:]
+                logger.error("dropped %s feedback records, the buffer is full", dropped_count)
+
+    async def flush_periodically(self, interval_seconds: float) -> None:
+        """Flush the buffer on a timer, until the task is cancelled."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await run_in_threadpool(self.flush)
+
+
+def write_feedback_batch(records: List[FeedbackTableModel]) -> None:
+    """Write feedback records with BatchWriteItem, which retries the unprocessed items, then add them to the aggregates."""
+    with FeedbackTableModel.batch_write() as batch:
+        for record in records:
+            batch.save(record)
+    try:
+        update_feedback_aggregates(records)
+    except UpdateError as e:
+        # the records are written, retrying them would count their ratings twice
+        logger.error("failed to update the feedback aggregates of %s records: %s", len(records), e)
+
+
+feedback_buffer_settings = FeedbackBufferSettings()
+feedback_buffer = FeedbackBuffer.from_settings(feedback_buffer_settings)
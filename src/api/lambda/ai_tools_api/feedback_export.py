@@ -0,0 +1,233 @@
+"""
+Export the feedback table to gzipped NDJSON files for offline analysis.
+
+The table is read with a parallel scan, one worker per segment, each writing its own
+file. The read rate is shared by the workers and adapted to the capacity the scan pages
+consume: it grows additively while pages succeed and is halved when DynamoDB throttles,
+so the export does not burst the capacity the API needs.
+
+Every page is appended to its segment file as its own gzip member, then the segment's
+position in the scan and the size of its file are saved in the checkpoint. An export
+that is interrupted is resumed by running it again with the same output directory: the
+files are truncated back to the checkpoint so no record is written twice.
+
+Usage:
+    python feedback_export.py --output-dir feedback-export [--segments 8] [--max-read-units 50]
+    python feedback_export.py --output-dir feedback-export --host http://localhost:8000  # DynamoDB Local
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import boto3
+from botocore.exceptions import ClientError
+from dynamodb_models import FeedbackTableModel
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CHECKPOINT_FILE_NAME = "checkpoint.json"
+DEFAULT_SEGMENT_COUNT = 4
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_MAX_READ_UNITS_PER_SECOND = 50.0
+MIN_READ_UNITS_PER_SECOND = 1.0
+THROTTLING_ERROR_CODES = {"ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded"}
+
+
+class AdaptiveReadRate:
+    """
+    Read capacity budget shared by the scan workers, adapted with additive increase and multiplicative decrease.
+    """
+
+    def __init__(self, max_units_per_second: float, increase_units_per_second: float = 1.0, decrease_factor: float = 0.5):
+        self.max_units_per_second = max_units_per_second
+        self.increase_units_per_second = increase_units_per_second
+        self.decrease_factor = decrease_factor
+        # start low and let successful pages ramp the rate up
+        self.units_per_second = max(MIN_READ_UNITS_PER_SECOND, max_units_per_second / 4)
+        self._bucket = TokenBucket(self.units_per_second, self.units_per_second)
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Wait until the capacity consumed by the previous pages is refilled."""
+        while True:
+            wait_seconds = self._bucket.try_acquire(0)
+            if not wait_seconds:
+                return
+            time.sleep(wait_seconds)
+
+    def consume(self, units: float) -> None:
+        """Take the capacity a page consumed, which may be more than the budget has left."""
+        self._bucket.debit(units)
+
+    def on_success(self) -> None:
+        self._set_rate(min(self.max_units_per_second, self.units_per_second + self.increase_units_per_second))
+
+    def on_throttled(self) -> None:
+        self._set_rate(max(MIN_READ_UNITS_PER_SECOND, self.units_per_second * self.decrease_factor))
+
+    def _set_rate(self, units_per_second: float) -> None:
+        with self._lock:
+            self.units_per_second = units_per_second
+            self._bucket.capacity = units_per_second
+            self._bucket.refill_per_second = units_per_second
+
+
+class ExportCheckpoint:
+    """Progress of every scan segment, saved atomically after each page."""
+
+    def __init__(self, path: Path, total_segments: int):
+        self.path = path
+        self.total_segments = total_segments
+        self.segments: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if path.exists():
+            saved = json.loads(path.read_text())
+            if saved["total_segments"] != total_segments:
+                raise ValueError(
+                    f"{path} was written by an export with {saved['total_segments']} segments, "
+                    f"resume it with --segments {saved['total_segments']} or use another output directory."
+                )
+            self.segments = saved["segments"]
+
+    def get_segment(self, segment: int) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.segments.get(str(segment), {"last_evaluated_key": None, "offset": 0, "item_count": 0, "done": False}))
+
+    def save_segment(self, segment: int, progress: Dict[str, Any]) -> None:
+        with self._lock:
+            self.segments[str(segment)] = progress
+            temporary_path = self.path.with_suffix(".tmp")
+            temporary_path.write_text(json.dumps({"total_segments": self.total_segments, "segments": self.segments}))
+            os.replace(temporary_path, self.path)
+
+
+def get_record(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Get a feedback item as a JSON serializable record, with the JSON attributes decoded."""
+    model = FeedbackTableModel.from_raw_data(item)
+    return {name: getattr(model, name) for name in FeedbackTableModel.get_attributes()}
+
+
+def export_segment(
+    client: Any,
+    segment: int,
+    total_segments: int,
+    output_dir: Path,
+    checkpoint: ExportCheckpoint,
+    read_rate: AdaptiveReadRate,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> int:
+    """
+    Export a scan segment to its NDJSON file, resuming from the checkpoint.
+
+    Returns:
+        item_count: The number of records of the segment in its file.
+    """
+    progress = checkpoint.get_segment(segment)
+    path = output_dir / f"feedback-{segment:04d}.ndjson.gz"
+    if progress["done"]:
+        return progress["item_count"]
+    # drop what was written after the last checkpoint, it is read again
+    with open(path, "ab") as file:
+        file.truncate(progress["offset"])
+    while True:
+        read_rate.acquire()
+        scan_kwargs = dict(
+            TableName=FeedbackTableModel.Meta.table_name,
+            Segment=segment,
+            TotalSegments=total_segments,
+            Limit=page_size,
+            ReturnConsumedCapacity="TOTAL",
+        )
+        if progress["last_evaluated_key"]:
+            scan_kwargs["ExclusiveStartKey"] = progress["last_evaluated_key"]
+        try:
+            page = client.scan(**scan_kwargs)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in THROTTLING_ERROR_CODES:
+                raise
+            read_rate.on_throttled()
+            logger.info("segment %s throttled, read rate lowered to %.1f units/s", segment, read_rate.units_per_second)
+            continue
+        read_rate.on_success()
+        # pages are only sized by the item count, the budget is kept by paying off what they consumed
+        read_rate.consume(page.get("ConsumedCapacity", {}).get("CapacityUnits", 1.0))
+        items: List[Dict[str, Any]] = page.get("Items", [])
+        if items:
+            with gzip.open(path, "at", encoding="utf-8") as file:
+                for item in items:
+                    file.write(json.dumps(get_record(item), default=str) + "\n")
+        progress = dict(
+            last_evaluated_key=page.get("LastEvaluatedKey"),
+            offset=path.stat().st_size if path.exists() else 0,
+            item_count=progress["item_count"] + len(items),
+            done="LastEvaluatedKey" not in page,
+        )
+        checkpoint.save_segment(segment, progress)
+        if progress["done"]:
+            logger.info("segment %s exported %s records", segment, progress["item_count"])
+            return progress["item_count"]
+
+
+def export_feedback(
+    output_dir: Path,
+    total_segments: int = DEFAULT_SEGMENT_COUNT,
+    max_read_units_per_second: float = DEFAULT_MAX_READ_UNITS_PER_SECOND,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    host: Optional[str] = None,
+    region: Optional[str] = None,
+) -> int:
+    """
+    Export the feedback table with a parallel scan.
+
+    Args:
+        output_dir: The directory of the NDJSON files and the checkpoint, reused to resume an export.
+        total_segments: The number of scan segments, each exported by its own worker.
+        max_read_units_per_second: The read capacity the export may use at most.
+        page_size: The maximum number of items read per scan page.
+        host: The endpoint of DynamoDB, e.g. of DynamoDB Local.
+        region: The region of the table.
+
+    Returns:
+        item_count: The number of records exported.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = ExportCheckpoint(output_dir / CHECKPOINT_FILE_NAME, total_segments)
+    read_rate = AdaptiveReadRate(max_read_units_per_second)
+    client = boto3.client(
+        "dynamodb",
+        region_name=region or FeedbackTableModel.Meta.region,
+        endpoint_url=host or FeedbackTableModel.Meta.host,
+    )
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        item_counts = executor.map(
+            lambda segment: export_segment(client, segment, total_segments, output_dir, checkpoint, read_rate, page_size),
+            range(total_segments),
+        )
+        item_count = sum(item_counts)
+    logger.info("exported %s feedback records to %s", item_count, output_dir)
+    return item_count
+
+
+def main():
+    logging.basicConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-dir", type=Path, required=True, help="Directory of the export, reuse it to resume.")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENT_COUNT, help="Number of parallel scan segments.")
+    parser.add_argument("--max-read-units", type=float, default=DEFAULT_MAX_READ_UNITS_PER_SECOND, help="Maximum read capacity units per second.")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Maximum items per scan page.")
+    parser.add_argument("--host", help="DynamoDB endpoint, e.g. http://localhost:8000 for DynamoDB Local.")
+    parser.add_argument("--region", help="Region of the table.")
+    args = parser.parse_args()
+    export_feedback(args.output_dir, args.segments, args.max_read_units, args.page_size, args.host, args.region)
+
+
+if __name__ == "__main__":
+    main()
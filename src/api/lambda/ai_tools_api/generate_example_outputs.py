@@ -0,0 +1,85 @@
+"""
+Generate the stored outputs of the examples of the AI tools.
+
+Every example returned by the examples endpoints is posted to its tool through the app,
+with the LLM backend and DynamoDB tables of the environment, as a new anonymous user.
+The response and the tokens the user was charged for it are written to
+example_outputs.json, which is packaged with the lambda code and served by the tools
+for requests matching an example. Regenerate it whenever an example or a prompt changes.
+
+The anonymous daily token limit must cover the largest example, e.g. run it with
+NON_AUTHENTICATE_USER_DAILY_USAGE_TOKEN_LIMIT=100000 DEPLOYMENT_STAGE=local.
+
+Usage:
+    python generate_example_outputs.py [--output example_outputs.json]
+"""
+import argparse
+import logging
+import uuid
+from pathlib import Path
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from ai_tools_lambda import api_gateway_settings, create_fastapi_app
+from dynamodb_models import UserDataTableModel
+from example_outputs import EXAMPLE_OUTPUTS_PATH, ExampleOutput, example_output_store
+from routers import catchy_title_creator, cover_letter_writer, text_revisor, text_summarizer
+from utils import UUID_HEADER_NAME, get_canonical_request_hash
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# the sandbox examples are first messages of new conversations, which are never identical requests
+EXAMPLE_ROUTERS = [text_revisor, catchy_title_creator, cover_letter_writer, text_summarizer]
+
+
+def generate_example_outputs(output_path: Path) -> int:
+    """
+    Generate the outputs of the examples of every tool and save them.
+
+    Returns:
+        example_count: The number of example outputs saved.
+    """
+    # the examples must be sent to the LLM, not answered with the outputs being replaced
+    example_output_store.outputs.clear()
+    client = TestClient(create_fastapi_app(), raise_server_exceptions=False)
+    outputs = {}
+    for router_module in EXAMPLE_ROUTERS:
+        endpoint_name = router_module.ENDPOINT_NAME
+        examples_response = router_module.EXAMPLES_RESPONSE
+        for example_name, example in zip(examples_response.example_names, examples_response.examples):
+            user_uuid = str(uuid.uuid4())
+            response = client.post(
+                f"/{api_gateway_settings.openai_route_prefix}/{endpoint_name}",
+                json=jsonable_encoder(example),
+                headers={UUID_HEADER_NAME: user_uuid},
+            )
+            user_data = UserDataTableModel.get(user_uuid)
+            token_count = user_data.cumulative_token_count or 0
+            user_data.delete()
+            if response.status_code != 200:
+                # the example keeps being sent to the LLM
+                logger.error("%s: the %s example failed with %s: %s", endpoint_name, example_name, response.status_code, response.text)
+                continue
+            outputs[get_canonical_request_hash(endpoint_name, example)] = ExampleOutput(
+                endpoint_name=endpoint_name,
+                example_name=example_name,
+                response=response.json(),
+                token_count=token_count,
+            )
+            logger.info("%s: generated the %s example with %s tokens", endpoint_name, example_name, token_count)
+    example_output_store.outputs.update(outputs)
+    example_output_store.save(output_path)
+    return len(outputs)
+
+
+def main():
+    logging.basicConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", type=Path, default=EXAMPLE_OUTPUTS_PATH, help="Path of the stored example outputs.")
+    args = parser.parse_args()
+    example_count = generate_example_outputs(args.output)
+    logger.info("saved %s example outputs to %s", example_count, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Generate the OpenAPI schema of the app, served by openapi_schema.py.
+
+The schema is written to openapi.json, which is packaged with the lambda code. The
+route prefix is removed from its paths and added back when it is loaded, so the file
+serves every deployment. test_openapi_schema.py fails when the file is not regenerated
+after a change of the API.
+
+Usage:
+    python generate_openapi_schema.py [--output openapi.json]
+"""
+import argparse
+import logging
+from pathlib import Path
+from ai_tools_lambda import api_gateway_settings, create_fastapi_app
+from openapi_schema import OPENAPI_SCHEMA_PATH, get_openapi_schema_json
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def main():
+    logging.basicConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", type=Path, default=OPENAPI_SCHEMA_PATH, help="Path of the generated schema.")
+    args = parser.parse_args()
+    # the schema is generated from the routes, not read back from the file being replaced
+    app = create_fastapi_app()
+    app.openapi_schema = None
+    args.output.write_text(get_openapi_schema_json(app, api_gateway_settings.openai_route_prefix), encoding="utf-8")
+    logger.info("saved the OpenAPI schema to %s", args.output)
+
+
+if __name__ == "__main__":
+    main()
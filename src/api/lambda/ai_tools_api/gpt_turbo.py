@@ -1,10 +1,16 @@
 from __future__ import annotations
-from typing import Optional
+import itertools
+import math
+from typing import Callable, NamedTuple, Optional
 from pydantic import BaseModel
 from enum import Enum
-import openai
+from openai.error import RateLimitError
 import tiktoken
 from loguru import logger
+from rate_limiter import AdaptiveRateLimiter, OpenAIRateLimitSettings
+from openai_call_policy import OpenAICallPolicy, OpenAICallPolicySettings
+from openai_session import get_connection_reuse_stats
+from llm_backends import ChatCompletionRequest, LLMBackendSettings, create_llm_backend
 from utils import (
     does_user_have_enough_tokens_to_make_request,
     docstring_parameter,
@@ -16,9 +22,18 @@ from utils import (
 
 
 MODEL_CONTEXT_WINDOW = 3800
+MIN_TOKENS_FROM_GPT_RESPONSE = 64
+# the expected response sizes are averages, the margin keeps longer responses from being cut off
+EXPECTED_RESPONSE_TOKEN_MARGIN = 1.5
 GPT_MODEL = "gpt-3.5-turbo"
 MODEL_ENCODING = tiktoken.encoding_for_model(GPT_MODEL)
 
+openai_rate_limiter = AdaptiveRateLimiter.from_settings(OpenAIRateLimitSettings())
+openai_call_policy = OpenAICallPolicy(OpenAICallPolicySettings())
+# streams only wait for the first chunk, their latencies must not skew the hedging percentile of full completions
+openai_stream_call_policy = OpenAICallPolicy(OpenAICallPolicySettings())
+llm_backend = create_llm_backend(LLMBackendSettings())
+
 
 class Role(Enum):
     USER = "user"
@@ -68,7 +83,7 @@ class GPTTurboChatSession(BaseModel):
         new_messages = self.messages + (message,)
         return GPTTurboChatSession(messages=new_messages)
 
-def can_user_make_request(user_uuid: str, expected_token_count: int) -> None:
+def can_user_make_request(user_uuid: str, expected_token_count: int) -> int:
     """
     Check if a user has enough tokens to make a request.
 
@@ -77,8 +92,10 @@ def can_user_make_request(user_uuid: str, expected_token_count: int) -> None:
         expected_token_count: The expected token count of the request.
 
     Returns:
-        can_user_make_request: Whether the user can make the request.
         tokens_allowed: The number of tokens the user is allowed to use.
+
+    Raises:
+        TokensExhaustedException: If the user does not have enough tokens to make the request.
     """
     can_make_request, tokens_allowed = does_user_have_enough_tokens_to_make_request(
         user_uuid=user_uuid,
@@ -91,6 +108,77 @@ def can_user_make_request(user_uuid: str, expected_token_count: int) -> None:
             message=f"User does not have enough tokens to make request. Token quota: {tokens_allowed}, Tokens required for request: {expected_token_count}",
             login=can_user_login,
         )
+    return tokens_allowed
+
+
+def charge_user_for_shared_chat_session(user_uuid: str, chat_session: GPTTurboChatSession) -> None:
+    """
+    Charge a user for a chat session that was generated for another user.
+
+    Used when a request is coalesced with an identical in-flight request from another user,
+    so every user is charged for the tokens of the response they receive.
+
+    Args:
+        user_uuid: The UUID of the user to charge.
+        chat_session: The chat session returned by get_gpt_turbo_response.
+
+    Raises:
+        TokensExhaustedException: If the user does not have enough tokens left.
+    """
+    token_count = sum(chat.token_count for chat in chat_session.messages)
+    can_user_make_request(user_uuid, token_count)
+    update_user_token_count(user_uuid, token_count)
+
+
+def charge_user_for_example_output(user_uuid: str, token_count: int) -> None:
+    """
+    Charge a user for a stored example output served instead of a response from the LLM.
+
+    Args:
+        user_uuid: The UUID of the user to charge.
+        token_count: The number of tokens to charge, may be 0 when examples are free.
+
+    Raises:
+        TokensExhaustedException: If the user does not have enough tokens left.
+    """
+    if token_count == 0:
+        return
+    can_user_make_request(user_uuid, token_count)
+    update_user_token_count(user_uuid, token_count)
+
+
+def size_max_tokens(
+    max_tokens: int,
+    prompt_token_count: int,
+    context_window: int,
+    expected_response_token_count: Optional[int] = None,
+    tokens_left: Optional[int] = None,
+) -> int:
+    """
+    Size the max tokens requested for a response.
+
+    Reserving more tokens than the response is expected to use increases latency and counts
+    against the rate limits, so the max tokens is the smallest of the ceiling set by the
+    endpoint, the expected response size with a margin, the room left in the user's quota
+    and the room left in the context window. The minimum response size is applied before
+    the context window, which the request can never exceed.
+
+    Args:
+        max_tokens: The ceiling for the response set by the endpoint.
+        prompt_token_count: The token count of the prompt.
+        context_window: The context window of the model.
+        expected_response_token_count: The expected token count of the response (e.g. derived from the number of titles requested).
+        tokens_left: The tokens left in the user's quota for the response.
+
+    Returns:
+        max_tokens: The max tokens to request for the response.
+    """
+    if expected_response_token_count is not None:
+        max_tokens = min(max_tokens, math.ceil(expected_response_token_count * EXPECTED_RESPONSE_TOKEN_MARGIN))
+    if tokens_left is not None:
+        max_tokens = min(max_tokens, tokens_left)
+    max_tokens = max(max_tokens, MIN_TOKENS_FROM_GPT_RESPONSE)
+    return min(max_tokens, context_window - prompt_token_count)
 
 
 def count_tokens(string: str) -> int:
@@ -178,30 +266,44 @@ def truncate_chat_session(
     return chat_session
 
 
-def get_gpt_turbo_response(
+class PreparedGPTTurboRequest(NamedTuple):
+    """
+    Request to GPT Turbo ready to be sent.
+
+    Attributes:
+        completion_request: The completion request.
+        chat_session: The truncated chat session the request was built from.
+        estimated_token_count: The token count reserved in the rate limiter for the request.
+    """
+
+    completion_request: ChatCompletionRequest
+    chat_session: GPTTurboChatSession
+    estimated_token_count: int
+
+
+def prepare_gpt_turbo_request(
     system_prompt: str,
     chat_session: GPTTurboChatSession,
-    temperature: float = 0.9,
-    frequency_penalty: float = 0.0,
-    presence_penalty: float = 0.0,
-    stream: bool = False,
-    uuid: str = "",
-    max_tokens: int = 400,
-    override_model_context_window: Optional[int] = None,
-) -> GPTTurboChatSession:
+    temperature: float,
+    frequency_penalty: float,
+    presence_penalty: float,
+    uuid: str,
+    max_tokens: int,
+    override_model_context_window: Optional[int],
+    expected_response_token_count: Optional[int],
+) -> PreparedGPTTurboRequest:
     """
-    Get response from GPT Turbo.
+    Prepare a request to GPT Turbo.
 
-    Args:
-        system_prompt: The system prompt to send to the model.
-        messages: The messages to send to the model.
-        temperature: The temperature of the model. Higher values will result in more creative responses, lower values will result in more conservative responses.
-        frequency_penalty: The frequency penalty of the model. This is a value between 0 and 1 that penalizes new tokens based on whether they appear in the text so far. Higher values will result in more creative responses, lower values will result in more conservative responses.
-        presence_penalty: The presence penalty of the model. This is a value between 0 and 1 that penalizes new tokens based on whether they appear in the text so far. Higher values will result in more creative responses, lower values will result in more conservative responses.
-        stream: Whether to stream the response.
+    The chat session is truncated to the context window, the max tokens are sized, the
+    user's quota is checked, capacity is acquired from the rate limiter and the user is
+    charged for the prompt. See get_gpt_turbo_response for the arguments.
 
     Returns:
-        response: Response from GPT Turbo.
+        prepared_request: The request ready to be sent.
+
+    Raises:
+        TokensExhaustedException: If the user does not have enough tokens to make the request.
     """
 
     # This line counts the tokens for the last user message and adds it to the chat session 
@@ -210,6 +312,12 @@ def get_gpt_turbo_response(
 
     system_token_count = count_tokens(system_prompt)
     token_context_window = override_model_context_window or MODEL_CONTEXT_WINDOW
+    max_tokens = size_max_tokens(
+        max_tokens=max_tokens,
+        prompt_token_count=system_token_count,
+        context_window=token_context_window,
+        expected_response_token_count=expected_response_token_count,
+    )
     chat_session = truncate_chat_session(chat_session, system_token_count, max_tokens, token_context_window)
     logger.info(f"Chat session after truncation is complete: {chat_session}")
 
@@ -221,22 +329,34 @@ def get_gpt_turbo_response(
         user_tokens_for_request += chat.token_count
         prompt_messages.append(chat.dict(exclude={"token_count"}))
 
-    can_user_make_request(uuid, user_tokens_for_request)
+    # the quota must leave room for at least a minimal response so the prompt is not billed for nothing
+    tokens_left = can_user_make_request(uuid, user_tokens_for_request + MIN_TOKENS_FROM_GPT_RESPONSE)
+    max_tokens = size_max_tokens(
+        max_tokens=max_tokens,
+        prompt_token_count=system_token_count + user_tokens_for_request,
+        context_window=token_context_window,
+        tokens_left=tokens_left - user_tokens_for_request,
+    )
+    logger.info(f"Requesting up to {max_tokens} tokens for the response.")
+    estimated_token_count = system_token_count + user_tokens_for_request + max_tokens
+    openai_rate_limiter.acquire(estimated_token_count)
     update_user_token_count(uuid, user_tokens_for_request)
     logger.info(prompt_messages)
-    response = openai.ChatCompletion.create(
+
+    completion_request = ChatCompletionRequest(
         model=GPT_MODEL,
         messages=prompt_messages,
         temperature=temperature,
         frequency_penalty=frequency_penalty,
         presence_penalty=presence_penalty,
-        stream=stream,
         user=uuid,
         max_tokens=max_tokens,
     )
+    return PreparedGPTTurboRequest(completion_request, chat_session, estimated_token_count)
+
 
-    message = response.choices[0].message.content
-    completion_tokens = response.usage.completion_tokens
+def add_gpt_turbo_response(uuid: str, chat_session: GPTTurboChatSession, message: str, completion_tokens: int) -> GPTTurboChatSession:
+    """Add the response to the chat session and charge the user for it."""
     chat_session = chat_session.add_message(GPTTurboChat(
         role=Role.ASSISTANT,
         content=message,
@@ -244,3 +364,104 @@ def get_gpt_turbo_response(
     ))
     update_user_token_count(uuid, completion_tokens)
     return chat_session
+
+
+def get_gpt_turbo_response(
+    system_prompt: str,
+    chat_session: GPTTurboChatSession,
+    temperature: float = 0.9,
+    frequency_penalty: float = 0.0,
+    presence_penalty: float = 0.0,
+    uuid: str = "",
+    max_tokens: int = 400,
+    override_model_context_window: Optional[int] = None,
+    expected_response_token_count: Optional[int] = None,
+) -> GPTTurboChatSession:
+    """
+    Get response from GPT Turbo.
+
+    Args:
+        system_prompt: The system prompt to send to the model.
+        messages: The messages to send to the model.
+        temperature: The temperature of the model. Higher values will result in more creative responses, lower values will result in more conservative responses.
+        frequency_penalty: The frequency penalty of the model. This is a value between 0 and 1 that penalizes new tokens based on whether they appear in the text so far. Higher values will result in more creative responses, lower values will result in more conservative responses.
+        presence_penalty: The presence penalty of the model. This is a value between 0 and 1 that penalizes new tokens based on whether they appear in the text so far. Higher values will result in more creative responses, lower values will result in more conservative responses.
+        max_tokens: The maximum number of tokens allowed for the response.
+        override_model_context_window: The context window to use instead of the model context window.
+        expected_response_token_count: The expected token count of the response, used to size the max tokens requested.
+
+    Returns:
+        response: Response from GPT Turbo.
+    """
+    completion_request, chat_session, estimated_token_count = prepare_gpt_turbo_request(
+        system_prompt, chat_session, temperature, frequency_penalty, presence_penalty,
+        uuid, max_tokens, override_model_context_window, expected_response_token_count,
+    )
+
+    def create_completion(request_timeout: float):
+        return llm_backend.create_chat_completion(completion_request, request_timeout)
+
+    # hedged requests also count against the organization quota, so they are only sent when
+    # the rate limiter has capacity for them right away
+    can_hedge = lambda: openai_rate_limiter.try_acquire_now(estimated_token_count)
+    try:
+        completion = openai_call_policy.call(create_completion, can_hedge=can_hedge)
+    except RateLimitError:
+        openai_rate_limiter.report_rate_limited()
+        raise
+    openai_rate_limiter.report_success()
+    # the stats are only computed when debug logs are emitted
+    logger.opt(lazy=True).debug("OpenAI connection reuse: {}", get_connection_reuse_stats)
+    return add_gpt_turbo_response(uuid, chat_session, completion.content, completion.completion_tokens)
+
+
+def stream_gpt_turbo_response(
+    system_prompt: str,
+    chat_session: GPTTurboChatSession,
+    on_chunk: Callable[[str], None],
+    temperature: float = 0.9,
+    frequency_penalty: float = 0.0,
+    presence_penalty: float = 0.0,
+    uuid: str = "",
+    max_tokens: int = 400,
+    override_model_context_window: Optional[int] = None,
+    expected_response_token_count: Optional[int] = None,
+) -> GPTTurboChatSession:
+    """
+    Stream a response from GPT Turbo.
+
+    Failures before the first chunk is received are retried following the call policy,
+    failures after it are raised since part of the response was already delivered.
+    The user is charged for the tokens of the streamed response once it is complete.
+
+    Args:
+        on_chunk: Called with every chunk of the response as it is received.
+        See get_gpt_turbo_response for the other arguments.
+
+    Returns:
+        response: Response from GPT Turbo.
+    """
+    completion_request, chat_session, _ = prepare_gpt_turbo_request(
+        system_prompt, chat_session, temperature, frequency_penalty, presence_penalty,
+        uuid, max_tokens, override_model_context_window, expected_response_token_count,
+    )
+
+    def open_stream(request_timeout: float):
+        chunks = llm_backend.stream_chat_completion(completion_request, request_timeout)
+        # the request is sent when the first chunk is read, reading it here lets the policy retry it
+        return next(chunks, ""), chunks
+
+    content_chunks = []
+    try:
+        first_chunk, chunks = openai_stream_call_policy.call(open_stream)
+        for chunk in itertools.chain((first_chunk,), chunks):
+            if chunk:
+                on_chunk(chunk)
+                content_chunks.append(chunk)
+    except RateLimitError:
+        openai_rate_limiter.report_rate_limited()
+        raise
+    openai_rate_limiter.report_success()
+    message = "".join(content_chunks)
+    # streamed responses do not include usage, the tokens are counted locally
+    return add_gpt_turbo_response(uuid, chat_session, message, count_tokens(message))
@@ -0,0 +1,248 @@
+"""
+Pluggable backends for chat completions.
+
+The backend used by the API is selected with the LLM_BACKEND setting:
+
+- openai: Sends requests to the OpenAI chat completion API.
+- record: Sends requests to OpenAI and records every completion to a JSON lines file.
+- replay: Serves completions from a recording without using the network.
+- fake: Generates deterministic completions locally with configurable latency, streaming
+    cadence, usage numbers and injected errors. This allows load tests and benchmarks to run
+    offline without spending tokens.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Iterator, Optional, Protocol
+import openai
+from openai.error import APIError, RateLimitError, ServiceUnavailableError, Timeout
+from pydantic import BaseModel, BaseSettings, confloat, conint
+from custom_exceptions import RecordedCompletionNotFoundError
+
+
+class ChatCompletionRequest(BaseModel):
+    """Define the parameters of a chat completion request."""
+
+    model: str
+    messages: list[dict[str, str]]
+    temperature: float
+    frequency_penalty: float
+    presence_penalty: float
+    max_tokens: int
+    user: str = ""
+
+    def get_hash(self) -> str:
+        """Return a hash of the request that does not depend on the user making it."""
+        request_json = self.json(exclude={"user"}, sort_keys=True)
+        return hashlib.sha256(request_json.encode()).hexdigest()
+
+
+class ChatCompletion(BaseModel):
+    """Define the result of a chat completion request."""
+
+    content: str
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class LLMBackend(Protocol):
+    def create_chat_completion(self, request: ChatCompletionRequest, request_timeout: float) -> ChatCompletion:
+        """Return the completion for the request."""
+
+    def stream_chat_completion(self, request: ChatCompletionRequest, request_timeout: float) -> Iterator[str]:
+        """Yield the content of the completion for the request as it is generated."""
+
+
+class LLMBackendName(str, Enum):
+    OPENAI = "openai"
+    RECORD = "record"
+    REPLAY = "replay"
+    FAKE = "fake"
+
+
+class LatencyDistribution(str, Enum):
+    CONSTANT = "constant"
+    UNIFORM = "uniform"
+    LOGNORMAL = "lognormal"
+
+
+class InjectedErrorType(str, Enum):
+    RATE_LIMIT = "rate_limit"
+    TIMEOUT = "timeout"
+    SERVICE_UNAVAILABLE = "service_unavailable"
+    API_ERROR = "api_error"
+
+
+class LLMBackendSettings(BaseSettings):
+    """Define the settings used to select and configure the LLM backend."""
+
+    llm_backend: LLMBackendName = LLMBackendName.OPENAI
+    llm_recording_path: Path = Path("llm_recordings.jsonl")
+    fake_llm_seed: int = 0
+    fake_llm_latency_distribution: LatencyDistribution = LatencyDistribution.LOGNORMAL
+    fake_llm_latency_mean_seconds: confloat(ge=0) = 1.5
+    fake_llm_latency_stddev_seconds: confloat(ge=0) = 0.5
+    fake_llm_stream_chunk_tokens: conint(ge=1) = 4
+    fake_llm_stream_chunk_interval_seconds: confloat(ge=0) = 0.05
+    fake_llm_prompt_tokens: Optional[conint(ge=0)] = None
+    fake_llm_completion_tokens: Optional[conint(ge=1)] = None
+    fake_llm_error_rate: confloat(ge=0, le=1) = 0.0
+    fake_llm_error_type: InjectedErrorType = InjectedErrorType.SERVICE_UNAVAILABLE
+
+    class Config:
+        case_sensitive = False
+
+
+def split_into_chunks(content: str, words_per_chunk: int) -> Iterator[str]:
+    """Split content into chunks of words, keeping the whitespace so that the chunks join back to the content."""
+    words = content.split(" ")
+    for index in range(0, len(words), words_per_chunk):
+        chunk = " ".join(words[index:index + words_per_chunk])
+        yield chunk if index == 0 else " " + chunk
+
+
+class OpenAIBackend:
+    """Backend sending requests to the OpenAI chat completion API."""
+
+    def create_chat_completion(self, request: ChatCompletionRequest, request_timeout: float) -> ChatCompletion:
+        response = openai.ChatCompletion.create(**request.dict(), request_timeout=request_timeout)
+        return ChatCompletion(
+            content=response.choices[0].message.content,
+            prompt_tokens=response.usage.prompt_tokens,
+            completion_tokens=response.usage.completion_tokens,
+        )
+
+    def stream_chat_completion(self, request: ChatCompletionRequest, request_timeout: float) -> Iterator[str]:
+        response = openai.ChatCompletion.create(**request.dict(), stream=True, request_timeout=request_timeout)
+        for chunk in response:
+            content = chunk.choices[0].delta.get("content")
+            if content:
+                yield content
+
+
+class RecordReplayBackend:
+    """
+    Backend recording completions to, or replaying completions from, a JSON lines file.
+
+    Completions are keyed by the hash of the request so a replay returns the completion
+    recorded for an identical request.
+    """
+
+    def __init__(self, recording_path: Path, backend: Optional[LLMBackend] = None):
+        self.recording_path = recording_path
+        self.backend = backend
+        self._recordings: dict[str, ChatCompletion] = {}
+        self._lock = threading.Lock()
+        if recording_path.exists():
+            with recording_path.open() as recording_file:
+                for line in recording_file:
+                    recording = json.loads(line)
+                    self._recordings[recording["request_hash"]] = ChatCompletion(**recording["completion"])
+
+    @property
+    def is_recording(self) -> bool:
+        return self.backend is not None
+
+    def create_chat_completion(self, request: ChatCompletionRequest, request_timeout: float) -> ChatCompletion:
+        request_hash = request.get_hash()
+        if not self.is_recording:
+            if request_hash not in self._recordings:
+                raise RecordedCompletionNotFoundError(f"No recorded completion for request {request_hash} in {self.recording_path}.")
+            return self._recordings[request_hash]
+        completion = self.backend.create_chat_completion(request, request_timeout)
+        with self._lock:
+            self._recordings[request_hash] = completion
+            with self.recording_path.open("a") as recording_file:
+                recording_file.write(json.dumps({"request_hash": request_hash, "completion": completion.dict()}) + "\n")
+        return completion
+
+    def stream_chat_completion(self, request: ChatCompletionRequest, request_timeout: float) -> Iterator[str]:
+        completion = self.create_chat_completion(request, request_timeout)
+        yield from split_into_chunks(completion.content, words_per_chunk=4)
+
+
+class FakeBackend:
+    """Backend generating deterministic completions locally."""
+
+    WORDS = (
+        "the quick brown fox jumps over a lazy dog while the curious cat watches from "
+        "a sunny window and dreams about fish rivers mountains and tiny paper boats"
+    ).split()
+
+    def __init__(self, settings: LLMBackendSettings):
+        self.settings = settings
+        self._random = random.Random(settings.fake_llm_seed)
+        self._lock = threading.Lock()
+
+    def get_latency(self) -> float:
+        """Sample the latency of a completion from the configured distribution."""
+        mean = self.settings.fake_llm_latency_mean_seconds
+        stddev = self.settings.fake_llm_latency_stddev_seconds
+        with self._lock:
+            if self.settings.fake_llm_latency_distribution == LatencyDistribution.UNIFORM:
+                return self._random.uniform(max(0.0, mean - stddev), mean + stddev)
+            if self.settings.fake_llm_latency_distribution == LatencyDistribution.LOGNORMAL and mean > 0:
+                sigma = math.sqrt(math.log(1 + (stddev / mean) ** 2))
+                return self._random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+        return mean
+
+    def maybe_raise_injected_error(self) -> None:
+        """Raise the configured error with the configured probability."""
+        with self._lock:
+            inject_error = self._random.random() < self.settings.fake_llm_error_rate
+        if not inject_error:
+            return
+        error_type = self.settings.fake_llm_error_type
+        message = f"Injected {error_type.value} error from the fake LLM backend."
+        if error_type == InjectedErrorType.RATE_LIMIT:
+            raise RateLimitError(message, http_status=429)
+        if error_type == InjectedErrorType.TIMEOUT:
+            raise Timeout(message)
+        if error_type == InjectedErrorType.SERVICE_UNAVAILABLE:
+            raise ServiceUnavailableError(message, http_status=503)
+        raise APIError(message, http_status=500)
+
+    def get_completion(self, request: ChatCompletionRequest) -> ChatCompletion:
+        """Generate the completion for the request, the content only depends on the request."""
+        prompt_tokens = self.settings.fake_llm_prompt_tokens
+        if prompt_tokens is None:
+            prompt_tokens = sum(len(message["content"]) // 4 + 4 for message in request.messages)
+        completion_tokens = min(request.max_tokens, self.settings.fake_llm_completion_tokens or request.max_tokens // 2 or 1)
+        content_random = random.Random(f"{self.settings.fake_llm_seed}:{request.get_hash()}")
+        content = " ".join(content_random.choice(self.WORDS) for _ in range(completion_tokens))
+        return ChatCompletion(content=content, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def create_chat_completion(self, request: ChatCompletionRequest, request_timeout: float) -> ChatCompletion:
+        latency = self.get_latency()
+        if latency > request_timeout:
+            time.sleep(request_timeout)
+            raise Timeout(f"Fake LLM backend request timed out after {request_timeout}s.")
+        time.sleep(latency)
+        self.maybe_raise_injected_error()
+        return self.get_completion(request)
+
+    def stream_chat_completion(self, request: ChatCompletionRequest, request_timeout: float) -> Iterator[str]:
+        time.sleep(min(self.get_latency(), request_timeout))
+        self.maybe_raise_injected_error()
+        completion = self.get_completion(request)
+        for index, chunk in enumerate(split_into_chunks(completion.content, self.settings.fake_llm_stream_chunk_tokens)):
+            if index:
+                time.sleep(self.settings.fake_llm_stream_chunk_interval_seconds)
+            yield chunk
+
+
+def create_llm_backend(settings: LLMBackendSettings) -> LLMBackend:
+    """Create the backend selected in the settings."""
+    if settings.llm_backend == LLMBackendName.FAKE:
+        return FakeBackend(settings)
+    if settings.llm_backend == LLMBackendName.REPLAY:
+        return RecordReplayBackend(settings.llm_recording_path)
+    if settings.llm_backend == LLMBackendName.RECORD:
+        return RecordReplayBackend(settings.llm_recording_path, backend=OpenAIBackend())
+    return OpenAIBackend()
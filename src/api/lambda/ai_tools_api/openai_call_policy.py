@@ -0,0 +1,149 @@
+"""
+Call policy for requests to OpenAI.
+
+The policy bounds every attempt with a timeout, retries retryable errors with jittered
+exponential backoff while staying inside an overall time budget, and can hedge slow
+attempts by sending a duplicate request once the first one exceeds the p95 latency of
+recent calls. Only the response of the attempt that wins is returned so that callers
+account usage exactly once.
+"""
+from __future__ import annotations
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Optional, TypeVar
+from loguru import logger
+from openai.error import APIConnectionError, APIError, OpenAIError, ServiceUnavailableError, Timeout, TryAgain
+from pydantic import BaseSettings, confloat, conint
+
+
+T = TypeVar("T")
+MIN_LATENCY_SAMPLES_FOR_HEDGING = 20
+
+
+class OpenAICallPolicySettings(BaseSettings):
+    """Define the settings for calls made to OpenAI."""
+
+    openai_request_timeout_seconds: confloat(gt=0) = 30.0
+    openai_total_timeout_budget_seconds: confloat(gt=0) = 35.0
+    openai_max_retries: conint(ge=0) = 2
+    openai_backoff_base_seconds: confloat(gt=0) = 0.5
+    openai_backoff_max_seconds: confloat(gt=0) = 8.0
+    openai_hedging_enabled: bool = False
+    openai_hedge_percentile: confloat(gt=0, lt=1) = 0.95
+    openai_hedge_default_delay_seconds: confloat(gt=0) = 10.0
+    openai_hedge_latency_sample_size: conint(ge=MIN_LATENCY_SAMPLES_FOR_HEDGING) = 200
+
+    class Config:
+        case_sensitive = False
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Return whether an error returned by OpenAI is worth retrying."""
+    if isinstance(error, (Timeout, APIConnectionError, ServiceUnavailableError, TryAgain)):
+        return True
+    if isinstance(error, APIError):
+        return error.http_status is None or error.http_status >= 500
+    return False
+
+
+class LatencyTracker:
+    """Keep the latencies of recent successful calls to estimate percentiles."""
+
+    def __init__(self, sample_size: int):
+        self._latencies = deque(maxlen=sample_size)
+        self._lock = threading.Lock()
+
+    def record(self, latency_seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(latency_seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Return the latency percentile or None if there are not enough samples."""
+        with self._lock:
+            if len(self._latencies) < MIN_LATENCY_SAMPLES_FOR_HEDGING:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(percentile * len(latencies)))]
+
+
+class OpenAICallPolicy:
+    """Apply timeouts, retries and hedging to calls made to OpenAI."""
+
+    def __init__(self, settings: OpenAICallPolicySettings):
+        self.settings = settings
+        self.latency_tracker = LatencyTracker(settings.openai_hedge_latency_sample_size)
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="openai-hedge")
+
+    def get_hedge_delay(self) -> float:
+        """Return the time to wait for an attempt before sending a hedged request."""
+        delay = self.latency_tracker.percentile(self.settings.openai_hedge_percentile)
+        return delay or self.settings.openai_hedge_default_delay_seconds
+
+    def get_backoff_seconds(self, attempt: int) -> float:
+        """Return the full jitter exponential backoff for an attempt."""
+        backoff = min(self.settings.openai_backoff_max_seconds, self.settings.openai_backoff_base_seconds * 2 ** attempt)
+        return random.uniform(0, backoff)
+
+    def call(
+        self,
+        create_completion: Callable[[float], T],
+        can_hedge: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """
+        Call OpenAI following the policy.
+
+        Args:
+            create_completion: Function making the request to OpenAI with the given request timeout.
+            can_hedge: Function called before sending a hedged request, returns whether it may be sent.
+                Hedging is disabled for the call if not provided.
+
+        Returns:
+            response: The response of the attempt that completed first.
+        """
+        deadline = time.monotonic() + self.settings.openai_total_timeout_budget_seconds
+        attempt = 0
+        while True:
+            request_timeout = min(self.settings.openai_request_timeout_seconds, deadline - time.monotonic())
+            try:
+                if self.settings.openai_hedging_enabled and can_hedge:
+                    return self._call_with_hedging(create_completion, request_timeout, can_hedge)
+                return self._timed_call(create_completion, request_timeout)
+            except OpenAIError as e:
+                backoff_seconds = self.get_backoff_seconds(attempt)
+                out_of_budget = time.monotonic() + backoff_seconds >= deadline
+                if not is_retryable_error(e) or attempt >= self.settings.openai_max_retries or out_of_budget:
+                    raise
+                logger.warning(f"Retrying OpenAI request in {backoff_seconds:.2f}s after error: {e}")
+                time.sleep(backoff_seconds)
+                attempt += 1
+
+    def _timed_call(self, create_completion: Callable[[float], T], request_timeout: float) -> T:
+        start_time = time.monotonic()
+        response = create_completion(request_timeout)
+        self.latency_tracker.record(time.monotonic() - start_time)
+        return response
+
+    def _call_with_hedging(
+        self,
+        create_completion: Callable[[float], T],
+        request_timeout: float,
+        can_hedge: Callable[[], bool],
+    ) -> T:
+        hedge_delay = self.get_hedge_delay()
+        futures: list[Future] = [self._executor.submit(self._timed_call, create_completion, request_timeout)]
+        done, _ = wait(futures, timeout=hedge_delay)
+        if not done and hedge_delay < request_timeout and can_hedge():
+            logger.info(f"OpenAI request exceeded {hedge_delay:.2f}s, sending hedged request.")
+            futures.append(self._executor.submit(self._timed_call, create_completion, request_timeout - hedge_delay))
+        pending = set(futures)
+        error: Optional[Exception] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
@@ -0,0 +1,131 @@
+"""
+Pooled keep-alive HTTP session for the OpenAI client.
+
+The openai client creates a requests session per thread with default adapter settings.
+This module installs a single session shared by all threads (including the threads used
+for hedged requests) with a sized connection pool, a connect timeout and TCP keep-alive
+so that warm lambda containers and uvicorn workers reuse their TLS connections.
+"""
+import socket
+from typing import Optional
+import openai
+import requests
+from loguru import logger
+from pydantic import BaseSettings, confloat, conint
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+
+OPENAI_API_PREFIX = "https://"
+
+
+class OpenAIHTTPSettings(BaseSettings):
+    """Define the settings for the HTTP connections to OpenAI."""
+
+    openai_pool_connections: conint(ge=1) = 2
+    openai_pool_maxsize: conint(ge=1) = 8
+    openai_connect_timeout_seconds: confloat(gt=0) = 3.05
+    openai_tcp_keepalive_idle_seconds: conint(ge=1) = 60
+    openai_tcp_keepalive_interval_seconds: conint(ge=1) = 15
+    openai_tcp_keepalive_probe_count: conint(ge=1) = 4
+
+    class Config:
+        case_sensitive = False
+
+
+def get_keepalive_socket_options(settings: OpenAIHTTPSettings) -> list[tuple[int, int, int]]:
+    """Return the socket options enabling TCP keep-alive (platform specific options are skipped if unsupported)."""
+    socket_options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    tcp_options = {
+        "TCP_KEEPIDLE": settings.openai_tcp_keepalive_idle_seconds,
+        "TCP_KEEPINTVL": settings.openai_tcp_keepalive_interval_seconds,
+        "TCP_KEEPCNT": settings.openai_tcp_keepalive_probe_count,
+    }
+    for option_name, value in tcp_options.items():
+        if hasattr(socket, option_name):
+            socket_options.append((socket.IPPROTO_TCP, getattr(socket, option_name), value))
+    return socket_options
+
+
+class KeepAliveHTTPAdapter(HTTPAdapter):
+    """HTTP adapter that opens its connections with the given socket options."""
+
+    def __init__(self, socket_options: list[tuple[int, int, int]], **kwargs):
+        self.socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+class OpenAISession(requests.Session):
+    """
+    Session that applies a separate connect timeout to the read timeouts passed by the openai client.
+
+    The session made by the openai client is given the proxies of openai.proxy, the shared
+    session reads them on every request instead.
+    """
+
+    def __init__(self, connect_timeout: float):
+        super().__init__()
+        self.connect_timeout = connect_timeout
+
+    def request(self, method, url, **kwargs):
+        timeout = kwargs.get("timeout")
+        if isinstance(timeout, (int, float)):
+            kwargs["timeout"] = (min(self.connect_timeout, timeout), timeout)
+        kwargs.setdefault("proxies", openai.api_requestor._requests_proxies_arg(openai.proxy))
+        return super().request(method, url, **kwargs)
+
+
+_openai_session: Optional[OpenAISession] = None
+
+
+def create_openai_session(settings: OpenAIHTTPSettings) -> OpenAISession:
+    """Create the pooled keep-alive session used for requests to OpenAI."""
+    session = OpenAISession(settings.openai_connect_timeout_seconds)
+    adapter = KeepAliveHTTPAdapter(
+        socket_options=get_keepalive_socket_options(settings),
+        pool_connections=settings.openai_pool_connections,
+        pool_maxsize=settings.openai_pool_maxsize,
+        max_retries=0,  # retries are handled by the OpenAI call policy
+    )
+    session.mount(OPENAI_API_PREFIX, adapter)
+    return session
+
+
+def install_openai_session(settings: Optional[OpenAIHTTPSettings] = None) -> OpenAISession:
+    """
+    Install the shared session in the openai client.
+
+    The session is created once per process so it survives the app being re-created
+    on every lambda invocation.
+    """
+    global _openai_session
+    if _openai_session is None:
+        _openai_session = create_openai_session(settings or OpenAIHTTPSettings())
+        # openai 0.27 creates a session per thread with this factory, return the shared one instead
+        openai.api_requestor._make_session = lambda: _openai_session
+        logger.info("Installed pooled keep-alive session for the OpenAI client.")
+    return _openai_session
+
+
+def get_connection_reuse_stats() -> dict[str, float]:
+    """
+    Get the connection reuse statistics of the OpenAI session.
+
+    Returns:
+        stats: The number of requests sent, the number of connections opened and the
+            fraction of requests that reused an already open connection.
+    """
+    request_count = 0
+    connection_count = 0
+    if _openai_session is not None:
+        pools = _openai_session.get_adapter(OPENAI_API_PREFIX).poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools[pool_key]
+            request_count += pool.num_requests
+            connection_count += pool.num_connections
+    reuse_rate = 1 - connection_count / request_count if request_count else 0.0
+    return {"requests": request_count, "new_connections": connection_count, "reuse_rate": reuse_rate}
@@ -0,0 +1,112 @@
+"""
+Serve the OpenAPI schema generated at build time.
+
+FastAPI generates the schema on the first request for it, walking every route and model,
+which can land in a cold start. generate_openapi_schema.py writes the schema of the app
+to openapi.json, which is packaged with the lambda code, and the app serves it prerendered
+with an ETag. The file is stored without the route prefix, its operation ids do not
+include it either, so it is served for the prefix of any deployment. The schema is only
+generated at runtime when the file is missing, and test_openapi_schema.py fails when the
+file is not regenerated after a change of the API.
+
+The app is created on every lambda invocation, so the file is read once per container
+and its prerendered response is kept at module level.
+"""
+import json
+import logging
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from fastapi import FastAPI, Request
+from fastapi.openapi.docs import get_swagger_ui_html
+from fastapi.responses import HTMLResponse, Response
+from fastapi.routing import APIRoute
+from utils import PrerenderedResponse
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+OPENAPI_SCHEMA_PATH = Path(__file__).parent / "openapi.json"
+# the schema changes with every deployment, clients revalidate it with its ETag
+OPENAPI_CACHE_CONTROL = "no-cache"
+
+
+# prerendered schemas by route prefix and root path, kept across the apps created by the lambda invocations
+_prerendered_schemas: Dict[Tuple[str, str], PrerenderedResponse] = {}
+
+
+def get_unique_id_generator(route_prefix: str) -> Callable[[APIRoute], str]:
+    """Get the generator of the operation ids of the routes, like the FastAPI one without the route prefix."""
+    prefix = f"/{route_prefix}"
+
+    def generate_unique_id(route: APIRoute) -> str:
+        path = route.path_format[len(prefix):] if route.path_format.startswith(f"{prefix}/") else route.path_format
+        return re.sub(r"\W", "_", route.name + path) + "_" + list(route.methods)[0].lower()
+
+    return generate_unique_id
+
+
+def get_openapi_schema_json(app: FastAPI, route_prefix: str) -> str:
+    """Get the OpenAPI schema of an app as written to the schema file, with the route prefix removed from its paths."""
+    schema = app.openapi()
+    prefix = f"/{route_prefix}"
+    paths = {
+        schema_path[len(prefix):] if schema_path.startswith(f"{prefix}/") else schema_path: path_item
+        for schema_path, path_item in schema.get("paths", {}).items()
+    }
+    return json.dumps({**schema, "paths": paths}, indent=2, sort_keys=True) + "\n"
+
+
+@lru_cache(maxsize=None)
+def load_openapi_schema(path: Path, route_prefix: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the OpenAPI schema generated at build time, once per container.
+
+    Args:
+        path: The path of the schema file.
+        route_prefix: The prefix of the routes of the app, added to the paths of the schema.
+
+    Returns:
+        schema: The schema, None if the file is missing.
+    """
+    if not path.exists():
+        logger.info("No OpenAPI schema at %s, it is generated on the first request.", path)
+        return None
+    schema = json.loads(path.read_text(encoding="utf-8"))
+    schema["paths"] = {f"/{route_prefix}{schema_path}": path_item for schema_path, path_item in schema.get("paths", {}).items()}
+    return schema
+
+
+def add_openapi_routes(app: FastAPI, route_prefix: str, schema_path: Path = OPENAPI_SCHEMA_PATH) -> None:
+    """
+    Add the OpenAPI schema and docs routes of an app created without them.
+
+    Args:
+        app: The app, created with openapi_url and docs_url set to None.
+        route_prefix: The prefix of the routes of the app.
+        schema_path: The path of the schema generated at build time.
+    """
+    openapi_url = f"/{route_prefix}/openapi.json"
+    schema = load_openapi_schema(schema_path, route_prefix)
+    if schema is not None:
+        # app.openapi() returns the stored schema instead of generating it
+        app.openapi_schema = schema
+
+    def get_prerendered_schema() -> PrerenderedResponse:
+        cache_key = (route_prefix, app.root_path)
+        if cache_key not in _prerendered_schemas:
+            served_schema = app.openapi()
+            if app.root_path:
+                served_schema = {**served_schema, "servers": [{"url": app.root_path}]}
+            _prerendered_schemas[cache_key] = PrerenderedResponse(served_schema, cache_control=OPENAPI_CACHE_CONTROL)
+        return _prerendered_schemas[cache_key]
+
+    async def openapi(request: Request) -> Response:
+        return get_prerendered_schema().get_response(request)
+
+    async def swagger_ui_html(request: Request) -> HTMLResponse:
+        return get_swagger_ui_html(openapi_url=app.root_path + openapi_url, title=f"{app.title} - Swagger UI")
+
+    app.add_route(openapi_url, openapi, include_in_schema=False)
+    app.add_route(f"/{route_prefix}/docs", swagger_ui_html, include_in_schema=False)
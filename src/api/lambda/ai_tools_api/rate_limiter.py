@@ -0,0 +1,208 @@
+"""
+Client side rate limiting for the OpenAI organization quota.
+
+All lambda containers share the same OpenAI organization limits (requests per minute and
+tokens per minute). The DynamoDB backend keeps per-minute usage counters that every container
+updates with a single atomic conditional update, while the in-memory backend is a plain token
+bucket for local runs. Callers wait briefly for capacity and are shed with an
+OpenAIRateLimitExceededError once the wait would exceed the configured budget.
+"""
+from __future__ import annotations
+import datetime as dt
+import random
+import threading
+import time
+from enum import Enum
+from typing import Protocol
+from loguru import logger
+from pydantic import BaseSettings, confloat, conint
+from pynamodb.exceptions import UpdateError
+from custom_exceptions import OpenAIRateLimitExceededError
+from dynamodb_models import OpenAIRateLimitTableModel
+
+
+RATE_LIMIT_WINDOW_SECONDS = 60
+CONDITIONAL_CHECK_FAILED = "ConditionalCheckFailedException"
+
+
+class RateLimiterBackend(str, Enum):
+    DYNAMODB = "dynamodb"
+    MEMORY = "memory"
+
+
+class OpenAIRateLimitSettings(BaseSettings):
+    """Define the settings for the OpenAI rate limiter."""
+
+    openai_tokens_per_minute_limit: conint(gt=0) = 90000
+    openai_requests_per_minute_limit: conint(gt=0) = 3500
+    rate_limiter_backend: RateLimiterBackend = RateLimiterBackend.DYNAMODB
+    rate_limiter_max_wait_seconds: confloat(ge=0) = 5.0
+    rate_limiter_min_limit_scale: confloat(gt=0, le=1) = 0.1
+    rate_limiter_limit_scale_recovery: confloat(gt=0, le=1) = 0.05
+
+    class Config:
+        case_sensitive = False
+
+
+class RateLimitStore(Protocol):
+    def try_acquire(self, token_count: float) -> float:
+        """Reserve capacity and return 0, or return the seconds to wait before capacity is available."""
+
+
+class TokenBucket:
+    """Thread safe token bucket that refills continuously up to its capacity."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, amount: float) -> float:
+        """
+        Take the amount from the bucket if available.
+
+        Args:
+            amount: The amount to take from the bucket. Amounts above the capacity are
+                clamped to the capacity so that large requests can eventually go through.
+
+        Returns:
+            wait_seconds: 0 if the amount was taken, otherwise the seconds until it will be available.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.refill_per_second)
+            self._last_refill = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.refill_per_second
+
+    def release(self, amount: float) -> None:
+        """Return an amount that was taken but not used to the bucket."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def debit(self, amount: float) -> None:
+        """Take an amount that was used without being acquired, the bucket goes negative until it is refilled."""
+        with self._lock:
+            self._tokens -= amount
+
+
+class InMemoryRateLimitStore:
+    """Rate limit store for a single process (local runs)."""
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int):
+        self._token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / RATE_LIMIT_WINDOW_SECONDS)
+        self._request_bucket = TokenBucket(requests_per_minute, requests_per_minute / RATE_LIMIT_WINDOW_SECONDS)
+
+    def try_acquire(self, token_count: float) -> float:
+        request_wait = self._request_bucket.try_acquire(1)
+        if request_wait:
+            return request_wait
+        token_wait = self._token_bucket.try_acquire(token_count)
+        if token_wait:
+            # give back the request slot as the request is not being made yet
+            self._request_bucket.release(1)
+        return token_wait
+
+
+class DynamoDBRateLimitStore:
+    """Rate limit store shared by all containers using an atomic counter per minute window."""
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+
+    def try_acquire(self, token_count: float) -> float:
+        token_count = min(token_count, self.tokens_per_minute)
+        now = time.time()
+        window = int(now // RATE_LIMIT_WINDOW_SECONDS)
+        window_model = OpenAIRateLimitTableModel(f"openai#{window}")
+        condition = (
+            (OpenAIRateLimitTableModel.token_count.does_not_exist()
+                | (OpenAIRateLimitTableModel.token_count <= self.tokens_per_minute - token_count))
+            & (OpenAIRateLimitTableModel.request_count.does_not_exist()
+                | (OpenAIRateLimitTableModel.request_count <= self.requests_per_minute - 1))
+        )
+        try:
+            window_model.update(
+                actions=[
+                    OpenAIRateLimitTableModel.token_count.add(token_count),
+                    OpenAIRateLimitTableModel.request_count.add(1),
+                    OpenAIRateLimitTableModel.expires.set(dt.timedelta(seconds=RATE_LIMIT_WINDOW_SECONDS * 10)),
+                ],
+                condition=condition,
+            )
+        except UpdateError as e:
+            if e.cause_response_code != CONDITIONAL_CHECK_FAILED:
+                raise
+            return (window + 1) * RATE_LIMIT_WINDOW_SECONDS - now
+        return 0.0
+
+
+class AdaptiveRateLimiter:
+    """
+    Rate limiter that adapts to the rate limit errors returned by OpenAI.
+
+    The configured limits are estimates of the organization quota. When OpenAI still
+    responds with a rate limit error, the share of the quota this process uses is halved
+    and then recovers additively with every successful request.
+    """
+
+    def __init__(self, store: RateLimitStore, settings: OpenAIRateLimitSettings):
+        self.store = store
+        self.settings = settings
+        self.limit_scale = 1.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: OpenAIRateLimitSettings) -> AdaptiveRateLimiter:
+        """Create a rate limiter with the store selected in the settings."""
+        store_class = InMemoryRateLimitStore
+        if settings.rate_limiter_backend == RateLimiterBackend.DYNAMODB:
+            store_class = DynamoDBRateLimitStore
+        store = store_class(settings.openai_tokens_per_minute_limit, settings.openai_requests_per_minute_limit)
+        return cls(store, settings)
+
+    def acquire(self, estimated_token_count: int) -> None:
+        """
+        Block until the estimated tokens can be sent to OpenAI.
+
+        Args:
+            estimated_token_count: The prompt tokens plus the max tokens requested for the response.
+
+        Raises:
+            OpenAIRateLimitExceededError: If capacity is not available within the max wait time.
+        """
+        cost = estimated_token_count / self.limit_scale
+        deadline = time.monotonic() + self.settings.rate_limiter_max_wait_seconds
+        while True:
+            wait_seconds = self.store.try_acquire(cost)
+            if not wait_seconds:
+                return
+            remaining_seconds = deadline - time.monotonic()
+            if wait_seconds > remaining_seconds:
+                logger.warning(f"Shedding OpenAI request of {estimated_token_count} tokens, capacity available in {wait_seconds:.2f}s.")
+                raise OpenAIRateLimitExceededError(
+                    message="The AI service is currently at capacity. Please try again shortly.",
+                    retry_after=wait_seconds,
+                )
+            time.sleep(wait_seconds + random.uniform(0, min(0.25, remaining_seconds - wait_seconds)))
+
+    def try_acquire_now(self, estimated_token_count: int) -> bool:
+        """Reserve the estimated tokens only if capacity is available without waiting."""
+        return not self.store.try_acquire(estimated_token_count / self.limit_scale)
+
+    def report_rate_limited(self) -> None:
+        """Reduce the share of the quota used after OpenAI returned a rate limit error."""
+        with self._lock:
+            self.limit_scale = max(self.settings.rate_limiter_min_limit_scale, self.limit_scale / 2)
+        logger.warning(f"OpenAI rate limit hit, rate limiter scale reduced to {self.limit_scale}.")
+
+    def report_success(self) -> None:
+        """Recover the share of the quota used after a successful request."""
+        with self._lock:
+            self.limit_scale = min(1.0, self.limit_scale + self.settings.rate_limiter_limit_scale_recovery)
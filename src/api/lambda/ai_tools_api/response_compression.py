@@ -0,0 +1,180 @@
+"""
+Negotiated compression of the HTTP responses.
+
+Responses of a compressible type and at least the minimum size are compressed with the
+encoding the client prefers among brotli and gzip, from its Accept-Encoding header, and
+marked with Vary: Accept-Encoding. Prerendered responses compress their body once per
+encoding, at the highest level, and are left alone by the middleware. Mangum base64
+encodes the compressed bodies, and API Gateway only decodes them when the first media
+type accepted by the request is one of the binary media types of the rest api, so other
+requests get uncompressed responses.
+"""
+import gzip
+from typing import List, Optional, Sequence
+from pydantic import BaseSettings, conint
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from api_gateway_settings import BINARY_MEDIA_TYPES
+
+try:
+    import brotli
+except ImportError:  # brotli is installed with the lambda dependencies, gzip is offered alone without it
+    brotli = None
+
+BROTLI_ENCODING = "br"
+GZIP_ENCODING = "gzip"
+# preferred first when the client accepts several encodings with the same quality
+AVAILABLE_ENCODINGS: List[str] = [BROTLI_ENCODING, GZIP_ENCODING] if brotli else [GZIP_ENCODING]
+COMPRESSIBLE_CONTENT_TYPES = ("application/json", "application/javascript", "text/")
+PRERENDERED_GZIP_LEVEL = 9
+PRERENDERED_BROTLI_QUALITY = 11
+
+
+class CompressionSettings(BaseSettings):
+    """
+    Define the settings of the response compression.
+
+    Attributes:
+        compression_minimum_size: The size in bytes from which responses are compressed.
+        compression_gzip_level: The gzip level of the responses compressed on every request.
+        compression_brotli_quality: The brotli quality of the responses compressed on every request.
+        compression_max_buffer_size: The size in bytes up to which a streamed body is held to be compressed.
+    """
+
+    compression_minimum_size: conint(ge=0) = 1024
+    compression_max_buffer_size: conint(ge=0) = 1024 * 1024
+    compression_gzip_level: conint(ge=1, le=9) = 6
+    compression_brotli_quality: conint(ge=0, le=11) = 5
+
+    class Config:
+        case_sensitive = False
+
+
+def get_accepted_encoding(accept_encoding: Optional[str], encodings: Sequence[str] = AVAILABLE_ENCODINGS) -> Optional[str]:
+    """
+    Get the encoding a client prefers among the available ones.
+
+    Args:
+        accept_encoding: The Accept-Encoding header of the request.
+        encodings: The available encodings, by order of preference on equal qualities.
+
+    Returns:
+        encoding: The encoding to use, None to send the body as it is.
+    """
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, *parameters = coding.split(";")
+        quality = 1.0
+        for parameter in parameters:
+            key, _, value = parameter.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    accepted_encoding, accepted_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > accepted_quality:
+            accepted_encoding, accepted_quality = encoding, quality
+    return accepted_encoding
+
+
+def get_response_encoding(request_headers: Headers) -> Optional[str]:
+    """Get the encoding of the response to a request, None if it is not compressed."""
+    first_accepted_type = request_headers.get("Accept", "").split(",")[0].split(";")[0].strip().lower()
+    if first_accepted_type not in BINARY_MEDIA_TYPES:
+        return None
+    return get_accepted_encoding(request_headers.get("Accept-Encoding"))
+
+
+def compress(body: bytes, encoding: str, gzip_level: int, brotli_quality: int) -> bytes:
+    """Compress a body with one of the available encodings."""
+    if encoding == BROTLI_ENCODING:
+        return brotli.compress(body, quality=brotli_quality)
+    # without a modification time the same body is always compressed to the same bytes
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+def is_compressible(content_type: Optional[str], size: int, settings: CompressionSettings) -> bool:
+    """Return whether a response body is worth compressing."""
+    return size >= settings.compression_minimum_size and (content_type or "").startswith(COMPRESSIBLE_CONTENT_TYPES)
+
+
+def add_vary_header(headers: MutableHeaders, header_name: str) -> None:
+    """Add a header to the Vary header, keeping the headers already listed."""
+    vary = [name.strip() for name in headers.get("Vary", "").split(",") if name.strip()]
+    if header_name.lower() not in (name.lower() for name in vary):
+        headers["Vary"] = ", ".join([*vary, header_name])
+
+
+class CompressionMiddleware:
+    """
+    Compress the responses of an app with the encoding negotiated with the client.
+
+    Bodies sent in chunks are held until complete, up to the maximum buffer size. Larger
+    streamed responses and responses already encoded or already varying with the
+    Accept-Encoding header, like the prerendered responses, are sent as they are.
+    """
+
+    def __init__(self, app: ASGIApp, settings: Optional[CompressionSettings] = None):
+        self.app = app
+        self.settings = settings or CompressionSettings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = get_response_encoding(Headers(scope=scope))
+        start_message: Optional[Message] = None
+        body_chunks: List[bytes] = []
+        buffered_size = 0
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message, buffered_size
+            if message["type"] == "http.response.start":
+                # held until the body shows whether the response is compressed
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+            # the http middleware of the app re-streams every body in chunks, the last one without more_body
+            body_chunks.append(message.get("body", b""))
+            buffered_size += len(body_chunks[-1])
+            if message.get("more_body", False):
+                if buffered_size <= self.settings.compression_max_buffer_size:
+                    return
+                # too large to be held, the response is streamed as it is
+                message = {**message, "body": b"".join(body_chunks)}
+            else:
+                message = self.compress_response(start_message, {**message, "body": b"".join(body_chunks)}, encoding)
+            await send(start_message)
+            start_message = None
+            body_chunks.clear()
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    def compress_response(self, start_message: Message, body_message: Message, encoding: Optional[str]) -> Message:
+        """Compress the body of a complete response with the encoding of the request, updating the headers of its start message."""
+        headers = MutableHeaders(scope=start_message)
+        body = body_message.get("body", b"")
+        if "Content-Encoding" in headers or "accept-encoding" in headers.get("Vary", "").lower():
+            return body_message
+        if not is_compressible(headers.get("Content-Type"), len(body), self.settings):
+            return body_message
+        add_vary_header(headers, "Accept")
+        add_vary_header(headers, "Accept-Encoding")
+        if encoding is None:
+            return body_message
+        body = compress(body, encoding, self.settings.compression_gzip_level, self.settings.compression_brotli_quality)
+        headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(len(body))
+        return {**body_message, "body": body}
+
+
+compression_settings = CompressionSettings()
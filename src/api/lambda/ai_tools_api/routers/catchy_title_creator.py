@@ -17,6 +17,7 @@ from pydantic import constr, conint, Field
 from fastapi import APIRouter, Response, status, Request
 from typing import Optional, List
 from pathlib import Path
+from functools import partial
 import logging
 import sys
 import os
@@ -24,7 +25,15 @@ import os
 sys.path.append(Path(__file__).parent / "../utils")
 sys.path.append(Path(__file__).parent / "../text_examples")
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../gpt_turbo"))
-from gpt_turbo import GPTTurboChatSession, GPTTurboChat, Role, get_gpt_turbo_response
+from gpt_turbo import (
+    GPTTurboChatSession,
+    GPTTurboChat,
+    Role,
+    get_gpt_turbo_response,
+    charge_user_for_shared_chat_session,
+)
+from example_outputs import get_example_output_response
+from single_flight import SingleFlight
 from text_examples import TEXT_BOOK_EXAMPLE, COFFEE_SHOP, SHORT_STORY
 from utils import (
     map_value_between_range,
@@ -44,6 +53,8 @@ from utils import (
     TOKENS_EXHAUSTED_FOR_DAY_JSON_RESPONSE,
     TokensExhaustedException,
     AIToolResponse,
+    get_canonical_request_hash,
+    PrerenderedResponse,
 )
 
 
@@ -51,9 +62,11 @@ logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
 router = APIRouter()
+single_flight = SingleFlight()
 
 ENDPOINT_NAME = AIToolsEndpointName.CATCHY_TITLE_CREATOR.value
 MAX_TOKENS_FROM_GPT_RESPONSE = 200
+EXPECTED_TOKENS_PER_TITLE = 20
 
 AI_PURPOSE = " ".join(ENDPOINT_NAME.split("-")).lower()
 
@@ -139,16 +152,9 @@ class CatchyTitleCreatorExamplesResponse(ExamplesResponse):
     __doc__ += ExamplesResponse.__doc__
     examples: list[CatchyTitleCreatorRequest]
 
-@docstring_parameter(ENDPOINT_NAME)
-@router.get(f"/{ENDPOINT_NAME}-{EXAMPLES_ENDPOINT_POSTFIX}", response_model=CatchyTitleCreatorExamplesResponse, status_code=status.HTTP_200_OK)
-async def catchy_title_creator_examples():
-    """
-    **Get examples for the {0} endpoint.**
-    
-    This method returns a list of examples for the {0} endpoint. These examples can be posted to the {0} endpoint 
-    without modification.
-    """
-    catchy_title_examples = [
+EXAMPLES_RESPONSE = CatchyTitleCreatorExamplesResponse(
+    example_names=["Textbook", "Coffee Shop", "Short Story"],
+    examples=[
         CatchyTitleCreatorRequest(
             text_or_description=TEXT_BOOK_EXAMPLE,
             target_audience="Young Adults",
@@ -175,23 +181,34 @@ async def catchy_title_creator_examples():
             creativity=90,
             type_of_title="Short Story",
         ),
-    ]
+    ],
+)
+PRERENDERED_EXAMPLES_RESPONSE = PrerenderedResponse(EXAMPLES_RESPONSE)
+
+
+@docstring_parameter(ENDPOINT_NAME)
+@router.get(f"/{ENDPOINT_NAME}-{EXAMPLES_ENDPOINT_POSTFIX}", response_model=CatchyTitleCreatorExamplesResponse, status_code=status.HTTP_200_OK)
+async def catchy_title_creator_examples(request: Request):
+    """
+    **Get examples for the {0} endpoint.**
     
-    example_response = CatchyTitleCreatorExamplesResponse(
-        example_names=["Textbook", "Coffee Shop", "Short Story"],
-        examples=catchy_title_examples
-    )
-    return example_response
+    This method returns a list of examples for the {0} endpoint. These examples can be posted to the {0} endpoint 
+    without modification.
+    """
+    return PRERENDERED_EXAMPLES_RESPONSE.get_response(request)
 
 
 @router.post(f"/{ENDPOINT_NAME}", response_model=AIToolResponse, responses=error_responses)
 async def catchy_title_creator(catchy_title_creator_request: CatchyTitleCreatorRequest, response: Response, request: Request):
     """**Generate catchy titles using GPT-3.**"""
     logger.info(f"Received request for {ENDPOINT_NAME} endpoint.")
+    uuid = request.headers.get(UUID_HEADER_NAME)
+    example_output_response = get_example_output_response(ENDPOINT_NAME, catchy_title_creator_request, uuid, AIToolResponse)
+    if example_output_response is not None:
+        return example_output_response
     user_prompt = append_field_prompts_to_prompt(CatchyTitleCreatorInstructions(**catchy_title_creator_request.dict()), BASE_USER_PROMPT_PREFIX)
 
     user_prompt += f"\nHere is the text/description of what you should create a name or title for: {catchy_title_creator_request.text_or_description}"
-    uuid = request.headers.get(UUID_HEADER_NAME)
     user_chat = GPTTurboChat(
         role=Role.USER,
         content=user_prompt,
@@ -200,16 +217,22 @@ async def catchy_title_creator(catchy_title_creator_request: CatchyTitleCreatorR
     temperature = map_value_between_range(catchy_title_creator_request.creativity, 0, 100, 0.2, 1.0)
     presence_penalty = map_value_between_range(catchy_title_creator_request.creativity, 0, 100, 0.3, 1.3)
     frequency_penalty = map_value_between_range(catchy_title_creator_request.creativity, 0, 100, 0.8, 2.0)
+    get_response = partial(
+        get_gpt_turbo_response,
+        system_prompt=SYSTEM_PROMPT,
+        chat_session=GPTTurboChatSession(messages=[user_chat]),
+        temperature=temperature,
+        presence_penalty=presence_penalty,
+        frequency_penalty=frequency_penalty,
+        uuid=uuid,
+        max_tokens=MAX_TOKENS_FROM_GPT_RESPONSE,
+        expected_response_token_count=((catchy_title_creator_request.num_titles or 1) + 1) * EXPECTED_TOKENS_PER_TITLE,
+    )
+    request_hash = get_canonical_request_hash(ENDPOINT_NAME, catchy_title_creator_request)
     try:
-        chat_session = get_gpt_turbo_response(
-            system_prompt=SYSTEM_PROMPT,
-            chat_session=GPTTurboChatSession(messages=[user_chat]),
-            temperature=temperature,
-            presence_penalty=presence_penalty,
-            frequency_penalty=frequency_penalty,
-            uuid=uuid,
-            max_tokens=MAX_TOKENS_FROM_GPT_RESPONSE,
-        )
+        chat_session, leader_uuid = await single_flight.do(request_hash, get_response, caller=uuid)
+        if leader_uuid != uuid:
+            charge_user_for_shared_chat_session(uuid, chat_session)
     except TokensExhaustedException as e:
         if e.login:
             return TOKENS_EXHAUSTED_LOGIN_JSON_RESPONSE
@@ -9,6 +9,7 @@ sys.path.append(Path(__file__).parent / "../utils")
 sys.path.append(Path(__file__).parent / "../text_examples")
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../gpt_turbo"))
 from gpt_turbo import GPTTurboChatSession, GPTTurboChat, Role, get_gpt_turbo_response
+from example_outputs import get_example_output_response
 from text_examples import AEROSPACE_RESUME, SPACEX_JOB_POSTING, TEACHER_JOB_POSTING, TEACHER_RESUME
 from utils import (
     AIToolModel,
@@ -27,6 +28,7 @@ from utils import (
     TOKENS_EXHAUSTED_FOR_DAY_JSON_RESPONSE,
     TokensExhaustedException,
     AIToolResponse,
+    PrerenderedResponse,
 )
 
 logger = logging.getLogger()
@@ -111,6 +113,28 @@ class CoverLetterWriterExamplesResponse(ExamplesResponse):
     examples: list[CoverLetterWriterRequest]
 
 
+EXAMPLES_RESPONSE = CoverLetterWriterExamplesResponse(
+    example_names=["Highschool Teacher", "Aerospace Engineer"],
+    examples=[
+        CoverLetterWriterRequest(
+            resume=TEACHER_RESUME,
+            job_posting=TEACHER_JOB_POSTING,
+            skills_to_highlight_from_resume="international teaching experience and my TESOL certification",
+            tone=Tone.ASSERTIVE,
+            company_name="Rocky Mountain High School"
+        ),
+        CoverLetterWriterRequest(
+            resume=AEROSPACE_RESUME,
+            job_posting=SPACEX_JOB_POSTING,
+            skills_to_highlight_from_resume="my experience with Python and my ability to work in a team",
+            tone=Tone.FORMAL,
+            company_name="SpaceX",
+        ),
+    ],
+)
+PRERENDERED_EXAMPLES_RESPONSE = PrerenderedResponse(EXAMPLES_RESPONSE)
+
+
 @docstring_parameter(ENDPOINT_NAME)
 @router.get(f"/{ENDPOINT_NAME}-{EXAMPLES_ENDPOINT_POSTFIX}", response_model=CoverLetterWriterExamplesResponse)
 async def cover_letter_writer_examples(request: Request):
@@ -120,27 +144,7 @@ async def cover_letter_writer_examples(request: Request):
     This method returns a list of examples for the {0} endpoint. These examples can be posted to the {0} endpoint 
     without modification.
     """
-
-    teacher_example = CoverLetterWriterRequest(
-        resume=TEACHER_RESUME,
-        job_posting=TEACHER_JOB_POSTING,
-        skills_to_highlight_from_resume="international teaching experience and my TESOL certification",
-        tone=Tone.ASSERTIVE,
-        company_name="Rocky Mountain High School"
-    )
-    engineer_example = CoverLetterWriterRequest(
-        resume=AEROSPACE_RESUME,
-        job_posting=SPACEX_JOB_POSTING,
-        skills_to_highlight_from_resume="my experience with Python and my ability to work in a team",
-        tone=Tone.FORMAL,
-        company_name="SpaceX",
-    )
-
-    example_response = CoverLetterWriterExamplesResponse(
-        example_names=["Highschool Teacher", "Aerospace Engineer"],
-        examples=[teacher_example, engineer_example],
-    )
-    return example_response
+    return PRERENDERED_EXAMPLES_RESPONSE.get_response(request)
 
 
 @router.post(f"/{ENDPOINT_NAME}", response_model=AIToolResponse, responses=error_responses)
@@ -151,9 +155,12 @@ async def cover_letter_writer(request: Request, cover_letter_writer_request: Cov
     This method takes a resume and job posting as input and generates a cover letter for the resume and job posting.
     """
     logger.info(f"Received request for {ENDPOINT_NAME} endpoint.")
+    uuid = request.headers.get(UUID_HEADER_NAME)
+    example_output_response = get_example_output_response(ENDPOINT_NAME, cover_letter_writer_request, uuid, AIToolResponse)
+    if example_output_response is not None:
+        return example_output_response
     user_prompt = append_field_prompts_to_prompt(CoverLetterWriterInsructions(**cover_letter_writer_request.dict()), BASE_USER_PROMPT_PREFIX)
     user_prompt += f"\nHere is my resume to use as a reference when writing the cover letter: {cover_letter_writer_request.resume}"
-    uuid = request.headers.get(UUID_HEADER_NAME)
     user_chat = GPTTurboChat(
         role=Role.USER,
         content=user_prompt
@@ -1,18 +1,17 @@
 """Define a fastapi router for the feedback endpoint."""
 from enum import Enum
 import sys
-from typing import Optional, List
+from typing import Any, Dict, NamedTuple, Optional, List, Type
 from pathlib import Path
 from uuid import uuid4
-from pydantic import constr, validator
+from pydantic import BaseModel, constr, validator
 from loguru import logger
 from fastapi import APIRouter, Request, Response, status
 from catchy_title_creator import CatchyTitleCreatorRequest
 from cover_letter_writer import CoverLetterWriterRequest
 from sandbox_chatgpt import SandBoxChatGPTRequest, SandBoxChatGPTResponse
 from text_revisor import TextRevisorRequest, TextRevisorResponse
-from text_summarizer import TextSummarizerRequest
-import catchy_title_creator, cover_letter_writer, sandbox_chatgpt, text_revisor, text_summarizer
+from text_summarizer import TextSummarizerRequest, TextSummarizerResponse
 
 file_path = Path(__file__)
 sys.path.append(str((file_path / "../dynamodb_models").resolve()))
@@ -26,12 +25,13 @@ from utils import (
     AIToolResponse,
 )
 from dynamodb_models import FeedbackTableModel
+from feedback_buffer import feedback_buffer
+from ttl_policy import ttl_policy_settings, get_expiry
 
 
 router = APIRouter()
 
 ENDPOINT_NAME = "feedback"
-ROUTER_MODULES = [catchy_title_creator, cover_letter_writer, sandbox_chatgpt, text_revisor, text_summarizer]
 
 class Rating(str, Enum):
     """Define the possible rating values."""
@@ -42,20 +42,19 @@ class Rating(str, Enum):
     FIVE = 5
 
 
-class SupportedRequest(str, Enum):
-    """Define the possible request types that can be given feedback on."""
-    CATCHY_TITLE_CREATOR = CatchyTitleCreatorRequest.__name__
-    COVER_LETTER_WRITER = CoverLetterWriterRequest.__name__
-    SANDBOX_CHATGPT = SandBoxChatGPTRequest.__name__
-    TEXT_REVISOR = TextRevisorRequest.__name__
-    TEXT_SUMMARIZER = TextSummarizerRequest.__name__
+class FeedbackContextModels(NamedTuple):
+    """The request and response models of an AI tool, the contexts of its feedback are validated with them."""
+    request: Type[BaseModel]
+    response: Type[BaseModel]
 
 
-class SupportedResponse(str, Enum):
-    """Define the possible response types that can be given feedback on."""
-    AI_TOOL_RESPONSE = AIToolResponse.__name__
-    SANDBOX_CHATGPT = SandBoxChatGPTResponse.__name__
-    TEXT_REVISOR = TextRevisorResponse.__name__
+FEEDBACK_CONTEXT_MODELS: Dict[AIToolsEndpointName, FeedbackContextModels] = {
+    AIToolsEndpointName.CATCHY_TITLE_CREATOR: FeedbackContextModels(CatchyTitleCreatorRequest, AIToolResponse),
+    AIToolsEndpointName.COVER_LETTER_WRITER: FeedbackContextModels(CoverLetterWriterRequest, AIToolResponse),
+    AIToolsEndpointName.SANDBOX_CHATGPT: FeedbackContextModels(SandBoxChatGPTRequest, SandBoxChatGPTResponse),
+    AIToolsEndpointName.TEXT_REVISOR: FeedbackContextModels(TextRevisorRequest, TextRevisorResponse),
+    AIToolsEndpointName.TEXT_SUMMARIZER: FeedbackContextModels(TextSummarizerRequest, TextSummarizerResponse),
+}
 
 
 @docstring_parameter(ENDPOINT_NAME)
@@ -65,9 +64,9 @@ class FeedbackRequest(AIToolModel):
 
     **Atrributes:**
     - user_prompt_feedback_context: The context of the user prompt that the feedback is for.
-        Any of the AI tool request models can be used here. (templates or sandbox)
+        It must be a valid request of the AI tool named by ai_tool_endpoint_name.
     - ai_response_feedback_context: The context of the AI response that the feedback is for.
-        Any of the AI tool response models can be used here. (templates or sandbox)
+        It must be a valid response of the AI tool named by ai_tool_endpoint_name.
     - star_rating: The star rating left by the user.
     - written_feedback: Any written feedback left by the user.
     """
@@ -81,7 +80,7 @@ class FeedbackRequest(AIToolModel):
         """Define the config for the model."""
         schema_extra = {
             "example": {
-                "aiToolEndpointName": "templates",
+                "aiToolEndpointName": "sandbox-chatgpt",
                 "userPromptFeedbackContext": {
                     "conversationUuid": "f4bd346a-9ade-4471-b127-1f73364df090",
                     "userMessage": "Make me Famous"
@@ -95,36 +94,32 @@ class FeedbackRequest(AIToolModel):
         }
 
     @validator("user_prompt_feedback_context")
-    def valid_user_prompt_feedback_context(cls, value):
-        """Validate that the user prompt feedback context is validand supported."""
-        for class_name, module in zip(SupportedRequest.__members__.values(), ROUTER_MODULES):
-            try:
-                getattr(module, class_name)(**value)
-                return value
-            except Exception: # pylint: disable=broad-except
-                pass
-        raise ValueError(f"Invalid user prompt feedback context: {value}. Supported request types: {SupportedRequest.__members__.values()}")
+    def valid_user_prompt_feedback_context(cls, value: dict, values: Dict[str, Any]) -> dict:
+        """Validate that the user prompt feedback context is a valid request of the AI tool."""
+        context_models = FEEDBACK_CONTEXT_MODELS.get(values.get("ai_tool_endpoint_name"))
+        # an invalid AI tool is already reported by its own validation
+        if context_models:
+            context_models.request(**value)
+        return value
 
     @validator("ai_response_feedback_context")
-    def valid_ai_response_feedback_context(cls, value):
-        """Validate that the ai response feedback context is valid and supported."""
-        for class_name, module in zip(SupportedResponse.__members__.values(), ROUTER_MODULES):
-            try:
-                getattr(module, class_name)(**value)
-                return value
-            except Exception: # pylint: disable=broad-except
-                pass
-        raise ValueError(f"Invalid ai response feedback context: {value}. Supported response types: {SupportedResponse.__members__.values()}")
+    def valid_ai_response_feedback_context(cls, value: dict, values: Dict[str, Any]) -> dict:
+        """Validate that the ai response feedback context is a valid response of the AI tool."""
+        context_models = FEEDBACK_CONTEXT_MODELS.get(values.get("ai_tool_endpoint_name"))
+        if context_models:
+            context_models.response(**value)
+        return value
 
 
+# not async: adding the record that fills the buffer writes it, which must not block the event loop
 @router.post(f"/{ENDPOINT_NAME}", status_code=status.HTTP_200_OK)
-async def feedback(request: Request, response: Response, feedback_request: FeedbackRequest):
+def feedback(request: Request, response: Response, feedback_request: FeedbackRequest):
     """
     **POST User feedback for an AI tool.**
 
     This method is used to record user feedback for the AI tools. This method 
-    returns an empty response with a 200 status code if the feedback is logged 
-    successfully.
+    returns an empty response with a 200 status code once the feedback is validated,
+    it is written with the other buffered feedback after the response.
     """
     logger.info(f"Received request for {ENDPOINT_NAME} endpoint.")
     logger.info(f"Request body: {feedback_request.json()}")
@@ -136,8 +131,9 @@ async def feedback(request: Request, response: Response, feedback_request: Feedb
         user_prompt_feedback_context=feedback_request.user_prompt_feedback_context,
         ai_response_feedback_context=feedback_request.ai_response_feedback_context,
         rating=int(feedback_request.rating.value),
+        expires=get_expiry(ttl_policy_settings.feedback_ttl_days),
     )
     if feedback_request.written_feedback:
         feedback_table_model.written_feedback = feedback_request.written_feedback
-    feedback_table_model.save()
+    feedback_buffer.add(feedback_table_model)
     return {}
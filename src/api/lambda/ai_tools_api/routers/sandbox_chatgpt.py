@@ -1,11 +1,16 @@
 from pathlib import Path
 import sys
+import base64
+import binascii
+import json
 import logging
 import traceback
-from typing import Optional
+from datetime import datetime
+from typing import Callable, NamedTuple, Optional
 from uuid import UUID
-from fastapi import APIRouter, Request, status
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
 from typing import Any, Dict
+from pynamodb.exceptions import UpdateError
 from pynamodb.models import Model
 
 sys.path.append(Path(__file__, "../utils"))
@@ -16,13 +21,23 @@ from utils import (
     UUID_HEADER_NAME,
     EXAMPLES_ENDPOINT_POSTFIX,
     AIToolsEndpointName,
+    docstring_parameter,
     error_responses,
     TokensExhaustedException,
     TOKENS_EXHAUSTED_LOGIN_JSON_RESPONSE,
     TOKENS_EXHAUSTED_FOR_DAY_JSON_RESPONSE,
+    PrerenderedResponse,
+)
+from chat_retrieval import select_relevant_turns
+from conversation_cache import ConversationCache, ConversationCacheSettings
+from ttl_policy import ttl_policy_settings, get_expiry
+from gpt_turbo import GPTTurboChatSession, get_gpt_turbo_response, stream_gpt_turbo_response, GPTTurboChat, Role
+from dynamodb_models import (
+    UserDataTableModel,
+    SandboxChatMessageTableModel,
+    SandboxConversationTableModel,
+    get_sandbox_conversation_key,
 )
-from gpt_turbo import GPTTurboChatSession, get_gpt_turbo_response, GPTTurboChat, Role
-from dynamodb_models import UserDataTableModel
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -30,6 +45,18 @@ logger.setLevel(logging.INFO)
 router = APIRouter()
 
 ENDPOINT_NAME = AIToolsEndpointName.SANDBOX_CHATGPT.value
+MESSAGES_TO_LOAD_FROM_HISTORY = 20
+CONVERSATIONS_ENDPOINT_POSTFIX = "conversations"
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+CONVERSATION_TITLE_MAX_LENGTH = 60
+COMPACTION_THRESHOLD_TOKEN_COUNT = 500
+MESSAGES_KEPT_AFTER_COMPACTION = 4
+SUMMARY_MAX_TOKEN_COUNT = 200
+MAX_SAVE_ATTEMPTS = 3
+RETRIEVAL_CANDIDATE_MESSAGE_COUNT = 100
+RETRIEVAL_TOKEN_BUDGET = 200
+RETRIEVED_TURNS_MAX = 3
 
 SYSTEM_PROMPT = (
     "You are a friendly assist named Roo. You are to help the user with whatever they need help with but also be conversational. "
@@ -40,6 +67,14 @@ SYSTEM_PROMPT = (
     "Finally, you MUST use markdown format when you respond to the user."
 )
 
+COMPACTION_SYSTEM_PROMPT = (
+    "You maintain the memory of a conversation between a user and an assistant named Roo. "
+    "You will be given the current summary of the conversation, if there is one, followed by newer messages. "
+    f"Write an updated summary in less than {int(SUMMARY_MAX_TOKEN_COUNT * 0.75)} words. "
+    "Keep every fact about the user, their goals, preferences and decisions, and any open questions. "
+    "Write in the third person and do not add anything that was not said."
+)
+
 
 class SandBoxChatGPTRequest(AIToolModel):
     """
@@ -70,7 +105,124 @@ class SandBoxChatGPTResponse(AIToolModel):
     
     
 class GPTChatHistory(GPTTurboChatSession):
+    """
+    Recent messages of a sandbox-chatgpt conversation.
+
+    Attributes:
+        conversation_uuid: A unique identifier for the conversation.
+        next_message_index: The index of the next message appended to the conversation.
+        cumulative_token_count: The running token total of all messages in the conversation.
+        summary: The rolling summary of the messages before summarized_through_index.
+        summary_token_count: The token count of the summary.
+        summarized_through_index: The index of the first message not covered by the summary.
+        version: The version of the conversation index item when it was read, None if it does not exist yet.
+    """
+    conversation_uuid: UUID
+    next_message_index: int = 0
+    cumulative_token_count: int = 0
+    summary: str = ""
+    summary_token_count: int = 0
+    summarized_through_index: int = 0
+    version: Optional[int] = None
+
+
+def get_chat_history_size(chat_history: GPTChatHistory) -> int:
+    """Get the approximate in-memory size of a chat history from the length of its texts."""
+    return len(chat_history.summary) + sum(len(message.content) for message in chat_history.messages)
+
+
+# conversations stay cached between the requests handled by a warm container or worker
+conversation_cache: ConversationCache[GPTChatHistory] = ConversationCache.from_settings(
+    ConversationCacheSettings(),
+    get_size=get_chat_history_size,
+)
+
+
+def cache_sandbox_chat_history(user_uuid: UUID, chat_history: GPTChatHistory) -> None:
+    """Cache a chat history as it was saved, keeping the messages a load would return."""
+    conversation_key = get_sandbox_conversation_key(str(user_uuid), str(chat_history.conversation_uuid))
+    chat_history = chat_history.copy(update=dict(messages=chat_history.messages[-MESSAGES_TO_LOAD_FROM_HISTORY:]))
+    conversation_cache.put(conversation_key, chat_history, version=chat_history.version)
+
+
+def invalidate_cached_sandbox_chat_history(user_uuid: UUID, conversation_uuid: UUID) -> None:
+    """Remove a chat history from the cache so the next turn loads it again."""
+    conversation_cache.invalidate(get_sandbox_conversation_key(str(user_uuid), str(conversation_uuid)))
+
+
+class EarlierSandboxChatMessages(NamedTuple):
+    """
+    The retrieval candidates of a conversation, the messages before those loaded in its chat history.
+
+    Attributes:
+        messages: The messages in chronological order.
+        through_index: The index of the first message loaded in the chat history, which is the version of the entry.
+    """
+    messages: tuple[GPTTurboChat, ...]
+    through_index: int
+
+
+# stored messages never change, so the candidates of the previous turn only need the messages that left the chat history since
+earlier_messages_cache: ConversationCache[EarlierSandboxChatMessages] = ConversationCache.from_settings(
+    ConversationCacheSettings(),
+    get_size=lambda earlier_messages: sum(len(message.content) for message in earlier_messages.messages),
+)
+
+
+class SandBoxConversationSummary(AIToolModel):
+    """
+    **Metadata of a sandbox-chatgpt conversation.**
+
+    **Attributes:**
+    - conversation_uuid: A unique identifier for the conversation.
+    - title: The beginning of the first user message of the conversation.
+    - last_updated: When a message was last added to the conversation (UTC).
+    - token_count: The token total of all messages in the conversation.
+    - message_count: The number of messages in the conversation.
+    """
     conversation_uuid: UUID
+    title: str
+    last_updated: datetime
+    token_count: int
+    message_count: int
+
+
+class SandBoxConversationsResponse(AIToolModel):
+    """
+    **A page of the sandbox-chatgpt conversations of a user, most recently updated first.**
+
+    **Attributes:**
+    - conversations: The conversations in the page.
+    - next_cursor: Cursor to pass to get the next page, null on the last page.
+    """
+    conversations: list[SandBoxConversationSummary]
+    next_cursor: Optional[str] = None
+
+
+class SandBoxChatMessage(AIToolModel):
+    """
+    **A message of a sandbox-chatgpt conversation.**
+
+    **Attributes:**
+    - message_index: The position of the message in the conversation.
+    - role: The role of the author of the message (user or assistant).
+    - content: The content of the message.
+    """
+    message_index: int
+    role: Role
+    content: str
+
+
+class SandBoxConversationMessagesResponse(AIToolModel):
+    """
+    **A page of the messages of a sandbox-chatgpt conversation, most recent first.**
+
+    **Attributes:**
+    - messages: The messages in the page.
+    - next_cursor: Cursor to pass to get the next page, null on the last page.
+    """
+    messages: list[SandBoxChatMessage]
+    next_cursor: Optional[str] = None
 
 
 class SandBoxChatGPTExamplesResponse(AIToolModel):
@@ -89,58 +241,515 @@ class SandBoxChatGPTExamplesResponse(AIToolModel):
     examples: list[str]
 
 
+EXAMPLES_RESPONSE = SandBoxChatGPTExamplesResponse(
+    example_names=["Homework Help", "Project Inspiration", "Learn to Code", "Cooking Recipe"],
+    examples=[
+        "I'm having a hard time with my homework. Can you help me?",
+        "I need some inspiration for my next project. I'm not sure where to start.",
+        "I don't know how to code. Can you teach me?",
+        "I need to create a recipe for my guests tonight. I only have 40min to cook. What should I make?"
+    ],
+)
+PRERENDERED_EXAMPLES_RESPONSE = PrerenderedResponse(EXAMPLES_RESPONSE)
+
+
 @router.get(f"/{ENDPOINT_NAME}-{EXAMPLES_ENDPOINT_POSTFIX}", response_model=SandBoxChatGPTExamplesResponse, responses=error_responses)
-async def sandbox_chatgpt_examples() -> SandBoxChatGPTExamplesResponse:
+async def sandbox_chatgpt_examples(request: Request) -> Response:
     """
     Get examples for sandbox-chatgpt.
 
     Returns:
         examples: Examples for sandbox-chatgpt.
     """
-    examples = [
-        "I'm having a hard time with my homework. Can you help me?",
-        "I need some inspiration for my next project. I'm not sure where to start.",
-        "I don't know how to code. Can you teach me?",
-        "I need to create a recipe for my guests tonight. I only have 40min to cook. What should I make?"
-    ]
-    return SandBoxChatGPTExamplesResponse(
-        example_names=["Homework Help", "Project Inspiration", "Learn to Code", "Cooking Recipe"],
-        examples=examples,  
-    )
+    return PRERENDERED_EXAMPLES_RESPONSE.get_response(request)
 
 
+@docstring_parameter(MESSAGES_TO_LOAD_FROM_HISTORY)
 def load_sandbox_chat_history(user_uuid: UUID, conversation_uuid: UUID) -> GPTChatHistory:
     """
-    Load the chat history for a sandbox-chatgpt session.
+    Load the rolling summary and the most recent messages of a sandbox-chatgpt conversation.
+
+    The chat history is served from the conversation cache when the previous turn was
+    handled by the same container. Otherwise the messages are loaded with a single query
+    for the last {0} messages of the conversation that are not covered by the summary.
+    A cached chat history that is stale is caught by the version check when it is saved.
+
+    Args:
+        user_uuid: The UUID of the user.
+        conversation_uuid: A unique identifier for the conversation (generated by the client)
+
+    Returns:
+        chat_history: Chat history for a sandbox-chatgpt session.
+    """
+    cached_chat_history = conversation_cache.get(get_sandbox_conversation_key(str(user_uuid), str(conversation_uuid)))
+    if cached_chat_history is not None:
+        return cached_chat_history
+    try:
+        conversation_model = SandboxConversationTableModel.get(str(user_uuid), str(conversation_uuid))
+    except SandboxConversationTableModel.DoesNotExist:
+        conversation_model = None
+    chat_history = GPTChatHistory(conversation_uuid=conversation_uuid)
+    if conversation_model:
+        chat_history = get_chat_history_from_conversation_model(conversation_model, chat_history)
+    conversation_key = get_sandbox_conversation_key(str(user_uuid), str(conversation_uuid))
+    message_models = list(SandboxChatMessageTableModel.query(
+        conversation_key,
+        SandboxChatMessageTableModel.message_index >= chat_history.summarized_through_index,
+        scan_index_forward=False,
+        limit=MESSAGES_TO_LOAD_FROM_HISTORY,
+    ))
+    if not message_models:
+        if conversation_model is None:
+            return migrate_legacy_sandbox_chat_history(user_uuid, conversation_uuid)
+        return chat_history
+    message_models.reverse()
+    chat_history = chat_history.copy(update=dict(
+        messages=tuple(get_chat_from_message_model(model) for model in message_models),
+        next_message_index=max(chat_history.next_message_index, message_models[-1].message_index + 1),
+        cumulative_token_count=max(chat_history.cumulative_token_count, message_models[-1].cumulative_token_count),
+    ))
+    cache_sandbox_chat_history(user_uuid, chat_history)
+    return chat_history
+
+
+def get_chat_history_from_conversation_model(
+    conversation_model: SandboxConversationTableModel,
+    chat_history: GPTChatHistory,
+) -> GPTChatHistory:
+    """Update a chat history with the totals, summary and version stored in the conversation index."""
+    return chat_history.copy(update=dict(
+        next_message_index=conversation_model.message_count or 0,
+        cumulative_token_count=conversation_model.token_count or 0,
+        summary=conversation_model.summary or "",
+        summary_token_count=conversation_model.summary_token_count or 0,
+        summarized_through_index=conversation_model.summarized_through_index or 0,
+        version=conversation_model.version,
+    ))
+
+
+def get_chat_from_message_model(model: SandboxChatMessageTableModel) -> GPTTurboChat:
+    """Get the chat message stored in a message item."""
+    role, content = model.get_role_and_content()
+    return GPTTurboChat(role=role, content=content, token_count=model.token_count)
+
+
+def migrate_legacy_sandbox_chat_history(user_uuid: UUID, conversation_uuid: UUID) -> GPTChatHistory:
+    """
+    Migrate a conversation stored in the user data table to individual message items.
+
+    Conversations used to be rewritten as a whole into the sandbox_chat_history attribute
+    of the user data table on every turn. If that conversation is the one being continued,
+    its messages are appended as message items so the conversation carries on.
 
     Args:
+        user_uuid: The UUID of the user.
         conversation_uuid: A unique identifier for the conversation (generated by the client)
 
     Returns:
         chat_history: Chat history for a sandbox-chatgpt session.
     """
+    chat_history = GPTChatHistory(conversation_uuid=conversation_uuid)
     user_data_table_model = UserDataTableModel.get(str(user_uuid))
-    chat_history: Dict[str, Any] = user_data_table_model.sandbox_chat_history
-    if chat_history:
-        chat_history = GPTChatHistory(**chat_history)
-        if chat_history.conversation_uuid == conversation_uuid:
-            return chat_history
-    return GPTChatHistory(conversation_uuid=conversation_uuid)
+    legacy_chat_history: Dict[str, Any] = user_data_table_model.sandbox_chat_history
+    if not legacy_chat_history:
+        return chat_history
+    legacy_chat_history = GPTChatHistory(**legacy_chat_history)
+    if legacy_chat_history.conversation_uuid != conversation_uuid:
+        return chat_history
+    return append_sandbox_chat_messages(user_uuid, chat_history, legacy_chat_history.messages)
+
+
+def encode_page_cursor(last_evaluated_key: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Encode the last evaluated key of a query into an opaque cursor for the client."""
+    if not last_evaluated_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode()).decode()
+
 
-def save_sandbox_chat_history(user_uuid: UUID, sandbox_chat_history: GPTChatHistory) -> None:
+def decode_page_cursor(cursor: Optional[str], partition_key_name: str, partition_key: str) -> Optional[Dict[str, Any]]:
     """
-    Save the chat history for a sandbox-chatgpt session.
+    Decode a cursor into the key to start a query from.
 
     Args:
-        chat_session: Chat history for a sandbox-chatgpt session.
-    """
-    chat_dict = sandbox_chat_history.dict()
-    chat_dict["conversation_uuid"] = str(sandbox_chat_history.conversation_uuid)
-    user_data_model: UserDataTableModel = UserDataTableModel.get(str(user_uuid))
-    user_data_model.update(actions=[
-            UserDataTableModel.sandbox_chat_history.set(chat_dict),
-        ]
+        cursor: The cursor returned with the previous page.
+        partition_key_name: The name of the partition key attribute of the queried table or index.
+        partition_key: The partition key being queried, cursors for other partitions are rejected.
+
+    Returns:
+        exclusive_start_key: The key to start the query after or None to start from the beginning.
+    """
+    if not cursor:
+        return None
+    try:
+        exclusive_start_key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        is_valid = exclusive_start_key[partition_key_name] == {"S": partition_key}
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        is_valid = False
+    if not is_valid:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+    return exclusive_start_key
+
+
+def get_conversation_title(messages: tuple[GPTTurboChat, ...]) -> Optional[str]:
+    """Get the title of a conversation from the first non empty user message."""
+    for message in messages:
+        if message.role == Role.USER.value and message.content.strip():
+            title = " ".join(message.content.split())
+            if len(title) > CONVERSATION_TITLE_MAX_LENGTH:
+                title = title[:CONVERSATION_TITLE_MAX_LENGTH - 3].rstrip() + "..."
+            return title
+    return None
+
+
+def is_conditional_check_failure(error: UpdateError) -> bool:
+    """Return whether an update failed because its condition was not met."""
+    return error.cause_response_code == "ConditionalCheckFailedException"
+
+
+def get_versioned_conversation_model(user_uuid: UUID, chat_history: GPTChatHistory) -> SandboxConversationTableModel:
+    """Get a conversation index item to update, updates are conditional on the version read with the chat history."""
+    conversation_model = SandboxConversationTableModel(str(user_uuid), str(chat_history.conversation_uuid))
+    # a missing version makes the update conditional on the item not having a version yet
+    if chat_history.version is not None:
+        conversation_model.version = chat_history.version
+    return conversation_model
+
+
+def reserve_sandbox_chat_messages(
+    user_uuid: UUID,
+    chat_history: GPTChatHistory,
+    new_messages: tuple[GPTTurboChat, ...],
+) -> GPTChatHistory:
+    """
+    Reserve the indexes of new messages in the conversation index.
+
+    The totals of the conversation are updated with a single update that is conditional
+    on the version read with the chat history, so a concurrent turn from another tab
+    cannot claim the same message indexes. The item is created on the first turn and
+    the title is only set once from the first user message.
+
+    Args:
+        user_uuid: The UUID of the user.
+        chat_history: The chat history the messages are appended to.
+        new_messages: The messages to append.
+
+    Returns:
+        chat_history: The chat history with the new version of the conversation index.
+
+    Raises:
+        UpdateError: If the conversation was updated since the chat history was read.
+    """
+    new_token_count = sum(message.token_count for message in new_messages)
+    actions = [
+        SandboxConversationTableModel.last_updated.set(datetime.utcnow()),
+        SandboxConversationTableModel.token_count.set(chat_history.cumulative_token_count + new_token_count),
+        SandboxConversationTableModel.message_count.set(chat_history.next_message_index + len(new_messages)),
+    ]
+    # every turn pushes back the expiry of an idle conversation within the same update
+    conversation_expiry = get_expiry(ttl_policy_settings.conversation_ttl_days)
+    if conversation_expiry:
+        actions.append(SandboxConversationTableModel.expires.set(conversation_expiry))
+    title = get_conversation_title(new_messages)
+    if title:
+        actions.append(SandboxConversationTableModel.title.set(SandboxConversationTableModel.title | title))
+    conversation_model = get_versioned_conversation_model(user_uuid, chat_history)
+    conversation_model.update(actions=actions)
+    return chat_history.copy(update=dict(version=conversation_model.version))
+
+
+def merge_concurrent_sandbox_chat_update(user_uuid: UUID, chat_history: GPTChatHistory) -> GPTChatHistory:
+    """
+    Rebase a chat history on the latest state of its conversation after a concurrent update.
+
+    The messages added by the other turn are kept, the new messages are appended after
+    them, so only the totals, summary and version need to be read again.
+
+    Args:
+        user_uuid: The UUID of the user.
+        chat_history: The chat history that failed to be saved.
+
+    Returns:
+        chat_history: The chat history rebased on the latest conversation index item.
+    """
+    conversation_model = SandboxConversationTableModel.get(
+        str(user_uuid),
+        str(chat_history.conversation_uuid),
+        consistent_read=True,
+    )
+    return get_chat_history_from_conversation_model(conversation_model, chat_history)
+
+
+def append_sandbox_chat_messages(
+    user_uuid: UUID,
+    chat_history: GPTChatHistory,
+    new_messages: tuple[GPTTurboChat, ...],
+) -> GPTChatHistory:
+    """
+    Append messages to a sandbox-chatgpt conversation.
+
+    Each message is stored as its own item so the cost of a turn does not grow with the
+    length of the conversation. The message indexes are reserved with a conditional update
+    of the conversation index, then all messages of the turn are written in a single batch.
+    If another turn was saved in the meantime, the chat history is rebased on it and the
+    reservation retried, so concurrent turns are both kept instead of the last one winning.
+    The saved chat history is written through to the conversation cache, unless it was
+    rebased as its messages then miss those of the other turn.
+
+    Args:
+        user_uuid: The UUID of the user.
+        chat_history: The chat history the messages are appended to.
+        new_messages: The messages to append.
+
+    Returns:
+        chat_history: The chat history with the messages appended.
+    """
+    is_merged = False
+    for attempt in range(1, MAX_SAVE_ATTEMPTS + 1):
+        try:
+            reserved_chat_history = reserve_sandbox_chat_messages(user_uuid, chat_history, new_messages)
+            break
+        except UpdateError as e:
+            if not is_conditional_check_failure(e):
+                raise
+            # the chat history the turn started from is stale, whether it came from the cache or not
+            invalidate_cached_sandbox_chat_history(user_uuid, chat_history.conversation_uuid)
+            if attempt == MAX_SAVE_ATTEMPTS:
+                raise
+            logger.info("conversation %s was updated concurrently, merging and retrying", chat_history.conversation_uuid)
+            chat_history = merge_concurrent_sandbox_chat_update(user_uuid, chat_history)
+            is_merged = True
+    conversation_key = get_sandbox_conversation_key(str(user_uuid), str(chat_history.conversation_uuid))
+    message_index = chat_history.next_message_index
+    cumulative_token_count = chat_history.cumulative_token_count
+    message_expiry = get_expiry(ttl_policy_settings.conversation_ttl_days)
+    with SandboxChatMessageTableModel.batch_write() as batch:
+        for message in new_messages:
+            cumulative_token_count += message.token_count
+            batch.save(SandboxChatMessageTableModel.from_message(
+                conversation_key,
+                message_index,
+                role=message.role,
+                content=message.content,
+                token_count=message.token_count,
+                cumulative_token_count=cumulative_token_count,
+                expires=message_expiry,
+            ))
+            message_index += 1
+    chat_history = reserved_chat_history.copy(update=dict(
+        messages=chat_history.messages + tuple(new_messages),
+        next_message_index=message_index,
+        cumulative_token_count=cumulative_token_count,
+    ))
+    if not is_merged:
+        cache_sandbox_chat_history(user_uuid, chat_history)
+    return chat_history
+
+
+@docstring_parameter(COMPACTION_THRESHOLD_TOKEN_COUNT, MESSAGES_KEPT_AFTER_COMPACTION)
+def compact_sandbox_chat_history(user_uuid: UUID, chat_history: GPTChatHistory) -> GPTChatHistory:
+    """
+    Condense the older messages of a conversation into its rolling summary.
+
+    Once the messages not covered by the summary exceed {0} tokens, all but the
+    last {1} messages are folded into the summary with a single request and the
+    summary is stored on the conversation. Later turns reuse the stored summary and
+    only load the messages after it, so the prompt stays bounded without dropping
+    context. The request is charged to the user like any other request.
+
+    Args:
+        user_uuid: The UUID of the user.
+        chat_history: The chat history loaded for the turn.
+
+    Returns:
+        chat_history: The chat history with the older messages replaced by the summary.
+
+    Raises:
+        TokensExhaustedException: If the user does not have enough tokens to compact the conversation.
+    """
+    history_token_count = sum(message.token_count for message in chat_history.messages)
+    if history_token_count <= COMPACTION_THRESHOLD_TOKEN_COUNT or len(chat_history.messages) <= MESSAGES_KEPT_AFTER_COMPACTION:
+        return chat_history
+    messages_to_summarize = chat_history.messages[:-MESSAGES_KEPT_AFTER_COMPACTION]
+    recent_messages = chat_history.messages[-MESSAGES_KEPT_AFTER_COMPACTION:]
+    transcript = "\n".join(f"{message.role}: {message.content}" for message in messages_to_summarize)
+    if chat_history.summary:
+        transcript = f"Current summary:\n{chat_history.summary}\n\nNewer messages:\n{transcript}"
+    summary_session = get_gpt_turbo_response(
+        system_prompt=COMPACTION_SYSTEM_PROMPT,
+        chat_session=GPTTurboChatSession(messages=(GPTTurboChat(role=Role.USER, content=transcript),)),
+        temperature=0.2,
+        uuid=user_uuid,
+        max_tokens=SUMMARY_MAX_TOKEN_COUNT,
     )
+    summary_message = summary_session.messages[-1]
+    summarized_through_index = chat_history.next_message_index - len(recent_messages)
+    logger.info("compacted messages before %s into a %s token summary", summarized_through_index, summary_message.token_count)
+    compacted_chat_history = chat_history.copy(update=dict(
+        messages=recent_messages,
+        summary=summary_message.content,
+        summary_token_count=summary_message.token_count,
+        summarized_through_index=summarized_through_index,
+    ))
+    conversation_model = get_versioned_conversation_model(user_uuid, chat_history)
+    try:
+        conversation_model.update(actions=[
+            SandboxConversationTableModel.summary.set(summary_message.content),
+            SandboxConversationTableModel.summary_token_count.set(summary_message.token_count),
+            SandboxConversationTableModel.summarized_through_index.set(summarized_through_index),
+        ])
+    except UpdateError as e:
+        if not is_conditional_check_failure(e):
+            raise
+        # another turn updated the conversation, the summary is still used for this turn
+        logger.info("conversation %s was updated concurrently, summary not stored", chat_history.conversation_uuid)
+        return compacted_chat_history
+    return compacted_chat_history.copy(update=dict(version=conversation_model.version))
+
+
+@docstring_parameter(RETRIEVAL_CANDIDATE_MESSAGE_COUNT)
+def load_earlier_sandbox_chat_turns(user_uuid: UUID, chat_history: GPTChatHistory) -> list[tuple[GPTTurboChat, ...]]:
+    """
+    Load the turns of a conversation that come before the messages in the chat history.
+
+    The last {0} earlier messages are cached per conversation. A later turn of the same
+    conversation only queries the messages that left the chat history since, and the
+    messages are only all queried again when the chat history starts before the cached
+    ones (e.g. it was loaded by another container).
+
+    Args:
+        user_uuid: The UUID of the user.
+        chat_history: The chat history loaded for the turn.
+
+    Returns:
+        turns: The earlier turns in chronological order, each a user message and the replies to it.
+    """
+    first_loaded_message_index = chat_history.next_message_index - len(chat_history.messages)
+    if first_loaded_message_index <= 0:
+        return []
+    conversation_key = get_sandbox_conversation_key(str(user_uuid), str(chat_history.conversation_uuid))
+    earlier_messages = earlier_messages_cache.get(conversation_key)
+    if earlier_messages is None or first_loaded_message_index < earlier_messages.through_index:
+        # the cached messages may overlap the chat history, the entry is removed as a lower version would not replace it
+        earlier_messages_cache.invalidate(conversation_key)
+        earlier_messages = EarlierSandboxChatMessages((), 0)
+    if first_loaded_message_index > earlier_messages.through_index:
+        message_models = list(SandboxChatMessageTableModel.query(
+            conversation_key,
+            SandboxChatMessageTableModel.message_index.between(earlier_messages.through_index, first_loaded_message_index - 1),
+            scan_index_forward=False,
+            limit=RETRIEVAL_CANDIDATE_MESSAGE_COUNT,
+        ))
+        message_models.reverse()
+        earlier_messages = EarlierSandboxChatMessages(
+            messages=(earlier_messages.messages + tuple(get_chat_from_message_model(model) for model in message_models))[-RETRIEVAL_CANDIDATE_MESSAGE_COUNT:],
+            through_index=first_loaded_message_index,
+        )
+        earlier_messages_cache.put(conversation_key, earlier_messages, version=first_loaded_message_index)
+    turns: list[list[GPTTurboChat]] = []
+    for chat in earlier_messages.messages:
+        if chat.role == Role.USER.value or not turns:
+            turns.append([])
+        turns[-1].append(chat)
+    return [tuple(turn) for turn in turns]
+
+
+@docstring_parameter(RETRIEVED_TURNS_MAX, RETRIEVAL_TOKEN_BUDGET)
+def retrieve_relevant_sandbox_chat_messages(
+    user_uuid: UUID,
+    chat_history: GPTChatHistory,
+    user_message: str,
+) -> tuple[GPTTurboChat, ...]:
+    """
+    Retrieve the earlier messages of a conversation that are relevant to the new user message.
+
+    The earlier turns are ranked with BM25 against the new user message and up to {0}
+    of the best matching turns are kept within {1} tokens. This brings back facts
+    that were truncated or condensed into the summary without sending the whole history.
+
+    Args:
+        user_uuid: The UUID of the user.
+        chat_history: The chat history loaded for the turn.
+        user_message: The new user message.
+
+    Returns:
+        messages: The messages of the relevant turns in chronological order.
+    """
+    if not user_message.strip():
+        return ()
+    turns = load_earlier_sandbox_chat_turns(user_uuid, chat_history)
+    if not turns:
+        return ()
+    turn_indexes = select_relevant_turns(
+        turn_texts=["\n".join(message.content for message in turn) for turn in turns],
+        turn_token_counts=[sum(message.token_count for message in turn) for turn in turns],
+        query=user_message,
+        token_budget=RETRIEVAL_TOKEN_BUDGET,
+        max_turns=RETRIEVED_TURNS_MAX,
+    )
+    logger.info("retrieved %s of %s earlier turns", len(turn_indexes), len(turns))
+    return tuple(message for turn_index in turn_indexes for message in turns[turn_index])
+
+
+def get_system_prompt(chat_history: GPTChatHistory, relevant_messages: tuple[GPTTurboChat, ...] = ()) -> str:
+    """Get the system prompt for a turn, including the rolling summary and the relevant earlier messages if there are any."""
+    system_prompt = SYSTEM_PROMPT
+    if chat_history.summary:
+        system_prompt += f"\n\nSummary of the earlier conversation with the user:\n{chat_history.summary}"
+    if relevant_messages:
+        transcript = "\n".join(f"{message.role}: {message.content}" for message in relevant_messages)
+        system_prompt += f"\n\nEarlier messages of the conversation relevant to the user's last message:\n{transcript}"
+    return system_prompt
+
+
+def run_sandbox_chat_turn(
+    user_uuid: str,
+    chat_history: GPTChatHistory,
+    user_message: str,
+    on_chunk: Optional[Callable[[str], None]] = None,
+) -> tuple[GPTChatHistory, str]:
+    """
+    Run a turn of a sandbox-chatgpt conversation and save it.
+
+    Args:
+        user_uuid: The UUID of the user.
+        chat_history: The chat history of the conversation.
+        user_message: The new user message.
+        on_chunk: Called with every chunk of the response as it is received, the response
+            is streamed if provided.
+
+    Returns:
+        chat_history: The chat history with the turn appended.
+        gpt_response: The response to the user message.
+
+    Raises:
+        TokensExhaustedException: If the user does not have enough tokens for the turn.
+    """
+    chat_history = compact_sandbox_chat_history(user_uuid=user_uuid, chat_history=chat_history)
+    relevant_messages = retrieve_relevant_sandbox_chat_messages(
+        user_uuid=user_uuid,
+        chat_history=chat_history,
+        user_message=user_message,
+    )
+    chat_session = GPTTurboChatSession(messages=chat_history.messages)
+    chat_session = chat_session.add_message(GPTTurboChat(role=Role.USER, content=user_message))
+    response_kwargs = dict(
+        system_prompt=get_system_prompt(chat_history, relevant_messages),
+        chat_session=chat_session,
+        frequency_penalty=0.9,
+        presence_penalty=0.5,
+        temperature=0.9,
+        uuid=user_uuid,
+        max_tokens=400,
+        override_model_context_window=1300,
+    )
+    if on_chunk:
+        chat_session = stream_gpt_turbo_response(on_chunk=on_chunk, **response_kwargs)
+    else:
+        chat_session = get_gpt_turbo_response(**response_kwargs)
+    logger.info("chat_session after response: %s", chat_session)
+    # the user message and the response are the only messages added during the turn
+    chat_history = append_sandbox_chat_messages(user_uuid=user_uuid, chat_history=chat_history, new_messages=chat_session.messages[-2:])
+    return chat_history, chat_session.messages[-1].content
 
 
 @router.post(f"/{ENDPOINT_NAME}", response_model=SandBoxChatGPTResponse, responses=error_responses)
@@ -156,92 +765,95 @@ def sandbox_chatgpt(sandbox_chatgpt_request: SandBoxChatGPTRequest, request: Req
     """
     uuid = request.headers.get(UUID_HEADER_NAME)
     logger.info("uuid: %s", uuid)
-    chat_session = load_sandbox_chat_history(user_uuid=uuid, conversation_uuid=sandbox_chatgpt_request.conversation_uuid)
-    logger.info("chat_session before response: %s", chat_session)
-    chat_session = chat_session.add_message(GPTTurboChat(role=Role.USER, content=sandbox_chatgpt_request.user_message))
+    chat_history = load_sandbox_chat_history(user_uuid=uuid, conversation_uuid=sandbox_chatgpt_request.conversation_uuid)
+    logger.info("chat_session before response: %s", chat_history)
     try:
-        chat_session = get_gpt_turbo_response(
-            system_prompt=SYSTEM_PROMPT,
-            chat_session=chat_session,
-            frequency_penalty=0.9,
-            presence_penalty=0.5,
-            temperature=0.9,
-            uuid=uuid,
-            max_tokens=400,
-            override_model_context_window=1300,
-        )
+        _, gpt_response = run_sandbox_chat_turn(uuid, chat_history, sandbox_chatgpt_request.user_message)
     except TokensExhaustedException as e:
         if e.login:
             return TOKENS_EXHAUSTED_LOGIN_JSON_RESPONSE
         return TOKENS_EXHAUSTED_FOR_DAY_JSON_RESPONSE
-    logger.info("chat_session after response: %s", chat_session)
-    chat_history = GPTChatHistory(**chat_session.dict(), conversation_uuid=sandbox_chatgpt_request.conversation_uuid)
-    save_sandbox_chat_history(user_uuid=uuid, sandbox_chat_history=chat_history)
-
-    latest_gpt_chat_model = chat_session.messages[-1]
-    latest_message = latest_gpt_chat_model.content
-    return SandBoxChatGPTResponse(gpt_response=latest_message)
-
-
-
-
-
-
-
-# async def get_gpt_turbo_response_stream(
-#     system_prompt: str,
-#     chat_session: GPTTurboChatSession,
-#     temperature: float = 0.9,
-#     frequency_penalty: float = 0.0,
-#     presence_penalty: float = 0.0,
-#     stream: bool = False,
-#     uuid: str = "",
-#     max_tokens: int = 400,
-# ):
-#     # ... (same code as before, up to the response creation)
-
-#     response = openai.ChatCompletion.create(
-#         model=GPT_MODEL,
-#         messages=prompt_messages,
-#         temperature=temperature,
-#         frequency_penalty=frequency_penalty,
-#         presence_penalty=presence_penalty,
-#         stream=stream,
-#         user=uuid,
-#         max_tokens=max_tokens,
-#     )
-
-#     async for message in response.iter_chunks():
-#         yield message
-# ```
-
-# 3. Update the WebSocket route to forward the events to the user:
-
-# ```python
-# @app.websocket("/ws/{conversation_id}")
-# async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
-#     await websocket.accept()
-
-#     while True:
-#         user_message = await websocket.receive_text()
-#         uuid = websocket.headers.get(UUID_HEADER_NAME)
-
-#         chat_session = load_sandbox_chat_history(user_uuid=uuid, conversation_uuid=conversation_id)
-#         chat_session = chat_session.add_message(GPTTurboChat(role=Role.USER, content=user_message))
-
-#         try:
-#             response_stream = get_gpt_turbo_response_stream(
-#                 system_prompt=SYSTEM_PROMPT,
-#                 chat_session=chat_session,
-#                 frequency_penalty=0.9,
-#                 temperature=0.9,
-#                 uuid=uuid,
-#                 max_tokens=400
-#             )
-            
-#             async for message in response_stream:
-#                 await websocket.send_text(message)
-
-#         except TokensExhaustedException:
-#             await websocket.send_text(TOKEN_EXHAUSTED_JSON_RESPONSE)
-#             continue
\ No newline at end of file
+    return SandBoxChatGPTResponse(gpt_response=gpt_response)
+
+
+@router.get(f"/{ENDPOINT_NAME}-{CONVERSATIONS_ENDPOINT_POSTFIX}", response_model=SandBoxConversationsResponse, responses=error_responses)
+def sandbox_chatgpt_conversations(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+) -> SandBoxConversationsResponse:
+    """
+    Get the sandbox-chatgpt conversations of the user, most recently updated first.
+
+    Only the conversation index is read, the messages of the conversations are not loaded.
+
+    Args:
+        limit: The maximum number of conversations to return.
+        cursor: The cursor returned with the previous page.
+
+    Returns:
+        conversations: A page of conversations and the cursor of the next page.
+    """
+    uuid = request.headers.get(UUID_HEADER_NAME)
+    partition_key_name = SandboxConversationTableModel.user_uuid.attr_name
+    conversation_models = SandboxConversationTableModel.last_updated_index.query(
+        uuid,
+        scan_index_forward=False,
+        limit=limit,
+        last_evaluated_key=decode_page_cursor(cursor, partition_key_name, uuid),
+    )
+    conversations = [
+        SandBoxConversationSummary(
+            conversation_uuid=model.conversation_uuid,
+            title=model.title or "",
+            last_updated=model.last_updated,
+            token_count=model.token_count,
+            message_count=model.message_count,
+        )
+        for model in conversation_models
+    ]
+    return SandBoxConversationsResponse(
+        conversations=conversations,
+        next_cursor=encode_page_cursor(conversation_models.last_evaluated_key),
+    )
+
+
+@router.get(
+    f"/{ENDPOINT_NAME}-{CONVERSATIONS_ENDPOINT_POSTFIX}/{{conversation_uuid}}/messages",
+    response_model=SandBoxConversationMessagesResponse,
+    responses=error_responses,
+)
+def sandbox_chatgpt_conversation_messages(
+    conversation_uuid: UUID,
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+) -> SandBoxConversationMessagesResponse:
+    """
+    Get the messages of a sandbox-chatgpt conversation, most recent first.
+
+    Args:
+        conversation_uuid: A unique identifier for the conversation.
+        limit: The maximum number of messages to return.
+        cursor: The cursor returned with the previous page.
+
+    Returns:
+        messages: A page of messages and the cursor of the next page.
+    """
+    uuid = request.headers.get(UUID_HEADER_NAME)
+    conversation_key = get_sandbox_conversation_key(uuid, str(conversation_uuid))
+    partition_key_name = SandboxChatMessageTableModel.conversation_key.attr_name
+    message_models = SandboxChatMessageTableModel.query(
+        conversation_key,
+        scan_index_forward=False,
+        limit=limit,
+        last_evaluated_key=decode_page_cursor(cursor, partition_key_name, conversation_key),
+    )
+    messages = []
+    for model in message_models:
+        role, content = model.get_role_and_content()
+        messages.append(SandBoxChatMessage(message_index=model.message_index, role=role, content=content))
+    return SandBoxConversationMessagesResponse(
+        messages=messages,
+        next_cursor=encode_page_cursor(message_models.last_evaluated_key),
+    )
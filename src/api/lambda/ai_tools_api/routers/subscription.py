@@ -2,10 +2,10 @@
 from loguru import logger
 import sys
 from pathlib import Path
-from fastapi import APIRouter, Request, Response, status
+from fastapi import APIRouter, HTTPException, Request, Response, status
 from email_validator import validate_email, EmailNotValidError
 from pydantic import validator
-from pynamodb.models import Model
+from pynamodb.exceptions import UpdateError
 
 router = APIRouter()
 
@@ -19,7 +19,7 @@ from utils import (
     AIToolsEndpointName,
     UUID_HEADER_NAME,
 )
-from dynamodb_models import UserDataTableModel
+from dynamodb_models import SUBSCRIBED_STATUS, UserDataTableModel
 
 ENDPOINT_NAME = "subscription"
 
@@ -60,13 +60,22 @@ def subscription(request: Request, response: Response, subscription_request: Sub
     This method is used to record user subscriptions for the AI tools. This method 
     returns an empty response with a 200 status code if the subscription is logged 
     successfully.
+
+    The subscription is written with a single update, conditional on the user existing,
+    and adds the user to the subscribers index. Subscribed users do not expire.
     """
     uuid = request.headers.get(UUID_HEADER_NAME)
     logger.info(f"Received request from user {uuid} for {ENDPOINT_NAME} endpoint.")
     action_list = [
         UserDataTableModel.email_address.set(subscription_request.email_address),
         UserDataTableModel.is_subscribed.set(True),
+        UserDataTableModel.subscription_status.set(SUBSCRIBED_STATUS),
+        UserDataTableModel.expires.remove(),
     ]
-    user_data_model: UserDataTableModel = UserDataTableModel.get(uuid)
-    user_data_model.update(actions=action_list)
+    try:
+        UserDataTableModel(uuid).update(actions=action_list, condition=UserDataTableModel.UUID.exists())
+    except UpdateError as e:
+        if e.cause_response_code != "ConditionalCheckFailedException":
+            raise
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.") from e
     return {}
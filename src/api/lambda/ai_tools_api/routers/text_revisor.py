@@ -1,5 +1,6 @@
 import logging
 import os
+from functools import partial
 from pathlib import Path
 import sys
 from typing import List, Optional
@@ -9,7 +10,16 @@ from pydantic import conint, constr, Field
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../utils"))
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../gpt_turbo"))
 sys.path.append(Path(__file__).parent / "../text_examples")
-from gpt_turbo import GPTTurboChatSession, GPTTurboChat, Role, get_gpt_turbo_response
+from gpt_turbo import (
+    GPTTurboChatSession,
+    GPTTurboChat,
+    Role,
+    get_gpt_turbo_response,
+    charge_user_for_shared_chat_session,
+    count_tokens,
+)
+from example_outputs import get_example_output_response
+from single_flight import SingleFlight
 from text_examples import SPELLING_ERRORS_EXAMPLE, BADLY_WRITTEN_TRAVEL_BLOG, ARTICLE_EXAMPLE
 from utils import (
     AIToolModel,
@@ -28,9 +38,14 @@ from utils import (
     TOKENS_EXHAUSTED_LOGIN_JSON_RESPONSE,
     TOKENS_EXHAUSTED_FOR_DAY_JSON_RESPONSE,
     TokensExhaustedException,
+    get_canonical_request_hash,
+    PrerenderedResponse,
 )
 
 MAX_TOKENS_FROM_GPT_RESPONSE = 2000
+# revisions are close to a 1:1 ratio with the original text, the extra covers revisions that embellish the text
+EXPECTED_REVISION_TO_TEXT_TOKEN_RATIO = 1.3
+EXPECTED_REVISION_EXTRA_TOKENS = 50
 
 
 class RevisionType(str, Enum):
@@ -46,6 +61,7 @@ logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
 router = APIRouter()
+single_flight = SingleFlight()
 ENDPOINT_NAME = AIToolsEndpointName.TEXT_REVISOR.value
 
 AI_PURPOSE = " ".join(ENDPOINT_NAME.split("-")).lower()
@@ -124,15 +140,9 @@ class TextRevisorExamplesResponse(ExamplesResponse):
     examples: list[TextRevisorRequest]
 
 
-@router.get(f"/{ENDPOINT_NAME}-{EXAMPLES_ENDPOINT_POSTFIX}", response_model=TextRevisorExamplesResponse, responses=error_responses)
-async def text_revisor_examples():
-    """
-    **Get examples for the {0} endpoint.**
-
-    This method returns examples for the {0} endpoint. These examples can be posted to the {0} endpoint
-    without modification.
-    """
-    text_revisor_examples = [
+EXAMPLES_RESPONSE = TextRevisorExamplesResponse(
+    example_names=["Badly Written", "Spelling Errors", "Word Choice"],
+    examples=[
         TextRevisorRequest(
             text_to_revise=BADLY_WRITTEN_TRAVEL_BLOG,
             revision_types=[RevisionType.SPELLING, RevisionType.GRAMMAR, RevisionType.SENTENCE_STRUCTURE, RevisionType.WORD_CHOICE, RevisionType.CONSISTENCY, RevisionType.PUNCTUATION],
@@ -151,37 +161,56 @@ async def text_revisor_examples():
             tone=Tone.ENCOURAGING,
             creativity=50,
         ),
-    ]
-    example_response = TextRevisorExamplesResponse(
-        example_names=["Badly Written", "Spelling Errors", "Word Choice"],
-        examples=text_revisor_examples,
-    )
-    return example_response
+    ],
+)
+PRERENDERED_EXAMPLES_RESPONSE = PrerenderedResponse(EXAMPLES_RESPONSE)
+
+
+@router.get(f"/{ENDPOINT_NAME}-{EXAMPLES_ENDPOINT_POSTFIX}", response_model=TextRevisorExamplesResponse, responses=error_responses)
+async def text_revisor_examples(request: Request):
+    """
+    **Get examples for the {0} endpoint.**
+
+    This method returns examples for the {0} endpoint. These examples can be posted to the {0} endpoint
+    without modification.
+    """
+    return PRERENDERED_EXAMPLES_RESPONSE.get_response(request)
 
 
 @router.post(f"/{ENDPOINT_NAME}", response_model=TextRevisorResponse, status_code=status.HTTP_200_OK)
 async def text_revisor(text_revision_request: TextRevisorRequest, request: Request, response: Response):
     """**Revises text using GPT-3.**"""
     logger.info(f"Received request for {ENDPOINT_NAME} endpoint.")
+    uuid = request.headers.get(UUID_HEADER_NAME)
+    example_output_response = get_example_output_response(ENDPOINT_NAME, text_revision_request, uuid, TextRevisorResponse)
+    if example_output_response is not None:
+        return example_output_response
     user_prompt = append_field_prompts_to_prompt(TextRevisorInstructions(**text_revision_request.dict()), BASE_USER_PROMPT_PREFIX)
 
     user_prompt += f"\nHere is the text that I want you to revise for me: {text_revision_request.text_to_revise}"
-    uuid = request.headers.get(UUID_HEADER_NAME)
     user_chat = GPTTurboChat(
         role=Role.USER,
         content=user_prompt
     )
     temperature = 0.2 + (0.7 * (text_revision_request.creativity / 100))
+    get_response = partial(
+        get_gpt_turbo_response,
+        system_prompt=SYSTEM_PROMPT,
+        chat_session=GPTTurboChatSession(messages=[user_chat]),
+        frequency_penalty=0.0,
+        presence_penalty=0.0,
+        temperature=temperature,
+        uuid=uuid,
+        max_tokens=MAX_TOKENS_FROM_GPT_RESPONSE,
+        expected_response_token_count=int(
+            count_tokens(text_revision_request.text_to_revise) * EXPECTED_REVISION_TO_TEXT_TOKEN_RATIO
+        ) + EXPECTED_REVISION_EXTRA_TOKENS,
+    )
+    request_hash = get_canonical_request_hash(ENDPOINT_NAME, text_revision_request)
     try:
-        chat_session = get_gpt_turbo_response(
-            system_prompt=SYSTEM_PROMPT,
-            chat_session=GPTTurboChatSession(messages=[user_chat]),
-            frequency_penalty=0.0,
-            presence_penalty=0.0,
-            temperature=temperature,
-            uuid=uuid,
-            max_tokens=MAX_TOKENS_FROM_GPT_RESPONSE,
-        )
+        chat_session, leader_uuid = await single_flight.do(request_hash, get_response, caller=uuid)
+        if leader_uuid != uuid:
+            charge_user_for_shared_chat_session(uuid, chat_session)
     except TokensExhaustedException as e:
         if e.login:
             return TOKENS_EXHAUSTED_LOGIN_JSON_RESPONSE
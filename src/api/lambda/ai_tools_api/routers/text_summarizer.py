@@ -12,7 +12,9 @@ from pydantic import conint, Field
 
 
 sys.path.append(Path(__file__, "../").absolute())
-from gpt_turbo import GPTTurboChatSession, GPTTurboChat, Role, get_gpt_turbo_response
+from gpt_turbo import GPTTurboChatSession, GPTTurboChat, Role, get_gpt_turbo_response, count_tokens
+from example_outputs import get_example_output_response
+from extractive_compression import compress_text_to_token_budget
 from utils import (
     AIToolModel,
     BaseAIInstructionModel,
@@ -27,6 +29,7 @@ from utils import (
     TOKENS_EXHAUSTED_FOR_DAY_JSON_RESPONSE,
     TokensExhaustedException,
     AIToolResponse,
+    PrerenderedResponse,
     append_field_prompts_to_prompt,
 )
 from text_examples import CEO_EMAIL, ARTICLE_EXAMPLE, CONTRACT_EXAMPLE, TRANSCRIPT_EXAMPLE
@@ -38,6 +41,7 @@ logger.setLevel(logging.DEBUG)
 
 
 MAX_TOKENS_FROM_GPT_RESPONSE = 400
+MAX_TOKENS_FOR_TEXT_TO_SUMMARIZE = 2500
 
 ENDPOINT_NAME = "text-summarizer"
 
@@ -108,15 +112,45 @@ class TextSummarizerRequest(TextSummarizerInstructions):
         title="Text to Summarize",
         description="The text that you wanted summarized. (e.g. articles, notes, transcripts, etc.)",
     )
+    compress_long_text: Optional[bool] = Field(
+        default=True,
+        title="Compress Long Text",
+        description=(
+            "Whether or not to keep only the most important sentences of long texts before summarizing. "
+            f"This only applies to texts longer than {MAX_TOKENS_FOR_TEXT_TO_SUMMARIZE} tokens."
+        ),
+    )
+
+
+SUMMARY_SECTION_EXPECTED_TOKEN_COUNTS = {
+    SummarySectionLength.SHORT: 120,
+    SummarySectionLength.MEDIUM: 220,
+    SummarySectionLength.LONG: 350,
+}
+EXPECTED_TOKENS_PER_LIST_SECTION = 100
+
+
+def get_expected_response_token_count(text_summarizer_instructions: TextSummarizerInstructions) -> int:
+    """Get the expected token count of the summary from the requested sections."""
+    length_of_summary_section = text_summarizer_instructions.length_of_summary_section or SummarySectionLength.MEDIUM
+    expected_token_count = SUMMARY_SECTION_EXPECTED_TOKEN_COUNTS[length_of_summary_section]
+    if text_summarizer_instructions.bullet_points_section:
+        expected_token_count += EXPECTED_TOKENS_PER_LIST_SECTION
+    if text_summarizer_instructions.action_items_section:
+        expected_token_count += EXPECTED_TOKENS_PER_LIST_SECTION
+    return expected_token_count
+
+
+class TextSummarizerResponse(AIToolResponse):
+    tokens_saved_by_compression: int = 0
 
 class TextSummarizerExampleResponse(ExamplesResponse):
     examples: list[TextSummarizerRequest]
     
     
-@router.get(f"/{ENDPOINT_NAME}-{EXAMPLES_ENDPOINT_POSTFIX}", response_model=TextSummarizerExampleResponse, status_code=status.HTTP_200_OK)
-async def sandbox_chatgpt_examples() -> TextSummarizerExampleResponse:
-    """Return examples for the text summarizer endpoint."""
-    examples = [
+EXAMPLES_RESPONSE = TextSummarizerExampleResponse(
+    example_names=["Contract", "Transcript", "Article", "Email"],
+    examples=[
         TextSummarizerRequest(
             text_to_summarize=CONTRACT_EXAMPLE,
             length_of_summary_section=SummarySectionLength.SHORT,
@@ -141,23 +175,40 @@ async def sandbox_chatgpt_examples() -> TextSummarizerExampleResponse:
             bullet_points_section=True,
             action_items_section=True,
         ),
-    ]
-    response = TextSummarizerExampleResponse(
-        example_names=["Contract", "Transcript", "Article", "Email"],
-        examples=examples
-    )
-    return response
+    ],
+)
+PRERENDERED_EXAMPLES_RESPONSE = PrerenderedResponse(EXAMPLES_RESPONSE)
+
 
-@router.post(f"/{ENDPOINT_NAME}", response_model=AIToolResponse, responses=error_responses)
+@router.get(f"/{ENDPOINT_NAME}-{EXAMPLES_ENDPOINT_POSTFIX}", response_model=TextSummarizerExampleResponse, status_code=status.HTTP_200_OK)
+async def sandbox_chatgpt_examples(request: Request) -> Response:
+    """Return examples for the text summarizer endpoint."""
+    return PRERENDERED_EXAMPLES_RESPONSE.get_response(request)
+
+@router.post(f"/{ENDPOINT_NAME}", response_model=TextSummarizerResponse, responses=error_responses)
 async def text_summarizer(text_summarizer_request: TextSummarizerRequest, request: Request):
     """**Summarize text using GPT-3.**"""
     logger.info(f"Received request: {text_summarizer_request}")
+    uuid = request.headers.get(UUID_HEADER_NAME)
+    example_output_response = get_example_output_response(ENDPOINT_NAME, text_summarizer_request, uuid, TextSummarizerResponse)
+    if example_output_response is not None:
+        return example_output_response
     user_prompt = append_field_prompts_to_prompt(
         TextSummarizerInstructions(**text_summarizer_request.dict()),
         BASE_USER_PROMPT_PREFIX,
     )
-    user_prompt += f"\nHere's the text that i want you to summarize for me:\n{text_summarizer_request.text_to_summarize}"
-    uuid = request.headers.get(UUID_HEADER_NAME)
+    text_to_summarize = text_summarizer_request.text_to_summarize
+    tokens_saved_by_compression = 0
+    if text_summarizer_request.compress_long_text:
+        compression_result = compress_text_to_token_budget(
+            text_to_summarize,
+            MAX_TOKENS_FOR_TEXT_TO_SUMMARIZE,
+            count_tokens,
+        )
+        text_to_summarize = compression_result.text
+        tokens_saved_by_compression = compression_result.tokens_saved
+        logger.info(f"Extractive compression saved {tokens_saved_by_compression} tokens.")
+    user_prompt += f"\nHere's the text that i want you to summarize for me:\n{text_to_summarize}"
     user_chat = GPTTurboChat(
         role=Role.USER,
         content=user_prompt
@@ -170,7 +221,8 @@ async def text_summarizer(text_summarizer_request: TextSummarizerRequest, reques
             presence_penalty=0.5,
             temperature=0.3,
             uuid=uuid,
-            max_tokens=MAX_TOKENS_FROM_GPT_RESPONSE
+            max_tokens=MAX_TOKENS_FROM_GPT_RESPONSE,
+            expected_response_token_count=get_expected_response_token_count(text_summarizer_request),
         )
     except TokensExhaustedException as e:
         if e.login:
@@ -182,8 +234,9 @@ async def text_summarizer(text_summarizer_request: TextSummarizerRequest, reques
     latest_chat = latest_gpt_chat_model.content
     latest_chat = sanitize_string(latest_chat)
 
-    response_model = AIToolResponse(
+    response_model = TextSummarizerResponse(
         response=latest_chat,
+        tokens_saved_by_compression=tokens_saved_by_compression,
     )
     logger.info(f"Returning response for {ENDPOINT_NAME} endpoint.")
     return response_model
@@ -0,0 +1,370 @@
+"""
+WebSocket transport for sandbox-chatgpt.
+
+API Gateway WebSocket APIs invoke the lambda with $connect, $default and $disconnect
+route events. The user is authenticated once when the connection is opened and the
+connection is stored with the user, so the messages sent over it skip the HTTP middleware
+and the user initialization. Chat histories come from the shared conversation cache
+while the container is warm, and replies are streamed back to the client in chunks with
+post_to_connection.
+
+The client sends {"action": "sendMessage", "conversationUuid": ..., "userMessage": ...}
+and receives "chunk" events followed by a "done" event with the full response, or an
+"error" event.
+
+LocalWebSocketGateway simulates API Gateway so the handler runs offline, in tests or
+behind the websocket route of the local uvicorn server.
+"""
+import asyncio
+import datetime as dt
+import json
+import logging
+import os
+import traceback
+from collections import defaultdict
+from enum import Enum
+from typing import Any, Callable, Optional, Protocol
+from uuid import UUID, uuid4
+import boto3
+import openai
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status
+from openai.error import RateLimitError
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from custom_exceptions import OpenAIRateLimitExceededError
+from dynamodb_models import SandboxChatConnectionTableModel
+from routers.sandbox_chatgpt import load_sandbox_chat_history, run_sandbox_chat_turn
+from utils import (
+    AIToolModel,
+    AUTHENTICATED_USER_ENV_VAR_NAME,
+    TOKENS_EXHAUSTED_FOR_DAY_JSON_RESPONSE,
+    TOKENS_EXHAUSTED_LOGIN_JSON_RESPONSE,
+    USER_TOKEN_HEADER_NAME,
+    UUID_HEADER_NAME,
+    TokensExhaustedException,
+    get_user_uuid_from_jwt_token,
+    initialize_openai,
+    initialize_user_db,
+    is_user_authenticated,
+)
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CONNECT_ROUTE_KEY = "$connect"
+DEFAULT_ROUTE_KEY = "$default"
+DISCONNECT_ROUTE_KEY = "$disconnect"
+SANDBOX_CHAT_WEBSOCKET_PATH = "sandbox-chatgpt-ws"
+# API Gateway closes WebSocket connections after 2 hours
+CONNECTION_TTL = dt.timedelta(hours=2)
+
+
+class WebSocketGateway(Protocol):
+    def post_to_connection(self, connection_id: str, data: str) -> None:
+        """Send data to the client of a connection."""
+
+
+class ApiGatewayWebSocketGateway:
+    """Send data to clients through the API Gateway management API."""
+
+    def __init__(self, endpoint_url: str):
+        self.client = boto3.client("apigatewaymanagementapi", endpoint_url=endpoint_url)
+
+    def post_to_connection(self, connection_id: str, data: str) -> None:
+        self.client.post_to_connection(ConnectionId=connection_id, Data=data.encode())
+
+
+class SandboxChatWebSocketMessage(AIToolModel):
+    """
+    Message sent by the client over the WebSocket.
+
+    Attributes:
+        action: The action of the message, only sendMessage is supported.
+        conversation_uuid: A unique identifier for the conversation (generated by the client)
+        user_message: The user's message, empty to start a conversation.
+    """
+
+    action: str = "sendMessage"
+    conversation_uuid: UUID
+    user_message: Optional[str] = ""
+
+
+class SandboxChatWebSocketEventType(str, Enum):
+    CHUNK = "chunk"
+    DONE = "done"
+    ERROR = "error"
+
+
+class SandboxChatWebSocketEvent(AIToolModel):
+    """
+    Event sent to the client over the WebSocket.
+
+    Attributes:
+        type: chunk for a part of the response, done with the full response once complete or error.
+        conversation_uuid: The conversation the event belongs to.
+        content: The chunk, the full response or the error message.
+        status_code: The HTTP status code matching the error.
+        login: Whether signing in would allow the user to continue (when tokens are exhausted).
+    """
+
+    type: SandboxChatWebSocketEventType
+    conversation_uuid: Optional[UUID] = None
+    content: str = ""
+    status_code: Optional[int] = None
+    login: Optional[bool] = None
+
+
+class WebSocketSession:
+    """The user of a connection."""
+
+    def __init__(self, user_uuid: str, authenticated: bool):
+        self.user_uuid = user_uuid
+        self.authenticated = authenticated
+
+
+_sessions: dict[str, WebSocketSession] = {}
+
+
+def get_response(status_code: int, body: str = "") -> dict[str, Any]:
+    return {"statusCode": status_code, "body": body}
+
+
+def get_header(headers: dict[str, str], name: str) -> Optional[str]:
+    """Get a header regardless of its case."""
+    name = name.lower()
+    return next((value for key, value in headers.items() if key.lower() == name), None)
+
+
+def is_websocket_event(event: dict[str, Any]) -> bool:
+    """Return whether a lambda event was sent by an API Gateway WebSocket API."""
+    return event.get("requestContext", {}).get("eventType") in ("CONNECT", "MESSAGE", "DISCONNECT")
+
+
+def handle_connect(connection_id: str, event: dict[str, Any]) -> dict[str, Any]:
+    """
+    Authenticate the user opening a connection and store the connection.
+
+    Browsers cannot set headers on WebSocket requests, so the UUID and the JWT can also be
+    passed as the uuid and token query string parameters.
+    """
+    query_parameters = event.get("queryStringParameters") or {}
+    headers = event.get("headers") or {}
+    try:
+        uuid = UUID(query_parameters.get("uuid") or get_header(headers, UUID_HEADER_NAME), version=4)
+    except (TypeError, ValueError):
+        return get_response(status.HTTP_401_UNAUTHORIZED, "User UUID not found.")
+    user_token = query_parameters.get("token") or get_header(headers, USER_TOKEN_HEADER_NAME)
+    authenticated = False
+    if user_token:
+        jwt_uuid = get_user_uuid_from_jwt_token(user_token)
+        authenticated = is_user_authenticated(uuid, jwt_uuid)
+    initialize_user_db(uuid, authenticated)
+    SandboxChatConnectionTableModel(
+        connection_id,
+        user_uuid=str(uuid),
+        authenticated=authenticated,
+        expires=CONNECTION_TTL,
+    ).save()
+    _sessions[connection_id] = WebSocketSession(str(uuid), authenticated)
+    logger.info("connection %s opened, authenticated: %s", connection_id, authenticated)
+    return get_response(status.HTTP_200_OK)
+
+
+def get_session(connection_id: str) -> Optional[WebSocketSession]:
+    """Get the session of a connection, loading it if the connection was opened on another container."""
+    if connection_id not in _sessions:
+        try:
+            connection_model = SandboxChatConnectionTableModel.get(connection_id)
+        except SandboxChatConnectionTableModel.DoesNotExist:
+            return None
+        _sessions[connection_id] = WebSocketSession(connection_model.user_uuid, bool(connection_model.authenticated))
+    return _sessions[connection_id]
+
+
+def get_tokens_exhausted_event(conversation_uuid: UUID, login: bool) -> SandboxChatWebSocketEvent:
+    response = TOKENS_EXHAUSTED_LOGIN_JSON_RESPONSE if login else TOKENS_EXHAUSTED_FOR_DAY_JSON_RESPONSE
+    return SandboxChatWebSocketEvent(
+        type=SandboxChatWebSocketEventType.ERROR,
+        conversation_uuid=conversation_uuid,
+        content=json.loads(response.body)["message"],
+        status_code=response.status_code,
+        login=login,
+    )
+
+
+def handle_message(connection_id: str, event: dict[str, Any], gateway: WebSocketGateway) -> dict[str, Any]:
+    """Run a sandbox-chatgpt turn for a message and stream the response to the client."""
+
+    def post(websocket_event: SandboxChatWebSocketEvent) -> None:
+        gateway.post_to_connection(connection_id, websocket_event.json(by_alias=True, exclude_none=True))
+
+    session = get_session(connection_id)
+    if session is None:
+        return get_response(status.HTTP_403_FORBIDDEN, "Connection not found.")
+    try:
+        message = SandboxChatWebSocketMessage.parse_raw(event.get("body") or "")
+    except ValidationError as e:
+        post(SandboxChatWebSocketEvent(
+            type=SandboxChatWebSocketEventType.ERROR,
+            content=str(e),
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        ))
+        return get_response(status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    conversation_uuid = message.conversation_uuid
+    # the token limits are read from the environment like for the requests checked by the middleware
+    os.environ[AUTHENTICATED_USER_ENV_VAR_NAME] = str(session.authenticated)
+    if openai.api_key is None:
+        initialize_openai()
+    chat_history = load_sandbox_chat_history(user_uuid=session.user_uuid, conversation_uuid=conversation_uuid)
+    on_chunk = lambda chunk: post(SandboxChatWebSocketEvent(
+        type=SandboxChatWebSocketEventType.CHUNK,
+        conversation_uuid=conversation_uuid,
+        content=chunk,
+    ))
+    try:
+        _, gpt_response = run_sandbox_chat_turn(session.user_uuid, chat_history, message.user_message, on_chunk=on_chunk)
+    except TokensExhaustedException as e:
+        post(get_tokens_exhausted_event(conversation_uuid, e.login))
+        return get_response(status.HTTP_429_TOO_MANY_REQUESTS)
+    except (RateLimitError, OpenAIRateLimitExceededError):
+        post(SandboxChatWebSocketEvent(
+            type=SandboxChatWebSocketEventType.ERROR,
+            conversation_uuid=conversation_uuid,
+            content="Too many requests, please try again shortly.",
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        ))
+        return get_response(status.HTTP_429_TOO_MANY_REQUESTS)
+    except Exception as e: # pylint: disable=broad-except
+        logger.error("sandbox chat turn failed: %s\n%s", e, traceback.format_exc())
+        post(SandboxChatWebSocketEvent(
+            type=SandboxChatWebSocketEventType.ERROR,
+            conversation_uuid=conversation_uuid,
+            content="Internal server error.",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        ))
+        return get_response(status.HTTP_500_INTERNAL_SERVER_ERROR)
+    post(SandboxChatWebSocketEvent(
+        type=SandboxChatWebSocketEventType.DONE,
+        conversation_uuid=conversation_uuid,
+        content=gpt_response,
+    ))
+    return get_response(status.HTTP_200_OK)
+
+
+def handle_disconnect(connection_id: str) -> dict[str, Any]:
+    """Forget a closed connection."""
+    _sessions.pop(connection_id, None)
+    SandboxChatConnectionTableModel(connection_id).delete()
+    logger.info("connection %s closed", connection_id)
+    return get_response(status.HTTP_200_OK)
+
+
+def get_management_endpoint_url(event: dict[str, Any]) -> str:
+    """Get the URL of the API Gateway management API for the connections of an event."""
+    request_context = event["requestContext"]
+    return f"https://{request_context['domainName']}/{request_context['stage']}"
+
+
+def websocket_handler(event: dict[str, Any], context: Any, gateway: Optional[WebSocketGateway] = None) -> dict[str, Any]:
+    """
+    Handle an API Gateway WebSocket route event.
+
+    Args:
+        event: The route event.
+        context: The lambda context.
+        gateway: The gateway used to send data to the clients, the API Gateway management API by default.
+
+    Returns:
+        response: The response to the route event.
+    """
+    request_context = event["requestContext"]
+    route_key = request_context["routeKey"]
+    connection_id = request_context["connectionId"]
+    if route_key == CONNECT_ROUTE_KEY:
+        return handle_connect(connection_id, event)
+    if route_key == DISCONNECT_ROUTE_KEY:
+        return handle_disconnect(connection_id)
+    if gateway is None:
+        gateway = ApiGatewayWebSocketGateway(get_management_endpoint_url(event))
+    return handle_message(connection_id, event, gateway)
+
+
+class LocalWebSocketGateway:
+    """
+    Stand-in for an API Gateway WebSocket API.
+
+    Route events are built the way API Gateway builds them and passed to the handler. The
+    data posted to connections is passed to on_post, or kept in sent_data if not provided.
+    """
+
+    def __init__(self, on_post: Optional[Callable[[str, str], None]] = None):
+        self.on_post = on_post
+        self.sent_data: dict[str, list[str]] = defaultdict(list)
+
+    def post_to_connection(self, connection_id: str, data: str) -> None:
+        if self.on_post:
+            self.on_post(connection_id, data)
+        else:
+            self.sent_data[connection_id].append(data)
+
+    def get_event(self, route_key: str, event_type: str, connection_id: str, **fields) -> dict[str, Any]:
+        request_context = {
+            "routeKey": route_key,
+            "eventType": event_type,
+            "connectionId": connection_id,
+            "domainName": "localhost",
+            "stage": "local",
+        }
+        return {"requestContext": request_context, "isBase64Encoded": False, **fields}
+
+    def connect(
+        self,
+        query_parameters: Optional[dict[str, str]] = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> tuple[str, dict[str, Any]]:
+        """Open a connection, returns the connection id and the response of the $connect route."""
+        connection_id = uuid4().hex
+        event = self.get_event(
+            CONNECT_ROUTE_KEY,
+            "CONNECT",
+            connection_id,
+            queryStringParameters=query_parameters or None,
+            headers=headers or {},
+        )
+        return connection_id, websocket_handler(event, None, gateway=self)
+
+    def send(self, connection_id: str, body: str) -> dict[str, Any]:
+        """Send a message on a connection, returns the response of the $default route."""
+        event = self.get_event(DEFAULT_ROUTE_KEY, "MESSAGE", connection_id, body=body)
+        return websocket_handler(event, None, gateway=self)
+
+    def disconnect(self, connection_id: str) -> dict[str, Any]:
+        """Close a connection, returns the response of the $disconnect route."""
+        return websocket_handler(self.get_event(DISCONNECT_ROUTE_KEY, "DISCONNECT", connection_id), None, gateway=self)
+
+
+def add_local_websocket_route(app: FastAPI, path: str) -> None:
+    """Serve the WebSocket transport from the local uvicorn server through the local gateway."""
+
+    @app.websocket(path)
+    async def sandbox_chatgpt_websocket(websocket: WebSocket):
+        loop = asyncio.get_running_loop()
+        # the handler runs in the thread pool, the data is sent from the event loop
+        send_text = lambda _, data: asyncio.run_coroutine_threadsafe(websocket.send_text(data), loop).result()
+        gateway = LocalWebSocketGateway(on_post=send_text)
+        connection_id, response = await run_in_threadpool(
+            gateway.connect,
+            dict(websocket.query_params),
+            dict(websocket.headers),
+        )
+        if response["statusCode"] != status.HTTP_200_OK:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        await websocket.accept()
+        try:
+            while True:
+                body = await websocket.receive_text()
+                await run_in_threadpool(gateway.send, connection_id, body)
+        except WebSocketDisconnect:
+            await run_in_threadpool(gateway.disconnect, connection_id)
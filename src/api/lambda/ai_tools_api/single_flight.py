@@ -0,0 +1,61 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+Double clicks and client retries send the same payload within milliseconds of each other.
+Requests sharing a key while a call is in flight await the result of that call instead of
+making their own. The caller that made the call (the leader) is returned alongside the
+result so that followers can account for their usage explicitly. A failed call is not
+shared: its error may belong to the leader alone (e.g. its quota is exhausted), so each
+follower then makes its own call.
+"""
+import asyncio
+from typing import Any, Callable, Generic, Hashable, TypeVar
+from starlette.concurrency import run_in_threadpool
+
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Coalesce concurrent calls sharing the same key into a single call."""
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, tuple[asyncio.Future, Any]] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], T], caller: Any = None) -> tuple[T, Any]:
+        """
+        Call the function once for all concurrent callers sharing the key.
+
+        The function is blocking and runs in the thread pool so that duplicates arriving
+        while it is in flight can be received by the event loop.
+
+        Args:
+            key: The key identifying identical calls (e.g. the canonical request hash).
+            fn: The blocking function to call.
+            caller: Identifies the caller, returned to followers as the leader of the call.
+
+        Returns:
+            result: The result of the call, the exception of their own call is raised to every caller.
+            leader: The caller that made the call.
+        """
+        if key in self._in_flight:
+            future, leader = self._in_flight[key]
+            try:
+                return await asyncio.shield(future), leader
+            except Exception:  # pylint: disable=broad-except
+                # the error of the leader's call may not apply to this caller
+                return await run_in_threadpool(fn), caller
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (future, caller)
+        try:
+            result = await run_in_threadpool(fn)
+        except Exception as e:
+            future.set_exception(e)
+            # mark the exception as retrieved in case there are no followers
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, caller
+        finally:
+            del self._in_flight[key]
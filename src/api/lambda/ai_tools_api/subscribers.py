@@ -0,0 +1,68 @@
+"""
+Read the subscribers from the sparse subscribers index of the user data table.
+
+Usage:
+    python subscribers.py list                   # print the email address and UUID of every subscriber
+    python subscribers.py find johndoe@gmail.com # print the UUIDs subscribed with an email address
+    python subscribers.py backfill-index         # add the users subscribed before the index existed
+"""
+import argparse
+from typing import Iterator, List
+from dynamodb_models import SUBSCRIBED_STATUS, UserDataSubscribersIndex, UserDataTableModel
+
+
+def iterate_subscribers() -> Iterator[UserDataTableModel]:
+    """Iterate over the subscribed users, ordered by email address."""
+    return UserDataTableModel.subscribers_index.query(SUBSCRIBED_STATUS)
+
+
+def get_subscriber_uuids(email_address: str) -> List[str]:
+    """Get the UUIDs of the users subscribed with an email address, to detect duplicate subscriptions."""
+    return [
+        model.UUID
+        for model in UserDataTableModel.subscribers_index.query(
+            SUBSCRIBED_STATUS,
+            UserDataSubscribersIndex.email_address == email_address,
+        )
+    ]
+
+
+def backfill_subscribers_index() -> int:
+    """
+    Add the users subscribed before the index existed to it, with a single scan of the table.
+
+    Returns:
+        updated_count: The number of users added to the index.
+    """
+    updated_count = 0
+    for model in UserDataTableModel.scan(
+        filter_condition=(UserDataTableModel.is_subscribed == True) & UserDataTableModel.subscription_status.does_not_exist()  # pylint: disable=singleton-comparison
+    ):
+        model.update(actions=[
+            UserDataTableModel.subscription_status.set(SUBSCRIBED_STATUS),
+            UserDataTableModel.expires.remove(),
+        ])
+        updated_count += 1
+    return updated_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="Print every subscriber.")
+    find_parser = subparsers.add_parser("find", help="Print the users subscribed with an email address.")
+    find_parser.add_argument("email_address")
+    subparsers.add_parser("backfill-index", help="Add the existing subscribers to the index.")
+    args = parser.parse_args()
+    if args.command == "list":
+        for model in iterate_subscribers():
+            print(f"{model.email_address}\t{model.UUID}")
+    elif args.command == "find":
+        for uuid in get_subscriber_uuids(args.email_address):
+            print(uuid)
+    else:
+        print(f"added {backfill_subscribers_index()} subscribers to the index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Backfill the expiry of the items written before the expiry policies existed.
+
+Each table is scanned in parallel segments for the items without an expiry, and the
+expiry of their policy is set with an update conditional on the item still not having
+one, so items updated by the API in the meantime are left alone. Expiries are derived
+from when the item was last used where it is stored, so idle items are removed by
+DynamoDB shortly after the backfill instead of a full period later.
+
+Usage:
+    python ttl_backfill.py --table all --segments 8 [--dry-run]
+"""
+import argparse
+import datetime as dt
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from numbers import Number
+from typing import Callable, Optional, Type
+from pynamodb.exceptions import UpdateError
+from pynamodb.models import Model
+from dynamodb_models import (
+    FeedbackTableModel,
+    SandboxChatMessageTableModel,
+    SandboxConversationTableModel,
+    UserDataTableModel,
+)
+from ttl_policy import TTLPolicySettings
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_SEGMENT_COUNT = 4
+
+
+def get_user_data_expiry(model: UserDataTableModel, settings: TTLPolicySettings) -> Optional[dt.datetime]:
+    """Anonymous users get a full period from now since when they last made a request is not stored."""
+    if model.authenticated_user or model.is_subscribed or settings.anonymous_user_ttl_days == 0:
+        return None
+    return dt.datetime.now(dt.timezone.utc) + dt.timedelta(days=settings.anonymous_user_ttl_days)
+
+
+def get_feedback_expiry(model: FeedbackTableModel, settings: TTLPolicySettings) -> Optional[dt.datetime]:
+    if settings.feedback_ttl_days == 0:
+        return None
+    created_at = dt.datetime.now(dt.timezone.utc)
+    if isinstance(model.timestamp, Number):
+        created_at = dt.datetime.fromtimestamp(model.timestamp, dt.timezone.utc)
+    return created_at + dt.timedelta(days=settings.feedback_ttl_days)
+
+
+def get_conversation_expiry(model: SandboxConversationTableModel, settings: TTLPolicySettings) -> Optional[dt.datetime]:
+    if settings.conversation_ttl_days == 0:
+        return None
+    return model.last_updated + dt.timedelta(days=settings.conversation_ttl_days)
+
+
+def get_message_expiry(model: SandboxChatMessageTableModel, settings: TTLPolicySettings) -> Optional[dt.datetime]:
+    if settings.conversation_ttl_days == 0:
+        return None
+    created_at = model.created_at or dt.datetime.now(dt.timezone.utc)
+    return created_at + dt.timedelta(days=settings.conversation_ttl_days)
+
+
+BACKFILLS: dict[str, tuple[Type[Model], Callable[[Model, TTLPolicySettings], Optional[dt.datetime]]]] = {
+    UserDataTableModel.Meta.table_name: (UserDataTableModel, get_user_data_expiry),
+    FeedbackTableModel.Meta.table_name: (FeedbackTableModel, get_feedback_expiry),
+    SandboxConversationTableModel.Meta.table_name: (SandboxConversationTableModel, get_conversation_expiry),
+    SandboxChatMessageTableModel.Meta.table_name: (SandboxChatMessageTableModel, get_message_expiry),
+}
+
+
+def backfill_segment(
+    model_class: Type[Model],
+    get_item_expiry: Callable[[Model, TTLPolicySettings], Optional[dt.datetime]],
+    settings: TTLPolicySettings,
+    segment: int,
+    total_segments: int,
+    dry_run: bool = False,
+) -> int:
+    """
+    Set the expiry of the items of a scan segment that do not have one.
+
+    Updating a versioned item increments its version, so a conversation cached by a warm
+    container is merged with the stored one on its next turn.
+
+    Returns:
+        updated_count: The number of items updated, or that would be updated in a dry run.
+    """
+    updated_count = 0
+    for model in model_class.scan(
+        filter_condition=model_class.expires.does_not_exist(),
+        segment=segment,
+        total_segments=total_segments,
+    ):
+        expires = get_item_expiry(model, settings)
+        if expires is None:
+            continue
+        if not dry_run:
+            try:
+                model.update(actions=[model_class.expires.set(expires)], condition=model_class.expires.does_not_exist())
+            except UpdateError as e:
+                if e.cause_response_code != "ConditionalCheckFailedException":
+                    raise
+                continue
+        updated_count += 1
+    return updated_count
+
+
+def backfill_table(table_name: str, total_segments: int, settings: TTLPolicySettings, dry_run: bool = False) -> int:
+    """Backfill the expiry of a table with a parallel scan, returns the number of items updated."""
+    model_class, get_item_expiry = BACKFILLS[table_name]
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        updated_counts = executor.map(
+            lambda segment: backfill_segment(model_class, get_item_expiry, settings, segment, total_segments, dry_run),
+            range(total_segments),
+        )
+        updated_count = sum(updated_counts)
+    logger.info("%s: %s items %s", table_name, updated_count, "to update" if dry_run else "updated")
+    return updated_count
+
+
+def main():
+    logging.basicConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--table", choices=[*BACKFILLS, "all"], default="all")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENT_COUNT, help="Number of parallel scan segments.")
+    parser.add_argument("--dry-run", action="store_true", help="Count the items without updating them.")
+    args = parser.parse_args()
+    table_names = list(BACKFILLS) if args.table == "all" else [args.table]
+    settings = TTLPolicySettings()
+    for table_name in table_names:
+        backfill_table(table_name, args.segments, settings, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Expiry policies of the items stored in DynamoDB.
+
+Every table is created with "expires" as its time to live attribute, DynamoDB deletes an
+item in the background, at no cost, once that time has passed. Each type of record has
+its own policy:
+
+- anonymous users expire after a period without requests, authenticated users never expire
+- conversations expire after a period without new messages, and each message expires that
+  long after it was written, so the messages of an active conversation that are older than
+  that only live on through its rolling summary
+- feedback is kept for a fixed retention period
+
+A policy of 0 days disables the expiry of that type of record.
+"""
+import datetime as dt
+from typing import Optional
+from pydantic import BaseSettings, conint
+
+
+class TTLPolicySettings(BaseSettings):
+    """Define the number of days records are kept for."""
+
+    anonymous_user_ttl_days: conint(ge=0) = 30
+    conversation_ttl_days: conint(ge=0) = 90
+    feedback_ttl_days: conint(ge=0) = 365
+    # the expiry of a record read on every request is only rewritten once it is this old
+    ttl_refresh_interval_hours: conint(ge=0) = 24
+
+    class Config:
+        case_sensitive = False
+
+
+ttl_policy_settings = TTLPolicySettings()
+
+
+def get_expiry(ttl_days: int) -> Optional[dt.timedelta]:
+    """Get the expiry to set on a record, relative to now, None if the policy is disabled."""
+    if ttl_days == 0:
+        return None
+    return dt.timedelta(days=ttl_days)
+
+
+def is_expiry_refresh_due(
+    expires: Optional[dt.datetime],
+    ttl_days: int,
+    refresh_interval_hours: int = ttl_policy_settings.ttl_refresh_interval_hours,
+    now: Optional[dt.datetime] = None,
+) -> bool:
+    """
+    Return whether the expiry of a record should be pushed back.
+
+    Rewriting the expiry on every request would add a write to each of them, so it is only
+    rewritten once it was set more than the refresh interval ago.
+
+    Args:
+        expires: The current expiry of the record, None if it does not have one.
+        ttl_days: The number of days the record is kept for after it was last used.
+        refresh_interval_hours: How long an expiry is kept before it is rewritten.
+        now: The current time in UTC.
+
+    Returns:
+        is_due: Whether the expiry should be rewritten.
+    """
+    if ttl_days == 0:
+        return False
+    if expires is None:
+        return True
+    now = now or dt.datetime.now(dt.timezone.utc)
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=dt.timezone.utc)
+    return expires - now < dt.timedelta(days=ttl_days) - dt.timedelta(hours=refresh_interval_hours)
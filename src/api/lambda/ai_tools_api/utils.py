@@ -1,4 +1,5 @@
 import datetime as dt
+import hashlib
 import json
 import os
 import logging
@@ -7,6 +8,7 @@ from typing import Sequence, Union
 from cryptography.hazmat.primitives import hashes, hmac
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from fastapi import Response, Request, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 import openai
 import boto3
@@ -16,11 +18,23 @@ from jose import jwe
 from ai_tools_lambda_settings import AIToolsLambdaSettings
 from botocore.exceptions import ClientError
 from pydantic import BaseModel, constr, BaseSettings, Field
-from typing import Optional, Sequence, Union
+from typing import Any, Dict, Optional, Sequence, Union
 from dynamodb_models import UserDataTableModel
 from pynamodb.pagination import ResultIterator
 from pynamodb.models import Model
 from dynamodb_models import NextJsAuthTableModel, get_eastern_time_previous_day_midnight
+from openai_session import install_openai_session
+from llm_backends import LLMBackendName, LLMBackendSettings
+from ttl_policy import ttl_policy_settings, get_expiry, is_expiry_refresh_due
+from response_compression import (
+    PRERENDERED_BROTLI_QUALITY,
+    PRERENDERED_GZIP_LEVEL,
+    add_vary_header,
+    compress,
+    compression_settings,
+    get_response_encoding,
+    is_compressible,
+)
 
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
@@ -33,6 +47,8 @@ USER_TOKEN_HEADER_NAME = "JWT"
 JWT_PAYLOAD_ID_FIELD_NAME = "sub"
 EXAMPLES_ENDPOINT_POSTFIX = "examples"
 DELIMITER_SEQUENCE = "%!%!%"
+# examples only change with a deploy, clients revalidate them with their ETag once they are stale
+EXAMPLES_CACHE_CONTROL = "public, max-age=86400"
 
 class TokensExhaustedResponse(BaseModel):
     """Define the model for the client error response."""
@@ -206,6 +222,24 @@ def append_field_prompts_to_prompt(model: BaseAIInstructionModel, base_prompt: s
     return base_prompt
 
 
+def get_canonical_request_hash(endpoint_name: str, request_model: BaseModel) -> str:
+    """
+    Get a hash identifying the request made to an endpoint.
+
+    Requests parsed from payloads with the same values (regardless of key order or the use
+    of aliases) have the same hash.
+
+    Args:
+        endpoint_name: The name of the endpoint the request was made to.
+        request_model: The parsed request.
+
+    Returns:
+        The hex digest of the canonical request.
+    """
+    canonical_request = json.dumps(request_model.dict(), sort_keys=True, default=str)
+    return hashlib.sha256(f"{endpoint_name}:{canonical_request}".encode()).hexdigest()
+
+
 class ExamplesResponse(AIToolModel):
     """
     **Base Response for all examples endpoints.**
@@ -216,11 +250,65 @@ class ExamplesResponse(AIToolModel):
     """
     example_names: list[str]
 
+
+def is_etag_matching(if_none_match: Optional[str], etag: str) -> bool:
+    """Return whether an If-None-Match header matches an ETag, with the weak comparison it requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class PrerenderedResponse:
+    """
+    JSON response rendered once and served as is.
+
+    The body is encoded like FastAPI encodes a response_model and identified by a strong
+    ETag derived from its content, so clients revalidating it get an empty 304 response.
+    The content is a model or a JSON serializable object, e.g. the OpenAPI schema.
+    Large bodies are compressed once per encoding, at the highest level, on the first
+    request accepting it.
+    """
+
+    def __init__(self, content: Any, cache_control: str = EXAMPLES_CACHE_CONTROL):
+        self.body = JSONResponse(content=jsonable_encoder(content)).body
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.cache_control = cache_control
+        self.is_compressible = is_compressible("application/json", len(self.body), compression_settings)
+        self._encoded_bodies: Dict[str, bytes] = {}
+
+    def get_encoded_body(self, encoding: str) -> bytes:
+        if encoding not in self._encoded_bodies:
+            self._encoded_bodies[encoding] = compress(self.body, encoding, PRERENDERED_GZIP_LEVEL, PRERENDERED_BROTLI_QUALITY)
+        return self._encoded_bodies[encoding]
+
+    def get_response(self, request: Request) -> Response:
+        """Get the response to a request in the encoding the client prefers, 304 Not Modified if the client has the current body."""
+        headers = {"Cache-Control": self.cache_control}
+        encoding = None
+        if self.is_compressible:
+            headers["Vary"] = "Accept, Accept-Encoding"
+            encoding = get_response_encoding(request.headers)
+        # every encoding of the body is a representation with its own strong ETag
+        headers["ETag"] = self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+        if is_etag_matching(request.headers.get("If-None-Match"), headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        if encoding is None:
+            return Response(content=self.body, media_type="application/json", headers=headers)
+        headers["Content-Encoding"] = encoding
+        return Response(content=self.get_encoded_body(encoding), media_type="application/json", headers=headers)
+
+
 def initialize_openai():
     """Initialize OpenAI."""
+    if LLMBackendSettings().llm_backend in (LLMBackendName.FAKE, LLMBackendName.REPLAY):
+        logger.info("Skipping OpenAI initialization as the LLM backend does not use the network.")
+        return
     secret_ = get_secret(lambda_settings.external_api_secret_name, "us-west-2")
     openai.organization = secret_.get(lambda_settings.api_endpoint_secret_key_name)
     openai.api_key = secret_.get(lambda_settings.api_key_secret_key_name)
+    install_openai_session()
 
 def sanitize_string(string: str) -> str:
     """Replace '\\n' with '\n' and remove whitespace at the end and beginning of the string."""
@@ -229,10 +317,13 @@ def sanitize_string(string: str) -> str:
 
 
 def add_header(response: Response, origin_url: Optional[str]) -> None:
-    response.headers['Cache-Control'] = "no-cache"
+    # responses that set their own caching policy (e.g. the examples) keep it
+    response.headers.setdefault('Cache-Control', "no-cache")
     response.headers["Access-Control-Allow-Headers"] = "*"
     if origin_url:
         response.headers["Access-Control-Allow-Origin"] = origin_url
+        # the echoed origin must not be served from a shared cache to another origin
+        add_vary_header(response.headers, "Origin")
 
 def prepare_response(response: Response, request: Request) -> None:
     """Prepare response."""
@@ -276,6 +367,31 @@ def update_user_token_count(user_uuid: UUID, token_count: int) -> None:
     user_data_model.update(actions=action_list)
 
 
+def initialize_user_db(uuid: UUID, is_user_authenticated: bool):
+    """
+    Create the user data of a new user and maintain its expiry.
+
+    Anonymous users expire once they stop making requests, authenticated and subscribed users are kept.
+    """
+    anonymous_user_ttl_days = ttl_policy_settings.anonymous_user_ttl_days
+    try:
+        user_data_model: UserDataTableModel = UserDataTableModel.get(str(uuid))
+    except (Model.DoesNotExist):
+        user_data_model = UserDataTableModel(
+            str(uuid),
+            authenticated_user=is_user_authenticated,
+            expires=None if is_user_authenticated else get_expiry(anonymous_user_ttl_days),
+        )
+        user_data_model.save()
+    if is_user_authenticated:
+        actions = [UserDataTableModel.authenticated_user.set(True)]
+        if user_data_model.expires is not None:
+            actions.append(UserDataTableModel.expires.remove())
+        user_data_model.update(actions=actions)
+    elif not user_data_model.is_subscribed and is_expiry_refresh_due(user_data_model.expires, anonymous_user_ttl_days):
+        user_data_model.update(actions=[UserDataTableModel.expires.set(get_expiry(anonymous_user_ttl_days))])
+
+
 def docstring_parameter(*sub):
     def dec(obj):
         obj.__doc__ = obj.__doc__.format(*sub)
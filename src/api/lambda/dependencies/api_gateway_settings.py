@@ -2,6 +2,10 @@ from pydantic import BaseSettings, validator
 from typing import Dict, List, Any, Optional
 from enum import Enum
 
+# API Gateway decodes the base64 bodies of the lambda to binary when the first media type
+# accepted by the request is one of these, so only these responses can be compressed
+BINARY_MEDIA_TYPES = ["application/json"]
+
 
 class DeploymentStage(Enum):
     """Deployment Stage Enum"""
@@ -23,3 +23,4 @@ def test_resources_created(lambda_settings, api_gateway_settings, dynamodb_setti
     template.resource_count_is("AWS::Lambda::Function", 1)
 
     template.resource_count_is("AWS::ApiGateway::RestApi", 1)
+    template.has_resource_properties("AWS::ApiGateway::RestApi", {"BinaryMediaTypes": ["application/json"]})
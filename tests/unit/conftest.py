@@ -1,5 +1,8 @@
 import os
 import pytest
 from fixtures.test_settings import lambda_settings, api_gateway_settings, dynamodb_settings
+from fixtures.app_fixtures import APP_ENVIRONMENT, dynamodb_tables, app_client, user_headers
 
 os.environ["FRONTEND_CORS_URL"] = "https://d22zhq6xynxzgi.cloudfront.net"
+for name, value in APP_ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
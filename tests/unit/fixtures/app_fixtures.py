@@ -0,0 +1,49 @@
+"""Fixtures running the app offline, with moto DynamoDB tables and the fake LLM backend."""
+# pylint: disable=import-outside-toplevel
+import uuid
+import pytest
+from moto import mock_dynamodb
+
+# read by the app modules when they are first imported, see conftest.py
+APP_ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "us-west-2",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "OPENAI_LAMBDA_ID": "test_lambda_id",
+    "OPENAI_API_DIR": "openai_api",
+    "OPENAI_ROUTE_PREFIX": "openai",
+    "DEPLOYMENT_STAGE": "local",
+    # the app does not fetch the OpenAI secrets with the fake backend
+    "LLM_BACKEND": "fake",
+    "FAKE_LLM_LATENCY_MEAN_SECONDS": "0",
+    "FAKE_LLM_COMPLETION_TOKENS": "20",
+    "RATE_LIMITER_BACKEND": "memory",
+}
+
+
+@pytest.fixture
+def dynamodb_tables():
+    """Create every table of the app in moto."""
+    from pynamodb.models import Model
+    import dynamodb_models
+    with mock_dynamodb():
+        for name in dir(dynamodb_models):
+            model = getattr(dynamodb_models, name)
+            if isinstance(model, type) and issubclass(model, Model) and model is not Model:
+                model.create_table(read_capacity_units=5, write_capacity_units=5, wait=True)
+        yield
+
+
+@pytest.fixture
+def app_client(dynamodb_tables):
+    """Client of the app, its startup events are not run."""
+    from fastapi.testclient import TestClient
+    from ai_tools_lambda import create_fastapi_app
+    return TestClient(create_fastapi_app())
+
+
+@pytest.fixture
+def user_headers() -> dict:
+    """Headers of a new anonymous user."""
+    from utils import UUID_HEADER_NAME
+    return {UUID_HEADER_NAME: str(uuid.uuid4())}
@@ -0,0 +1,34 @@
+"""Test the compact binary encoding of stored chat messages."""
+import json
+import pytest
+from chat_message_codec import (
+    ENCODING_VERSION_DEFLATED_JSON,
+    ENCODING_VERSION_JSON,
+    decode_chat_message,
+    encode_chat_message,
+)
+
+
+@pytest.mark.parametrize("content", ["", "Hi!", "Héllo wörld, ça va? 👋", "I need help with my homework. " * 40])
+def test_messages_round_trip(content):
+    """Test that decoding an encoded message returns the original role and content."""
+    assert decode_chat_message(encode_chat_message("assistant", content)) == ("assistant", content)
+
+
+def test_long_messages_are_compressed():
+    """Test that long messages are deflated and smaller than their JSON representation."""
+    content = "Let's plan a trip to the mountains next weekend. " * 20
+    payload = encode_chat_message("user", content)
+    assert payload[0] == ENCODING_VERSION_DEFLATED_JSON
+    assert len(payload) < len(json.dumps({"role": "user", "content": content}))
+
+
+def test_short_messages_are_not_compressed():
+    """Test that short messages are stored uncompressed."""
+    assert encode_chat_message("user", "Hi")[0] == ENCODING_VERSION_JSON
+
+
+def test_unsupported_version_raises():
+    """Test that a payload with an unknown version byte is rejected."""
+    with pytest.raises(ValueError):
+        decode_chat_message(bytes([99]) + b"[0,\"\"]")
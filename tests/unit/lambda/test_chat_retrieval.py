@@ -0,0 +1,30 @@
+"""Test the relevance retrieval over earlier conversation turns."""
+from chat_retrieval import BM25Index, select_relevant_turns
+
+
+TURNS = [
+    "user: My dog is called Biscuit and he is a beagle.\nassistant: Biscuit sounds adorable!",
+    "user: I am learning to bake sourdough bread.\nassistant: Sourdough takes patience.",
+    "user: What should I cook tonight?\nassistant: How about a pasta dish?",
+]
+
+
+def test_matching_documents_score_higher():
+    """Test that documents sharing rare words with the query score highest and unrelated ones score 0."""
+    scores = BM25Index(TURNS).score("Can you remind me what breed Biscuit is?")
+    assert scores[0] > 0
+    assert scores[1] == 0
+    assert scores[0] == max(scores)
+
+
+def test_selected_turns_fit_budget_and_are_chronological():
+    """Test that the selected turns fit in the token budget and keep the conversation order."""
+    token_counts = [len(turn.split()) for turn in TURNS]
+    query = "Biscuit the beagle ate my sourdough bread"
+    assert select_relevant_turns(TURNS, token_counts, query, token_budget=100, max_turns=3) == [0, 1]
+    assert len(select_relevant_turns(TURNS, token_counts, query, token_budget=min(token_counts[:2]), max_turns=3)) == 1
+
+
+def test_no_turns_are_selected_without_matching_words():
+    """Test that no turns are selected when the query shares no words with them."""
+    assert select_relevant_turns(TURNS, [10, 10, 10], "hello", token_budget=100, max_turns=3) == []
@@ -0,0 +1,48 @@
+"""Test the in-memory conversation cache."""
+from conversation_cache import ConversationCache
+
+
+def get_cache(max_entries: int = 2, max_size: int = 100) -> ConversationCache[str]:
+    return ConversationCache(max_entries=max_entries, max_size=max_size, get_size=len)
+
+
+def test_least_recently_used_value_is_evicted():
+    """Test that the least recently used value is evicted once the cache is full."""
+    cache = get_cache()
+    cache.put("a", "first", version=1)
+    cache.put("b", "second", version=1)
+    assert cache.get("a") == "first"
+    cache.put("c", "third", version=1)
+    assert cache.get("b") is None
+    assert cache.get("a") == "first"
+    assert cache.get("c") == "third"
+
+
+def test_total_size_is_bounded():
+    """Test that values are evicted to keep the total size within the bound."""
+    cache = get_cache(max_entries=10, max_size=10)
+    cache.put("a", "x" * 6, version=1)
+    cache.put("b", "y" * 6, version=1)
+    assert cache.get("a") is None
+    assert cache.size == 6
+    cache.put("c", "z" * 11, version=1)
+    assert cache.get("c") is None
+
+
+def test_older_versions_do_not_replace_newer_ones():
+    """Test that a value with a lower version than the cached one is ignored."""
+    cache = get_cache()
+    cache.put("a", "new", version=3)
+    cache.put("a", "old", version=2)
+    assert cache.get("a") == "new"
+    cache.put("a", "newer", version=4)
+    assert cache.get("a") == "newer"
+
+
+def test_invalidated_values_are_removed():
+    """Test that an invalidated value is no longer served."""
+    cache = get_cache()
+    cache.put("a", "value", version=1)
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.size == 0
@@ -0,0 +1,10 @@
+"""Test the CORS headers added to the responses of the app."""
+
+
+def test_public_responses_echoing_the_origin_vary_with_it(app_client, user_headers):
+    """Test that a cached examples response echoing the origin of the request is marked as varying with the origin."""
+    response = app_client.get("/openai/text-revisor-examples", headers={**user_headers, "Origin": "https://example.com"})
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"].startswith("public")
+    assert response.headers["Access-Control-Allow-Origin"] == "https://example.com"
+    assert "Origin" in [name.strip() for name in response.headers["Vary"].split(",")]
@@ -0,0 +1,76 @@
+"""Test the store of the stored outputs of the examples."""
+# pylint: disable=import-outside-toplevel
+import uuid
+import pytest
+
+
+def get_example_output():
+    from example_outputs import ExampleOutput
+    return ExampleOutput(
+        endpoint_name="text-revisor",
+        example_name="Spelling Errors",
+        response={"revisedText": "Revised."},
+        token_count=301,
+    )
+
+
+def test_saved_outputs_are_loaded(tmp_path):
+    """Test that the outputs are found by their request hash after a save and load."""
+    from example_outputs import ExampleOutputStore
+    path = tmp_path / "example_outputs.json"
+    ExampleOutputStore({"hash": get_example_output()}).save(path)
+    store = ExampleOutputStore.load(path)
+    assert store.get("hash") == get_example_output()
+    assert store.get("other-hash") is None
+
+
+def test_missing_or_disabled_outputs_are_empty(tmp_path):
+    """Test that no output is served when the file was not generated or the outputs are disabled."""
+    from example_outputs import ExampleOutputSettings, ExampleOutputStore
+    path = tmp_path / "example_outputs.json"
+    assert not ExampleOutputStore.load(path).outputs
+    ExampleOutputStore({"hash": get_example_output()}).save(path)
+    assert not ExampleOutputStore.from_settings(ExampleOutputSettings(example_outputs_enabled=False), path).outputs
+
+
+def test_charge_is_scaled_by_the_ratio():
+    """Test that users are charged the tokens of the output scaled by the ratio, rounded up."""
+    from example_outputs import ExampleOutputStore
+    assert ExampleOutputStore(charge_ratio=1.0).get_charge(get_example_output()) == 301
+    assert ExampleOutputStore(charge_ratio=0.5).get_charge(get_example_output()) == 151
+    assert ExampleOutputStore(charge_ratio=0.0).get_charge(get_example_output()) == 0
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_matching_request_is_served_its_stored_output(monkeypatch):
+    """Test that a request matching an example gets its stored output and is charged for it, and that other requests get None."""
+    from dynamodb_models import UserDataTableModel
+    from example_outputs import example_output_store, get_example_output_response
+    from routers.text_revisor import ENDPOINT_NAME, EXAMPLES_RESPONSE, TextRevisorResponse
+    from utils import get_canonical_request_hash
+    example, other_example = EXAMPLES_RESPONSE.examples[:2]
+    monkeypatch.setitem(example_output_store.outputs, get_canonical_request_hash(ENDPOINT_NAME, example), get_example_output())
+    monkeypatch.setattr(example_output_store, "charge_ratio", 1.0)
+    user_uuid = str(uuid.uuid4())
+    UserDataTableModel(user_uuid).save()
+    response = get_example_output_response(ENDPOINT_NAME, example, user_uuid, TextRevisorResponse)
+    assert response == TextRevisorResponse(revised_text="Revised.")
+    assert UserDataTableModel.get(user_uuid).cumulative_token_count == 301
+    assert get_example_output_response(ENDPOINT_NAME, other_example, user_uuid, TextRevisorResponse) is None
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_stored_output_is_not_served_without_tokens_left(monkeypatch):
+    """Test that a user without the tokens to be charged for a stored output gets a tokens exhausted response."""
+    from dynamodb_models import UserDataTableModel
+    from example_outputs import example_output_store, get_example_output_response
+    from routers.text_revisor import ENDPOINT_NAME, EXAMPLES_RESPONSE, TextRevisorResponse
+    from utils import get_canonical_request_hash
+    example = EXAMPLES_RESPONSE.examples[0]
+    monkeypatch.setitem(example_output_store.outputs, get_canonical_request_hash(ENDPOINT_NAME, example), get_example_output())
+    monkeypatch.setattr(example_output_store, "charge_ratio", 1.0)
+    user_uuid = str(uuid.uuid4())
+    UserDataTableModel(user_uuid, cumulative_token_count=10 ** 6).save()
+    response = get_example_output_response(ENDPOINT_NAME, example, user_uuid, TextRevisorResponse)
+    assert response.status_code == 429
+    assert UserDataTableModel.get(user_uuid).cumulative_token_count == 10 ** 6
@@ -0,0 +1,42 @@
+"""Test the extractive compression of long texts."""
+from extractive_compression import compress_text_to_token_budget, split_into_sentences
+
+
+def count_words(string: str) -> int:
+    """Count words as a stand in for the model tokenizer."""
+    return len(string.split())
+
+
+def test_text_within_budget_is_unchanged():
+    """Test that a text that fits in the budget is not compressed."""
+    text = "Chinchillas are small rodents. They live in the Andes."
+    result = compress_text_to_token_budget(text, 100, count_words)
+    assert result.text == text
+    assert result.tokens_saved == 0
+
+
+def test_compressed_text_fits_budget_and_keeps_sentence_order():
+    """Test that the compressed text fits the budget and keeps the original sentence order."""
+    sentences = [
+        "Chinchillas have the densest fur of any mammal.",
+        "The weather was nice.",
+        "Chinchillas take dust baths to keep their dense fur clean.",
+        "It was a Tuesday.",
+        "Fur trading caused wild chinchilla populations to decline.",
+    ]
+    text = " ".join(sentences)
+    result = compress_text_to_token_budget(text, 25, count_words)
+    assert result.compressed_token_count <= 25
+    assert result.tokens_saved == result.original_token_count - result.compressed_token_count
+    kept_sentences = split_into_sentences(result.text)
+    assert kept_sentences == [sentence for sentence in sentences if sentence in kept_sentences]
+    assert "Chinchillas have the densest fur of any mammal." in kept_sentences
+
+
+def test_unpunctuated_text_is_truncated_to_budget():
+    """Test that a text with a single sentence longer than the budget, e.g. a raw transcript, is truncated, not emptied."""
+    text = " ".join(f"word{index}" for index in range(3000))
+    result = compress_text_to_token_budget(text, 2500, count_words)
+    assert result.text == " ".join(f"word{index}" for index in range(2500))
+    assert result.compressed_token_count == 2500
+    assert result.tokens_saved == 500
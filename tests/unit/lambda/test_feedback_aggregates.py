@@ -0,0 +1,82 @@
+"""Test the daily rating aggregates of the feedback."""
+import datetime as dt
+import pytest
+from dynamodb_models import FeedbackTableModel
+from feedback_aggregates import FeedbackRatingSummary, count_feedback_ratings, get_feedback_day, get_feedback_rating_summary
+from feedback_buffer import FeedbackBuffer
+
+DAY_START = dt.datetime(2023, 5, 1, tzinfo=dt.timezone.utc).timestamp()
+DAY_END = DAY_START + 24 * 60 * 60 - 1
+
+
+def test_feedback_day_is_the_utc_day():
+    """Test that the day of a feedback is its UTC date."""
+    assert get_feedback_day(DAY_START) == "2023-05-01"
+    assert get_feedback_day(DAY_END) == "2023-05-01"
+    assert get_feedback_day(DAY_END + 1) == "2023-05-02"
+
+
+def test_ratings_are_counted_by_tool_and_day():
+    """Test that ratings are grouped by AI tool and day so each group is a single counter update."""
+    records = [
+        FeedbackTableModel("1", ai_tool_name="text-revisor", rating=5, timestamp=DAY_START),
+        FeedbackTableModel("2", ai_tool_name="text-revisor", rating=5, timestamp=DAY_END),
+        FeedbackTableModel("3", ai_tool_name="text-revisor", rating=2, timestamp=DAY_END + 1),
+        FeedbackTableModel("4", ai_tool_name="sandbox-chatgpt", rating=3, timestamp=DAY_START),
+    ]
+    rating_counts = count_feedback_ratings(records)
+    assert rating_counts == {
+        ("text-revisor", "2023-05-01"): {5: 2},
+        ("text-revisor", "2023-05-02"): {2: 1},
+        ("sandbox-chatgpt", "2023-05-01"): {3: 1},
+    }
+
+
+def test_average_rating():
+    """Test the average rating of a summary and that a period without feedback has none."""
+    summary = FeedbackRatingSummary("text-revisor", "2023-05-01", "2023-05-07", 4, 14, {})
+    assert summary.average_rating == 3.5
+    assert summary._replace(rating_count=0, rating_sum=0).average_rating is None
+
+
+def get_record(feedback_uuid: str, ai_tool_name: str, rating: int, timestamp: float) -> FeedbackTableModel:
+    return FeedbackTableModel(
+        feedback_uuid,
+        ai_tool_name=ai_tool_name,
+        user_UUID="user",
+        user_prompt_feedback_context={},
+        ai_response_feedback_context={},
+        rating=rating,
+        timestamp=timestamp,
+    )
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_ratings_of_every_flush_add_up_within_the_period():
+    """Test that the ratings of two flushed batches are added to the same counters, and that days outside the period are left out."""
+    day = 24 * 60 * 60
+    buffer = FeedbackBuffer(max_size=10)
+    for record in (
+        get_record("1", "text-revisor", 5, DAY_START),
+        get_record("2", "text-revisor", 4, DAY_START + day),
+        get_record("3", "text-revisor", 1, DAY_START - day),
+        get_record("4", "sandbox-chatgpt", 2, DAY_START),
+    ):
+        buffer.add(record)
+    assert buffer.flush() == 4
+    for record in (
+        get_record("5", "text-revisor", 5, DAY_END),
+        get_record("6", "text-revisor", 2, DAY_START + day),
+        get_record("7", "text-revisor", 3, DAY_START + 2 * day),
+    ):
+        buffer.add(record)
+    assert buffer.flush() == 3
+
+    summary = get_feedback_rating_summary("text-revisor", dt.date(2023, 5, 1), dt.date(2023, 5, 2))
+    assert summary.rating_count == 4
+    assert summary.rating_sum == 16
+    assert summary.rating_value_counts == {1: 0, 2: 1, 3: 0, 4: 1, 5: 2}
+    assert summary.average_rating == 4.0
+    summary = get_feedback_rating_summary("sandbox-chatgpt", dt.date(2023, 5, 1), dt.date(2023, 5, 2))
+    assert summary.rating_count == 1
+    assert summary.rating_value_counts[2] == 1
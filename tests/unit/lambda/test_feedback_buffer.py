@@ -0,0 +1,46 @@
+"""Test the buffer of feedback records written in batches."""
+from pynamodb.exceptions import PutError
+from dynamodb_models import FeedbackTableModel
+from feedback_buffer import FeedbackBuffer
+
+
+def get_records(count: int) -> list:
+    return [FeedbackTableModel(str(index)) for index in range(count)]
+
+
+def test_records_are_written_in_one_batch_on_flush():
+    """Test that the buffered records are written together and the buffer emptied."""
+    batches = []
+    buffer = FeedbackBuffer(max_size=10, write_batch=batches.append)
+    for record in get_records(3):
+        buffer.add(record)
+    assert not batches
+    assert buffer.flush() == 3
+    assert [[record.feedback_UUID for record in batch] for batch in batches] == [["0", "1", "2"]]
+    assert len(buffer) == 0
+    assert buffer.flush() == 0
+
+
+def test_full_buffer_is_flushed():
+    """Test that the record filling the buffer writes it."""
+    batches = []
+    buffer = FeedbackBuffer(max_size=2, write_batch=batches.append)
+    for record in get_records(3):
+        buffer.add(record)
+    assert len(batches) == 1
+    assert len(buffer) == 1
+
+
+def test_failed_records_are_kept_within_the_bound():
+    """Test that records of a failed batch are retried on the next flush, dropping the oldest once full."""
+    def fail(records):
+        raise PutError("throttled")
+
+    buffer = FeedbackBuffer(max_size=3, write_batch=fail)
+    for record in get_records(2):
+        buffer.add(record)
+    assert buffer.flush() == 0
+    assert len(buffer) == 2
+    for record in get_records(5)[2:]:
+        buffer.add(record)
+    assert [record.feedback_UUID for record in buffer._records] == ["2", "3", "4"]
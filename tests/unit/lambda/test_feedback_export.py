@@ -0,0 +1,45 @@
+"""Test the rate control and checkpoints of the feedback export."""
+import pytest
+from feedback_export import MIN_READ_UNITS_PER_SECOND, AdaptiveReadRate, ExportCheckpoint
+
+
+def test_read_rate_increases_additively_and_decreases_multiplicatively():
+    """Test that the read rate ramps up on success, halves when throttled and stays within its bounds."""
+    read_rate = AdaptiveReadRate(max_units_per_second=10, increase_units_per_second=1)
+    initial_rate = read_rate.units_per_second
+    read_rate.on_success()
+    assert read_rate.units_per_second == initial_rate + 1
+    read_rate.on_throttled()
+    assert read_rate.units_per_second == (initial_rate + 1) / 2
+    for _ in range(20):
+        read_rate.on_success()
+    assert read_rate.units_per_second == 10
+    for _ in range(20):
+        read_rate.on_throttled()
+    assert read_rate.units_per_second == MIN_READ_UNITS_PER_SECOND
+
+
+def test_page_consuming_more_than_the_capacity_is_paid_off():
+    """Test that a page consuming more than the capacity delays the next page until its units are refilled."""
+    read_rate = AdaptiveReadRate(max_units_per_second=10)
+    assert read_rate.units_per_second == 2.5
+    read_rate.acquire()
+    read_rate.consume(60)
+    # the bucket was full, it owes the 57.5 units consumed above its capacity
+    assert read_rate._bucket.try_acquire(0) == pytest.approx((60 - 2.5) / 2.5, rel=0.01)
+
+
+def test_checkpoint_is_resumed(tmp_path):
+    """Test that the progress of the segments is read back by a new export."""
+    checkpoint = ExportCheckpoint(tmp_path / "checkpoint.json", total_segments=2)
+    assert checkpoint.get_segment(1) == {"last_evaluated_key": None, "offset": 0, "item_count": 0, "done": False}
+    progress = {"last_evaluated_key": {"feedback_UUID": {"S": "a"}}, "offset": 120, "item_count": 5, "done": False}
+    checkpoint.save_segment(1, progress)
+    assert ExportCheckpoint(tmp_path / "checkpoint.json", total_segments=2).get_segment(1) == progress
+
+
+def test_checkpoint_of_another_segment_count_is_rejected(tmp_path):
+    """Test that an export cannot be resumed with a different number of segments."""
+    ExportCheckpoint(tmp_path / "checkpoint.json", total_segments=2).save_segment(0, {"done": True})
+    with pytest.raises(ValueError):
+        ExportCheckpoint(tmp_path / "checkpoint.json", total_segments=4)
@@ -0,0 +1,43 @@
+"""Test the validation of the feedback contexts against the models of the AI tool."""
+# pylint: disable=import-outside-toplevel,unused-import
+import pytest
+from pydantic import ValidationError
+
+SANDBOX_CHATGPT_FEEDBACK = {
+    "aiToolEndpointName": "sandbox-chatgpt",
+    "userPromptFeedbackContext": {"conversationUuid": "f4bd346a-9ade-4471-b127-1f73364df090", "userMessage": "Make me Famous"},
+    "aiResponseFeedbackContext": {"gptResponse": "Famous"},
+    "rating": "5",
+}
+
+
+def get_feedback_request(feedback: dict):
+    # the app adds the routers to the path, the feedback router imports the other routers from it
+    import ai_tools_lambda
+    from routers.feedback import FeedbackRequest
+    return FeedbackRequest(**feedback)
+
+
+def get_error_fields(feedback: dict) -> list:
+    with pytest.raises(ValidationError) as exc_info:
+        get_feedback_request(feedback)
+    return [error["loc"][0] for error in exc_info.value.errors()]
+
+
+def test_contexts_of_the_ai_tool_are_valid():
+    """Test that a request and response of the named AI tool are accepted as the feedback contexts."""
+    feedback_request = get_feedback_request(SANDBOX_CHATGPT_FEEDBACK)
+    assert feedback_request.user_prompt_feedback_context == SANDBOX_CHATGPT_FEEDBACK["userPromptFeedbackContext"]
+    assert feedback_request.ai_response_feedback_context == SANDBOX_CHATGPT_FEEDBACK["aiResponseFeedbackContext"]
+
+
+def test_contexts_of_another_ai_tool_are_rejected():
+    """Test that a text-revisor response is rejected as the response context of sandbox-chatgpt."""
+    feedback = {**SANDBOX_CHATGPT_FEEDBACK, "aiResponseFeedbackContext": {"revisedText": "Famous"}}
+    assert get_error_fields(feedback) == ["aiResponseFeedbackContext"]
+
+
+def test_invalid_ai_tool_only_reports_its_own_error():
+    """Test that the contexts are not validated against the models of an unknown AI tool."""
+    feedback = {**SANDBOX_CHATGPT_FEEDBACK, "aiToolEndpointName": "unknown-tool"}
+    assert get_error_fields(feedback) == ["aiToolEndpointName"]
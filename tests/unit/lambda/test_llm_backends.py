@@ -0,0 +1,59 @@
+"""Test the pluggable LLM backends."""
+import pytest
+from openai.error import RateLimitError
+from llm_backends import (
+    ChatCompletionRequest,
+    FakeBackend,
+    LLMBackendName,
+    LLMBackendSettings,
+    RecordReplayBackend,
+    create_llm_backend,
+)
+from custom_exceptions import RecordedCompletionNotFoundError
+
+
+@pytest.fixture
+def completion_request() -> ChatCompletionRequest:
+    return ChatCompletionRequest(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": "Hello"}],
+        temperature=0.5,
+        frequency_penalty=0.0,
+        presence_penalty=0.0,
+        max_tokens=20,
+        user="user-1",
+    )
+
+
+def get_fake_settings(**settings) -> LLMBackendSettings:
+    settings.setdefault("fake_llm_latency_mean_seconds", 0)
+    settings.setdefault("fake_llm_stream_chunk_interval_seconds", 0)
+    return LLMBackendSettings(llm_backend=LLMBackendName.FAKE, **settings)
+
+
+def test_fake_backend_is_deterministic(completion_request):
+    """Test that the fake backend returns the same completion for the same request."""
+    backend = create_llm_backend(get_fake_settings(fake_llm_completion_tokens=8, fake_llm_prompt_tokens=5))
+    completion = backend.create_chat_completion(completion_request, request_timeout=1)
+    assert completion == backend.create_chat_completion(completion_request.copy(update={"user": "user-2"}), request_timeout=1)
+    assert completion.completion_tokens == 8
+    assert completion.prompt_tokens == 5
+    assert "".join(backend.stream_chat_completion(completion_request, request_timeout=1)) == completion.content
+
+
+def test_fake_backend_injects_errors(completion_request):
+    """Test that the fake backend raises the configured error."""
+    backend = FakeBackend(get_fake_settings(fake_llm_error_rate=1, fake_llm_error_type="rate_limit"))
+    with pytest.raises(RateLimitError):
+        backend.create_chat_completion(completion_request, request_timeout=1)
+
+
+def test_recorded_completions_are_replayed(completion_request, tmp_path):
+    """Test that a completion recorded from a backend is replayed for the same request."""
+    recording_path = tmp_path / "recordings.jsonl"
+    recorder = RecordReplayBackend(recording_path, backend=FakeBackend(get_fake_settings()))
+    completion = recorder.create_chat_completion(completion_request, request_timeout=1)
+    replayer = RecordReplayBackend(recording_path)
+    assert replayer.create_chat_completion(completion_request, request_timeout=1) == completion
+    with pytest.raises(RecordedCompletionNotFoundError):
+        replayer.create_chat_completion(completion_request.copy(update={"max_tokens": 10}), request_timeout=1)
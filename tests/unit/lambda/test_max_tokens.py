@@ -0,0 +1,37 @@
+"""Test the sizing of the max tokens requested for a response."""
+# pylint: disable=import-outside-toplevel
+
+
+def test_max_tokens_is_capped_by_the_ceiling():
+    """Test that the ceiling of the endpoint is requested when nothing else is smaller."""
+    from gpt_turbo import size_max_tokens
+    assert size_max_tokens(max_tokens=200, prompt_token_count=100, context_window=3800) == 200
+    assert size_max_tokens(max_tokens=200, prompt_token_count=100, context_window=3800, expected_response_token_count=1000) == 200
+
+
+def test_expected_response_size_has_a_margin():
+    """Test that the expected response size is requested with a margin so longer responses are not cut off."""
+    from gpt_turbo import EXPECTED_RESPONSE_TOKEN_MARGIN, size_max_tokens
+    max_tokens = size_max_tokens(max_tokens=2000, prompt_token_count=100, context_window=3800, expected_response_token_count=120)
+    assert max_tokens == 120 * EXPECTED_RESPONSE_TOKEN_MARGIN
+
+
+def test_max_tokens_is_capped_by_the_quota_left():
+    """Test that no more tokens are requested than the user has left."""
+    from gpt_turbo import size_max_tokens
+    assert size_max_tokens(max_tokens=2000, prompt_token_count=100, context_window=3800, tokens_left=500) == 500
+
+
+def test_max_tokens_has_a_floor():
+    """Test that a minimal response is requested even when the estimates are smaller."""
+    from gpt_turbo import MIN_TOKENS_FROM_GPT_RESPONSE, size_max_tokens
+    max_tokens = size_max_tokens(max_tokens=2000, prompt_token_count=100, context_window=3800, expected_response_token_count=10)
+    assert max_tokens == MIN_TOKENS_FROM_GPT_RESPONSE
+
+
+def test_max_tokens_never_exceeds_the_context_window():
+    """Test that the context window clamps the max tokens after the floor."""
+    from gpt_turbo import MIN_TOKENS_FROM_GPT_RESPONSE, size_max_tokens
+    assert size_max_tokens(max_tokens=2000, prompt_token_count=3000, context_window=3800) == 800
+    max_tokens = size_max_tokens(max_tokens=2000, prompt_token_count=3780, context_window=3800)
+    assert max_tokens == 20 < MIN_TOKENS_FROM_GPT_RESPONSE
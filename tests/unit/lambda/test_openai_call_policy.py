@@ -0,0 +1,53 @@
+"""Test the retry and hedging policy for OpenAI calls."""
+import time
+import pytest
+from openai.error import InvalidRequestError, Timeout
+from openai_call_policy import OpenAICallPolicy, OpenAICallPolicySettings
+
+
+def get_policy(**settings) -> OpenAICallPolicy:
+    settings.setdefault("openai_backoff_base_seconds", 0.001)
+    return OpenAICallPolicy(OpenAICallPolicySettings(**settings))
+
+
+def test_retryable_errors_are_retried():
+    """Test that a timeout is retried and the successful response returned."""
+    attempts = []
+
+    def create_completion(request_timeout):
+        attempts.append(request_timeout)
+        if len(attempts) < 3:
+            raise Timeout("timed out")
+        return "response"
+
+    assert get_policy(openai_max_retries=2).call(create_completion) == "response"
+    assert len(attempts) == 3
+
+
+def test_non_retryable_errors_are_raised():
+    """Test that invalid requests are not retried."""
+    attempts = []
+
+    def create_completion(request_timeout):
+        attempts.append(request_timeout)
+        raise InvalidRequestError("bad request", param=None)
+
+    with pytest.raises(InvalidRequestError):
+        get_policy().call(create_completion)
+    assert len(attempts) == 1
+
+
+def test_slow_attempt_is_hedged():
+    """Test that a hedged request is sent when the first attempt is slow and the fastest response wins."""
+    attempts = []
+
+    def create_completion(request_timeout):
+        attempts.append(request_timeout)
+        if len(attempts) == 1:
+            time.sleep(0.5)
+            return "slow response"
+        return "hedged response"
+
+    policy = get_policy(openai_hedging_enabled=True, openai_hedge_default_delay_seconds=0.05)
+    assert policy.call(create_completion, can_hedge=lambda: True) == "hedged response"
+    assert len(attempts) == 2
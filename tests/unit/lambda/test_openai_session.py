@@ -0,0 +1,31 @@
+"""Test the pooled keep-alive session installed in the openai client."""
+import threading
+import openai
+import requests
+import openai_session
+from openai_session import OpenAIHTTPSettings, install_openai_session
+
+
+def test_installed_session_is_shared_by_the_threads(monkeypatch):
+    """Test that the session made by the openai client for every thread is the installed one."""
+    monkeypatch.setattr(openai_session, "_openai_session", None)
+    monkeypatch.setattr(openai.api_requestor, "_make_session", openai.api_requestor._make_session)
+    session = install_openai_session(OpenAIHTTPSettings())
+    assert install_openai_session() is session
+    thread_sessions = []
+    thread = threading.Thread(target=lambda: thread_sessions.append(openai.api_requestor._make_session()))
+    thread.start()
+    thread.join()
+    assert thread_sessions == [session]
+    assert openai.api_requestor._make_session() is session
+
+
+def test_requests_honor_the_openai_proxy(monkeypatch):
+    """Test that requests are sent through openai.proxy with the connect timeout."""
+    sent_requests = []
+    monkeypatch.setattr(requests.Session, "request", lambda self, method, url, **kwargs: sent_requests.append(kwargs))
+    monkeypatch.setattr(openai, "proxy", "http://proxy.example.com:3128")
+    session = openai_session.create_openai_session(OpenAIHTTPSettings(openai_connect_timeout_seconds=3))
+    session.request("POST", "https://api.openai.com/v1/chat/completions", timeout=600)
+    assert sent_requests[0]["proxies"] == {"http": "http://proxy.example.com:3128", "https": "http://proxy.example.com:3128"}
+    assert sent_requests[0]["timeout"] == (3, 600)
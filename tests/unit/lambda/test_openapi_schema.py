@@ -0,0 +1,72 @@
+"""Test the OpenAPI schema generated at build time."""
+# pylint: disable=import-outside-toplevel
+import json
+import pytest
+
+
+@pytest.fixture
+def app_environment(monkeypatch):
+    """Set the environment the app modules read their settings from when they are imported."""
+    monkeypatch.setenv("OPENAI_LAMBDA_ID", "test_lambda_id")
+    monkeypatch.setenv("OPENAI_API_DIR", "openai_api")
+    monkeypatch.setenv("OPENAI_ROUTE_PREFIX", "openai")
+    # the app does not fetch the OpenAI secrets with the fake backend
+    monkeypatch.setenv("LLM_BACKEND", "fake")
+
+
+@pytest.mark.usefixtures("app_environment")
+def test_openapi_schema_matches_the_app():
+    """Test that openapi.json was regenerated after the last change of the API, with generate_openapi_schema.py."""
+    from ai_tools_lambda import create_fastapi_app
+    from openapi_schema import OPENAPI_SCHEMA_PATH, get_openapi_schema_json
+    app = create_fastapi_app()
+    app.openapi_schema = None
+    assert get_openapi_schema_json(app, "openai") == OPENAPI_SCHEMA_PATH.read_text(encoding="utf-8")
+
+
+def create_prefixed_app(route_prefix: str):
+    """Create an app with a route under a prefix, named like the app names its operations."""
+    from fastapi import APIRouter, FastAPI
+    from openapi_schema import get_unique_id_generator
+    router = APIRouter()
+
+    @router.get("/status")
+    def get_status():
+        return {}
+
+    app = FastAPI(generate_unique_id_function=get_unique_id_generator(route_prefix))
+    app.include_router(router, prefix=f"/{route_prefix}")
+    return app
+
+
+@pytest.mark.usefixtures("app_environment")
+def test_schema_is_served_for_the_route_prefix_of_the_deployment(tmp_path):
+    """Test that a schema generated with one route prefix is loaded as the schema of the app deployed with another one."""
+    from openapi_schema import get_openapi_schema_json, load_openapi_schema
+    path = tmp_path / "openapi.json"
+    assert load_openapi_schema(path, "openai") is None
+    path.write_text(get_openapi_schema_json(create_prefixed_app("openai"), "openai"))
+    assert list(json.loads(path.read_text())["paths"]) == ["/status"]
+    assert load_openapi_schema(path, "ai-for-u") == create_prefixed_app("ai-for-u").openapi()
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_schema_is_prerendered_once_for_the_apps_of_every_invocation(monkeypatch):
+    """Test that the apps created on every invocation serve the schema prerendered by the first one."""
+    from fastapi.testclient import TestClient
+    import openapi_schema
+    from ai_tools_lambda import create_fastapi_app
+    prerendered_response_class = openapi_schema.PrerenderedResponse
+    prerendered_responses = []
+
+    def prerender(*args, **kwargs):
+        prerendered_responses.append(prerendered_response_class(*args, **kwargs))
+        return prerendered_responses[-1]
+
+    monkeypatch.setattr(openapi_schema, "_prerendered_schemas", {})
+    monkeypatch.setattr(openapi_schema, "PrerenderedResponse", prerender)
+    responses = [TestClient(create_fastapi_app()).get("/openai/openapi.json") for _ in range(2)]
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].headers["ETag"] == responses[1].headers["ETag"]
+    assert len(prerendered_responses) == 1
+    assert "/openai/text-revisor" in responses[0].json()["paths"]
@@ -0,0 +1,44 @@
+"""Test the prerendered examples responses served by the app."""
+EXAMPLES_PATH = "/openai/text-revisor-examples"
+# the test client accepts gzip by default
+JSON_HEADERS = {"Accept": "application/json", "Accept-Encoding": "identity"}
+
+
+def test_examples_are_revalidated_with_their_etag(app_client, user_headers):
+    """Test that the examples are cached publicly for a day and that sending their ETag back gets an empty 304."""
+    response = app_client.get(EXAMPLES_PATH, headers={**user_headers, **JSON_HEADERS})
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "public, max-age=86400"
+    etag = response.headers["ETag"]
+    assert etag.startswith('"') and not etag.startswith('W/')
+
+    revalidation = app_client.get(EXAMPLES_PATH, headers={**user_headers, **JSON_HEADERS, "If-None-Match": etag})
+    assert revalidation.status_code == 304
+    assert revalidation.content == b""
+    assert revalidation.headers["ETag"] == etag
+    assert revalidation.headers["Cache-Control"] == "public, max-age=86400"
+
+    changed = app_client.get(EXAMPLES_PATH, headers={**user_headers, **JSON_HEADERS, "If-None-Match": '"other-etag"'})
+    assert changed.status_code == 200
+    assert changed.json() == response.json()
+
+
+def test_every_encoding_has_its_own_etag(app_client, user_headers):
+    """Test that the gzip encoded examples are a representation with another ETag, revalidated on its own."""
+    identity = app_client.get(EXAMPLES_PATH, headers={**user_headers, **JSON_HEADERS})
+    gzipped = app_client.get(EXAMPLES_PATH, headers={**user_headers, **JSON_HEADERS, "Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in identity.headers
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert gzipped.json() == identity.json()
+    assert gzipped.headers["ETag"] != identity.headers["ETag"]
+
+    revalidation = app_client.get(
+        EXAMPLES_PATH,
+        headers={**user_headers, **JSON_HEADERS, "Accept-Encoding": "gzip", "If-None-Match": identity.headers["ETag"]},
+    )
+    assert revalidation.status_code == 200
+    revalidation = app_client.get(
+        EXAMPLES_PATH,
+        headers={**user_headers, **JSON_HEADERS, "Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["ETag"]},
+    )
+    assert revalidation.status_code == 304
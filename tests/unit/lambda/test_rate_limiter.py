@@ -0,0 +1,34 @@
+"""Test the client side OpenAI rate limiter."""
+import pytest
+from custom_exceptions import OpenAIRateLimitExceededError
+from rate_limiter import AdaptiveRateLimiter, OpenAIRateLimitSettings, RateLimiterBackend
+
+
+@pytest.fixture
+def rate_limiter() -> AdaptiveRateLimiter:
+    settings = OpenAIRateLimitSettings(
+        openai_tokens_per_minute_limit=1000,
+        openai_requests_per_minute_limit=10,
+        rate_limiter_backend=RateLimiterBackend.MEMORY,
+        rate_limiter_max_wait_seconds=0,
+    )
+    return AdaptiveRateLimiter.from_settings(settings)
+
+
+def test_requests_are_shed_when_quota_is_exhausted(rate_limiter):
+    """Test that requests beyond the token quota are shed with a retry after."""
+    rate_limiter.acquire(600)
+    with pytest.raises(OpenAIRateLimitExceededError) as exc_info:
+        rate_limiter.acquire(600)
+    assert exc_info.value.retry_after > 0
+
+
+def test_rate_limited_reduces_share_of_quota(rate_limiter):
+    """Test that a rate limit error from OpenAI reduces the share of the quota used."""
+    rate_limiter.report_rate_limited()
+    assert rate_limiter.limit_scale == 0.5
+    rate_limiter.acquire(300)
+    with pytest.raises(OpenAIRateLimitExceededError):
+        rate_limiter.acquire(300)
+    rate_limiter.report_success()
+    assert rate_limiter.limit_scale == pytest.approx(0.55)
@@ -0,0 +1,86 @@
+"""Test the negotiated compression of the responses."""
+# pylint: disable=import-outside-toplevel
+from fastapi import FastAPI, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from response_compression import CompressionMiddleware, CompressionSettings, get_accepted_encoding
+
+LARGE_BODY = b'{"response": "' + b"a long summary " * 200 + b'"}'
+GZIP_JSON_HEADERS = {"Accept": "application/json", "Accept-Encoding": "gzip"}
+
+
+def get_client() -> TestClient:
+    app = FastAPI()
+
+    @app.get("/large")
+    def large():
+        return Response(content=LARGE_BODY, media_type="application/json", headers={"Vary": "Origin"})
+
+    @app.get("/small")
+    def small():
+        return Response(content=b'{"response": "short"}', media_type="application/json")
+
+    @app.get("/negotiated")
+    def negotiated():
+        return Response(content=LARGE_BODY, media_type="application/json", headers={"Vary": "Accept-Encoding"})
+
+    app.add_middleware(CompressionMiddleware, settings=CompressionSettings(compression_minimum_size=1024))
+    return TestClient(app)
+
+
+def test_preferred_accepted_encoding_is_used():
+    """Test that the encoding with the highest quality is used, the first available one on ties."""
+    encodings = ["br", "gzip"]
+    assert get_accepted_encoding("gzip, deflate, br", encodings) == "br"
+    assert get_accepted_encoding("gzip;q=1.0, br;q=0.5", encodings) == "gzip"
+    assert get_accepted_encoding("br;q=0, *", encodings) == "gzip"
+    assert get_accepted_encoding("identity", encodings) is None
+    assert get_accepted_encoding(None, encodings) is None
+
+
+def test_large_responses_are_compressed():
+    """Test that large responses are compressed and vary with the Accept and Accept-Encoding headers as well."""
+    response = get_client().get("/large", headers=GZIP_JSON_HEADERS)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert int(response.headers["Content-Length"]) < len(LARGE_BODY)
+    assert response.headers["Vary"] == "Origin, Accept, Accept-Encoding"
+    assert response.content == LARGE_BODY
+
+
+def test_responses_are_not_compressed_when_not_worth_it_or_not_accepted():
+    """Test that small, already negotiated and not accepted responses are sent as they are."""
+    client = get_client()
+    assert "Content-Encoding" not in client.get("/small", headers=GZIP_JSON_HEADERS).headers
+    assert "Content-Encoding" not in client.get("/negotiated", headers=GZIP_JSON_HEADERS).headers
+    response = client.get("/large", headers={"Accept": "application/json", "Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Origin, Accept, Accept-Encoding"
+
+
+def test_responses_not_decoded_by_api_gateway_are_not_compressed():
+    """Test that responses are not compressed when the first accepted type is not a binary media type of the rest api."""
+    response = get_client().get("/large", headers={"Accept": "*/*", "Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.content == LARGE_BODY
+
+
+def test_responses_of_the_app_are_compressed(app_client, user_headers, monkeypatch):
+    """Test that the responses of the routes, re-streamed in chunks by the http middleware of the app, are compressed."""
+    from example_outputs import ExampleOutput, example_output_store
+    from routers.text_revisor import ENDPOINT_NAME, EXAMPLES_RESPONSE
+    from utils import get_canonical_request_hash
+    example = EXAMPLES_RESPONSE.examples[0]
+    revised_text = "A revised sentence. " * 200
+    monkeypatch.setitem(
+        example_output_store.outputs,
+        get_canonical_request_hash(ENDPOINT_NAME, example),
+        ExampleOutput(ENDPOINT_NAME, "Test", {"revisedText": revised_text}, 0),
+    )
+    response = app_client.post(
+        f"/openai/{ENDPOINT_NAME}",
+        json=jsonable_encoder(example),
+        headers={**user_headers, **GZIP_JSON_HEADERS},
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.json()["revisedText"] == revised_text
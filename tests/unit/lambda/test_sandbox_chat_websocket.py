@@ -0,0 +1,69 @@
+"""Test the WebSocket transport of sandbox-chatgpt offline, with moto and the fake LLM backend."""
+# pylint: disable=import-outside-toplevel
+import json
+import uuid
+import pytest
+
+
+def get_message_body(user_message: str = "Tell me about chinchillas.") -> str:
+    return json.dumps({"action": "sendMessage", "conversationUuid": str(uuid.uuid4()), "userMessage": user_message})
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_connect_stores_the_connection_of_the_user():
+    """Test that opening a connection stores it with the user, and that a connection without a UUID is refused."""
+    from dynamodb_models import SandboxChatConnectionTableModel
+    from sandbox_chat_websocket import LocalWebSocketGateway
+    gateway = LocalWebSocketGateway()
+    user_uuid = str(uuid.uuid4())
+    connection_id, response = gateway.connect(query_parameters={"uuid": user_uuid})
+    assert response["statusCode"] == 200
+    connection = SandboxChatConnectionTableModel.get(connection_id)
+    assert connection.user_uuid == user_uuid
+    assert not connection.authenticated
+    _, response = gateway.connect()
+    assert response["statusCode"] == 401
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_message_streams_its_chunks_then_the_response():
+    """Test that the response to a message is posted in chunks followed by a done event with the full response."""
+    from sandbox_chat_websocket import LocalWebSocketGateway
+    gateway = LocalWebSocketGateway()
+    connection_id, _ = gateway.connect(query_parameters={"uuid": str(uuid.uuid4())})
+    response = gateway.send(connection_id, get_message_body())
+    assert response["statusCode"] == 200
+    events = [json.loads(data) for data in gateway.sent_data[connection_id]]
+    assert [event["type"] for event in events[:-1]] == ["chunk"] * (len(events) - 1)
+    assert len(events) > 2
+    assert events[-1]["type"] == "done"
+    assert events[-1]["content"]
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_message_is_rejected_when_the_tokens_are_exhausted():
+    """Test that a user without tokens left gets an error event instead of a response."""
+    from dynamodb_models import UserDataTableModel
+    from sandbox_chat_websocket import LocalWebSocketGateway
+    gateway = LocalWebSocketGateway()
+    user_uuid = str(uuid.uuid4())
+    connection_id, _ = gateway.connect(query_parameters={"uuid": user_uuid})
+    UserDataTableModel.get(user_uuid).update(actions=[UserDataTableModel.cumulative_token_count.set(10 ** 6)])
+    response = gateway.send(connection_id, get_message_body())
+    assert response["statusCode"] == 429
+    events = [json.loads(data) for data in gateway.sent_data[connection_id]]
+    assert [event["type"] for event in events] == ["error"]
+    assert events[0]["statusCode"] == 429
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_disconnect_deletes_the_connection():
+    """Test that closing a connection deletes it, so later messages on it are refused."""
+    from dynamodb_models import SandboxChatConnectionTableModel
+    from sandbox_chat_websocket import LocalWebSocketGateway
+    gateway = LocalWebSocketGateway()
+    connection_id, _ = gateway.connect(query_parameters={"uuid": str(uuid.uuid4())})
+    assert gateway.disconnect(connection_id)["statusCode"] == 200
+    with pytest.raises(SandboxChatConnectionTableModel.DoesNotExist):
+        SandboxChatConnectionTableModel.get(connection_id)
+    assert gateway.send(connection_id, get_message_body())["statusCode"] == 403
@@ -0,0 +1,206 @@
+"""Test the storage of the sandbox-chatgpt conversations offline, with moto and the fake LLM backend."""
+# pylint: disable=import-outside-toplevel
+import base64
+import json
+import uuid
+import pytest
+
+
+def save_messages(conversation_key: str, message_indexes: range) -> None:
+    """Save messages alternating between the user and the assistant, starting with the user."""
+    from dynamodb_models import SandboxChatMessageTableModel
+    for message_index in message_indexes:
+        role = "user" if message_index % 2 == 0 else "assistant"
+        SandboxChatMessageTableModel.from_message(conversation_key, message_index, role, f"message {message_index}", token_count=3).save()
+
+
+def get_chat_history(conversation_uuid: uuid.UUID, first_loaded_message_index: int, next_message_index: int):
+    """Get a chat history holding the messages from the first loaded index, with their stored contents."""
+    from gpt_turbo import GPTTurboChat
+    from routers.sandbox_chatgpt import GPTChatHistory
+    return GPTChatHistory(
+        conversation_uuid=conversation_uuid,
+        next_message_index=next_message_index,
+        messages=tuple(
+            GPTTurboChat(role="user" if index % 2 == 0 else "assistant", content=f"message {index}", token_count=3)
+            for index in range(first_loaded_message_index, next_message_index)
+        ),
+    )
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_earlier_turns_are_cached_between_turns():
+    """Test that a later turn only queries the messages that left the chat history, and all of them when it starts before the cached ones."""
+    from dynamodb_models import SandboxChatMessageTableModel, get_sandbox_conversation_key
+    from routers.sandbox_chatgpt import load_earlier_sandbox_chat_turns
+    user_uuid, conversation_uuid = uuid.uuid4(), uuid.uuid4()
+    conversation_key = get_sandbox_conversation_key(str(user_uuid), str(conversation_uuid))
+    save_messages(conversation_key, range(10))
+
+    turns = load_earlier_sandbox_chat_turns(user_uuid, get_chat_history(conversation_uuid, 4, 8))
+    assert [[message.content for message in turn] for turn in turns] == [["message 0", "message 1"], ["message 2", "message 3"]]
+
+    # a message served from the cache is still retrieved after it is gone from the table
+    SandboxChatMessageTableModel(conversation_key, 0).delete()
+    turns = load_earlier_sandbox_chat_turns(user_uuid, get_chat_history(conversation_uuid, 6, 10))
+    assert [turn[0].content for turn in turns] == ["message 0", "message 2", "message 4"]
+
+    turns = load_earlier_sandbox_chat_turns(user_uuid, get_chat_history(conversation_uuid, 2, 10))
+    assert [[message.content for message in turn] for turn in turns] == [["message 1"]]
+
+
+def get_turn(user_message: str, assistant_message: str, token_count: int = 3) -> tuple:
+    from gpt_turbo import GPTTurboChat
+    return (
+        GPTTurboChat(role="user", content=user_message, token_count=token_count),
+        GPTTurboChat(role="assistant", content=assistant_message, token_count=token_count),
+    )
+
+
+def get_stored_contents(user_uuid: str, conversation_uuid: uuid.UUID) -> list:
+    from dynamodb_models import SandboxChatMessageTableModel, get_sandbox_conversation_key
+    conversation_key = get_sandbox_conversation_key(user_uuid, str(conversation_uuid))
+    return [model.get_role_and_content()[1] for model in SandboxChatMessageTableModel.query(conversation_key)]
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_concurrent_turns_are_both_saved():
+    """Test that a turn saved from a stale chat history is rebased after the concurrent turn instead of overwriting it."""
+    from dynamodb_models import SandboxConversationTableModel
+    from routers.sandbox_chatgpt import GPTChatHistory, append_sandbox_chat_messages
+    user_uuid, conversation_uuid = str(uuid.uuid4()), uuid.uuid4()
+    chat_history = GPTChatHistory(conversation_uuid=conversation_uuid)
+    first_chat_history = append_sandbox_chat_messages(user_uuid, chat_history, get_turn("first question", "first answer"))
+    second_chat_history = append_sandbox_chat_messages(user_uuid, chat_history, get_turn("second question", "second answer"))
+    assert second_chat_history.next_message_index == 4
+    assert second_chat_history.version > first_chat_history.version
+    assert get_stored_contents(user_uuid, conversation_uuid) == ["first question", "first answer", "second question", "second answer"]
+    conversation_model = SandboxConversationTableModel.get(user_uuid, str(conversation_uuid))
+    assert conversation_model.message_count == 4
+    assert conversation_model.token_count == 12
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_turn_is_not_saved_after_the_last_save_attempt(monkeypatch):
+    """Test that a turn conflicting on every attempt fails after the maximum number of attempts without writing its messages."""
+    from pynamodb.exceptions import UpdateError
+    from routers import sandbox_chatgpt
+    from routers.sandbox_chatgpt import MAX_SAVE_ATTEMPTS, GPTChatHistory, append_sandbox_chat_messages
+    user_uuid, conversation_uuid = str(uuid.uuid4()), uuid.uuid4()
+    chat_history = GPTChatHistory(conversation_uuid=conversation_uuid)
+    append_sandbox_chat_messages(user_uuid, chat_history, get_turn("first question", "first answer"))
+    merges = []
+
+    def merge_without_rebasing(user_uuid, chat_history):
+        merges.append(chat_history)
+        return chat_history
+
+    monkeypatch.setattr(sandbox_chatgpt, "merge_concurrent_sandbox_chat_update", merge_without_rebasing)
+    with pytest.raises(UpdateError):
+        append_sandbox_chat_messages(user_uuid, chat_history, get_turn("second question", "second answer"))
+    assert len(merges) == MAX_SAVE_ATTEMPTS - 1
+    assert get_stored_contents(user_uuid, conversation_uuid) == ["first question", "first answer"]
+
+
+def tamper_cursor(cursor: str, partition_key_name: str, partition_key: str) -> str:
+    """Get a cursor starting from the same key in another partition."""
+    exclusive_start_key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    exclusive_start_key[partition_key_name] = {"S": partition_key}
+    return base64.urlsafe_b64encode(json.dumps(exclusive_start_key).encode()).decode()
+
+
+def test_conversations_are_paginated_with_cursors_of_the_user(app_client, user_headers):
+    """Test that the conversations are paged with the returned cursor, and that cursors of another user or not issued by the app are rejected."""
+    from dynamodb_models import SandboxConversationTableModel
+    from routers.sandbox_chatgpt import GPTChatHistory, append_sandbox_chat_messages
+    from utils import UUID_HEADER_NAME
+    user_uuid = user_headers[UUID_HEADER_NAME]
+    for conversation_number in range(3):
+        chat_history = GPTChatHistory(conversation_uuid=uuid.uuid4())
+        append_sandbox_chat_messages(user_uuid, chat_history, get_turn(f"question {conversation_number}", "answer"))
+    url = "/openai/sandbox-chatgpt-conversations"
+    first_page = app_client.get(url, params={"limit": 2}, headers=user_headers).json()
+    second_page = app_client.get(url, params={"limit": 2, "cursor": first_page["nextCursor"]}, headers=user_headers).json()
+    # moto applies the limit before the descending sort, so only the split of the pages is checked
+    titles = [conversation["title"] for page in (first_page, second_page) for conversation in page["conversations"]]
+    assert len(first_page["conversations"]) == 2
+    assert sorted(titles) == ["question 0", "question 1", "question 2"]
+
+    partition_key_name = SandboxConversationTableModel.user_uuid.attr_name
+    other_user_cursor = tamper_cursor(first_page["nextCursor"], partition_key_name, str(uuid.uuid4()))
+    for cursor in (other_user_cursor, "not-a-cursor", base64.urlsafe_b64encode(b"[]").decode()):
+        response = app_client.get(url, params={"cursor": cursor}, headers=user_headers)
+        assert response.status_code == 400
+
+
+def test_messages_are_paginated_with_cursors_of_the_conversation(app_client, user_headers):
+    """Test that the messages are paged with the returned cursor, and that a cursor of another conversation is rejected."""
+    from dynamodb_models import SandboxChatMessageTableModel, get_sandbox_conversation_key
+    from routers.sandbox_chatgpt import GPTChatHistory, append_sandbox_chat_messages
+    from utils import UUID_HEADER_NAME
+    user_uuid, conversation_uuid = user_headers[UUID_HEADER_NAME], uuid.uuid4()
+    append_sandbox_chat_messages(user_uuid, GPTChatHistory(conversation_uuid=conversation_uuid), get_turn("question", "answer"))
+    url = f"/openai/sandbox-chatgpt-conversations/{conversation_uuid}/messages"
+    first_page = app_client.get(url, params={"limit": 1}, headers=user_headers).json()
+    second_page = app_client.get(url, params={"limit": 1, "cursor": first_page["nextCursor"]}, headers=user_headers).json()
+    contents = [message["content"] for page in (first_page, second_page) for message in page["messages"]]
+    assert len(first_page["messages"]) == 1
+    assert sorted(contents) == ["answer", "question"]
+
+    partition_key_name = SandboxChatMessageTableModel.conversation_key.attr_name
+    other_conversation_key = get_sandbox_conversation_key(user_uuid, str(uuid.uuid4()))
+    response = app_client.get(
+        url,
+        params={"cursor": tamper_cursor(first_page["nextCursor"], partition_key_name, other_conversation_key)},
+        headers=user_headers,
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_legacy_chat_history_is_migrated_to_message_items():
+    """Test that the conversation stored in the user data is continued from message items, and that other conversations start empty."""
+    from dynamodb_models import UserDataTableModel
+    from routers.sandbox_chatgpt import GPTChatHistory, load_sandbox_chat_history
+    user_uuid, conversation_uuid = str(uuid.uuid4()), uuid.uuid4()
+    legacy_chat_history = GPTChatHistory(conversation_uuid=conversation_uuid, messages=get_turn("legacy question", "legacy answer"))
+    UserDataTableModel(user_uuid, sandbox_chat_history=json.loads(legacy_chat_history.json())).save()
+
+    chat_history = load_sandbox_chat_history(user_uuid, conversation_uuid)
+    assert [message.content for message in chat_history.messages] == ["legacy question", "legacy answer"]
+    assert chat_history.next_message_index == 2
+    assert get_stored_contents(user_uuid, conversation_uuid) == ["legacy question", "legacy answer"]
+    assert not load_sandbox_chat_history(user_uuid, uuid.uuid4()).messages
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_compaction_keeps_the_last_messages():
+    """Test that compaction folds all but the last messages into the stored summary, and that a reload only reads the messages after it."""
+    from dynamodb_models import SandboxConversationTableModel, UserDataTableModel
+    from routers.sandbox_chatgpt import (
+        MESSAGES_KEPT_AFTER_COMPACTION,
+        GPTChatHistory,
+        append_sandbox_chat_messages,
+        compact_sandbox_chat_history,
+        invalidate_cached_sandbox_chat_history,
+        load_sandbox_chat_history,
+    )
+    user_uuid, conversation_uuid = str(uuid.uuid4()), uuid.uuid4()
+    UserDataTableModel(user_uuid).save()
+    messages = sum((get_turn(f"question {turn}", f"answer {turn}", token_count=100) for turn in range(3)), ())
+    chat_history = append_sandbox_chat_messages(user_uuid, GPTChatHistory(conversation_uuid=conversation_uuid), messages)
+
+    compacted_chat_history = compact_sandbox_chat_history(user_uuid, chat_history)
+    assert MESSAGES_KEPT_AFTER_COMPACTION == 4
+    assert compacted_chat_history.messages == messages[-4:]
+    assert compacted_chat_history.summarized_through_index == 2
+    assert compacted_chat_history.summary
+    conversation_model = SandboxConversationTableModel.get(user_uuid, str(conversation_uuid))
+    assert conversation_model.summary == compacted_chat_history.summary
+    assert conversation_model.summarized_through_index == 2
+    assert compacted_chat_history.version == conversation_model.version
+
+    invalidate_cached_sandbox_chat_history(user_uuid, conversation_uuid)
+    loaded_chat_history = load_sandbox_chat_history(user_uuid, conversation_uuid)
+    assert [message.content for message in loaded_chat_history.messages] == [message.content for message in messages[-4:]]
+    assert loaded_chat_history.summary == compacted_chat_history.summary
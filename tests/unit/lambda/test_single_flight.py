@@ -0,0 +1,45 @@
+"""Test the single-flight coalescing of identical requests."""
+import asyncio
+import time
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_with_same_key_are_coalesced():
+    """Test that concurrent calls sharing a key make a single call and share its result."""
+    calls = []
+
+    def get_response():
+        calls.append(1)
+        time.sleep(0.1)
+        return "response"
+
+    async def make_calls():
+        single_flight = SingleFlight()
+        return await asyncio.gather(
+            single_flight.do("key", get_response, caller="user-1"),
+            single_flight.do("key", get_response, caller="user-2"),
+            single_flight.do("other-key", get_response, caller="user-2"),
+        )
+
+    results = asyncio.run(make_calls())
+    assert len(calls) == 2
+    assert results == [("response", "user-1"), ("response", "user-1"), ("response", "user-2")]
+
+
+def test_followers_make_their_own_call_when_the_leader_fails():
+    """Test that the error of the leader, e.g. its exhausted quota, is not raised to the followers."""
+    def get_leader_response():
+        time.sleep(0.1)
+        raise RuntimeError("tokens exhausted for user-1")
+
+    async def make_calls():
+        single_flight = SingleFlight()
+        return await asyncio.gather(
+            single_flight.do("key", get_leader_response, caller="user-1"),
+            single_flight.do("key", lambda: "response", caller="user-2"),
+            return_exceptions=True,
+        )
+
+    leader_result, follower_result = asyncio.run(make_calls())
+    assert isinstance(leader_result, RuntimeError)
+    assert follower_result == ("response", "user-2")
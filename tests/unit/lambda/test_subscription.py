@@ -0,0 +1,73 @@
+"""Test the subscriptions and the subscribers index offline, with moto."""
+# pylint: disable=import-outside-toplevel
+import datetime as dt
+import uuid
+import pytest
+
+EMAIL_ADDRESS = "johndoe@gmail.com"
+
+
+def get_subscription_client():
+    """Client of the subscription router alone, without the middleware of the app creating the users."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from routers import subscription
+    app = FastAPI()
+    app.include_router(subscription.router)
+    return TestClient(app)
+
+
+def subscribe(user_uuid: str):
+    from routers.subscription import ENDPOINT_NAME
+    from utils import UUID_HEADER_NAME
+    return get_subscription_client().post(
+        f"/{ENDPOINT_NAME}",
+        json={"emailAddress": EMAIL_ADDRESS},
+        headers={UUID_HEADER_NAME: user_uuid},
+    )
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_subscription_of_an_unknown_user_is_not_found():
+    """Test that subscribing a UUID without user data returns 404 without creating the user."""
+    from dynamodb_models import UserDataTableModel
+    user_uuid = str(uuid.uuid4())
+    response = subscribe(user_uuid)
+    assert response.status_code == 404
+    with pytest.raises(UserDataTableModel.DoesNotExist):
+        UserDataTableModel.get(user_uuid)
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_subscribed_user_is_indexed_and_kept():
+    """Test that a subscribed user is found in the subscribers index and no longer expires."""
+    from dynamodb_models import UserDataTableModel
+    from subscribers import get_subscriber_uuids, iterate_subscribers
+    user_uuid = str(uuid.uuid4())
+    UserDataTableModel(user_uuid, expires=dt.timedelta(days=30)).save()
+    response = subscribe(user_uuid)
+    assert response.status_code == 200
+    user_data = UserDataTableModel.get(user_uuid)
+    assert user_data.is_subscribed
+    assert user_data.email_address == EMAIL_ADDRESS
+    assert user_data.expires is None
+    assert [model.UUID for model in iterate_subscribers()] == [user_uuid]
+    assert get_subscriber_uuids(EMAIL_ADDRESS) == [user_uuid]
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_backfill_only_indexes_legacy_subscribers():
+    """Test that the backfill adds the users subscribed before the index existed, and leaves the other users alone."""
+    from dynamodb_models import SUBSCRIBED_STATUS, UserDataTableModel
+    from subscribers import backfill_subscribers_index, iterate_subscribers
+    legacy_uuid, indexed_uuid, anonymous_uuid = (str(uuid.uuid4()) for _ in range(3))
+    UserDataTableModel(legacy_uuid, is_subscribed=True, email_address=EMAIL_ADDRESS, expires=dt.timedelta(days=30)).save()
+    UserDataTableModel(indexed_uuid, is_subscribed=True, email_address=EMAIL_ADDRESS, subscription_status=SUBSCRIBED_STATUS).save()
+    UserDataTableModel(anonymous_uuid, expires=dt.timedelta(days=30)).save()
+    assert backfill_subscribers_index() == 1
+    assert sorted(model.UUID for model in iterate_subscribers()) == sorted([legacy_uuid, indexed_uuid])
+    assert UserDataTableModel.get(legacy_uuid).expires is None
+    anonymous_user_data = UserDataTableModel.get(anonymous_uuid)
+    assert anonymous_user_data.subscription_status is None
+    assert anonymous_user_data.expires is not None
+    assert backfill_subscribers_index() == 0
@@ -0,0 +1,117 @@
+"""Test the expiry policies of the DynamoDB items."""
+# pylint: disable=import-outside-toplevel
+import datetime as dt
+import uuid
+import pytest
+from ttl_policy import get_expiry, is_expiry_refresh_due
+
+NOW = dt.datetime(2023, 5, 1, tzinfo=dt.timezone.utc)
+
+
+def test_disabled_policy_has_no_expiry():
+    """Test that a policy of 0 days does not expire records."""
+    assert get_expiry(0) is None
+    assert get_expiry(30) == dt.timedelta(days=30)
+    assert not is_expiry_refresh_due(None, ttl_days=0, now=NOW)
+
+
+def test_missing_expiry_is_refreshed():
+    """Test that a record without an expiry gets one."""
+    assert is_expiry_refresh_due(None, ttl_days=30, now=NOW)
+
+
+def test_expiry_is_only_refreshed_after_the_refresh_interval():
+    """Test that a recently written expiry is not rewritten on every request."""
+    recently_refreshed = NOW + dt.timedelta(days=30) - dt.timedelta(hours=1)
+    refreshed_days_ago = NOW + dt.timedelta(days=28)
+    assert not is_expiry_refresh_due(recently_refreshed, ttl_days=30, refresh_interval_hours=24, now=NOW)
+    assert is_expiry_refresh_due(refreshed_days_ago, ttl_days=30, refresh_interval_hours=24, now=NOW)
+    assert is_expiry_refresh_due(refreshed_days_ago.replace(tzinfo=None), ttl_days=30, refresh_interval_hours=24, now=NOW)
+
+
+def assert_expires_in(expires: dt.datetime, ttl_days: int) -> None:
+    """Assert that an expiry was just set to the end of a full period."""
+    remaining = expires - dt.datetime.now(dt.timezone.utc)
+    assert dt.timedelta(days=ttl_days) - dt.timedelta(minutes=1) < remaining <= dt.timedelta(days=ttl_days)
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_anonymous_user_expires_until_authenticated():
+    """Test that a new anonymous user gets an expiry, and that it is removed once the user authenticates."""
+    from dynamodb_models import UserDataTableModel
+    from ttl_policy import ttl_policy_settings
+    from utils import initialize_user_db
+    user_uuid = uuid.uuid4()
+    initialize_user_db(user_uuid, is_user_authenticated=False)
+    assert_expires_in(UserDataTableModel.get(str(user_uuid)).expires, ttl_policy_settings.anonymous_user_ttl_days)
+
+    initialize_user_db(user_uuid, is_user_authenticated=True)
+    user_data = UserDataTableModel.get(str(user_uuid))
+    assert user_data.authenticated_user
+    assert user_data.expires is None
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_subscribed_user_is_not_given_an_expiry():
+    """Test that a request of a subscribed user that is not authenticated keeps the user without an expiry."""
+    from dynamodb_models import UserDataTableModel
+    from utils import initialize_user_db
+    user_uuid = uuid.uuid4()
+    UserDataTableModel(str(user_uuid), is_subscribed=True).save()
+    initialize_user_db(user_uuid, is_user_authenticated=False)
+    assert UserDataTableModel.get(str(user_uuid)).expires is None
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_anonymous_user_expiry_is_refreshed_once_per_interval():
+    """Test that the expiry of an anonymous user is only rewritten once it was set more than the refresh interval ago."""
+    from dynamodb_models import UserDataTableModel
+    from ttl_policy import ttl_policy_settings
+    from utils import initialize_user_db
+    ttl_days = ttl_policy_settings.anonymous_user_ttl_days
+    refresh_interval = dt.timedelta(hours=ttl_policy_settings.ttl_refresh_interval_hours)
+    recently_refreshed_uuid, refreshed_long_ago_uuid = uuid.uuid4(), uuid.uuid4()
+    recent_expiry = dt.timedelta(days=ttl_days) - refresh_interval + dt.timedelta(hours=1)
+    UserDataTableModel(str(recently_refreshed_uuid), expires=recent_expiry).save()
+    recent_expires = UserDataTableModel.get(str(recently_refreshed_uuid)).expires
+    UserDataTableModel(str(refreshed_long_ago_uuid), expires=dt.timedelta(days=ttl_days) - refresh_interval - dt.timedelta(hours=1)).save()
+
+    initialize_user_db(recently_refreshed_uuid, is_user_authenticated=False)
+    initialize_user_db(refreshed_long_ago_uuid, is_user_authenticated=False)
+    assert UserDataTableModel.get(str(recently_refreshed_uuid)).expires == recent_expires
+    assert_expires_in(UserDataTableModel.get(str(refreshed_long_ago_uuid)).expires, ttl_days)
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_backfill_only_expires_anonymous_users():
+    """Test that the backfill sets the expiry of anonymous users and leaves authenticated and subscribed users alone."""
+    from dynamodb_models import UserDataTableModel
+    from ttl_backfill import backfill_segment, get_user_data_expiry
+    from ttl_policy import TTLPolicySettings
+    anonymous_uuid, authenticated_uuid, subscribed_uuid = (str(uuid.uuid4()) for _ in range(3))
+    UserDataTableModel(anonymous_uuid).save()
+    UserDataTableModel(authenticated_uuid, authenticated_user=True).save()
+    UserDataTableModel(subscribed_uuid, is_subscribed=True).save()
+    settings = TTLPolicySettings()
+    assert backfill_segment(UserDataTableModel, get_user_data_expiry, settings, segment=0, total_segments=1) == 1
+    assert_expires_in(UserDataTableModel.get(anonymous_uuid).expires, settings.anonymous_user_ttl_days)
+    assert UserDataTableModel.get(authenticated_uuid).expires is None
+    assert UserDataTableModel.get(subscribed_uuid).expires is None
+
+
+@pytest.mark.usefixtures("dynamodb_tables")
+def test_backfill_does_not_overwrite_an_expiry_set_during_the_scan():
+    """Test that an item given an expiry by the API after it was scanned keeps that expiry."""
+    from dynamodb_models import UserDataTableModel
+    from ttl_backfill import backfill_segment, get_user_data_expiry
+    from ttl_policy import TTLPolicySettings
+    user_uuid = str(uuid.uuid4())
+    UserDataTableModel(user_uuid).save()
+    api_expiry = dt.datetime(2030, 1, 1, tzinfo=dt.timezone.utc)
+
+    def get_expiry_after_api_update(model, settings):
+        UserDataTableModel(user_uuid).update(actions=[UserDataTableModel.expires.set(api_expiry)])
+        return get_user_data_expiry(model, settings)
+
+    assert backfill_segment(UserDataTableModel, get_expiry_after_api_update, TTLPolicySettings(), segment=0, total_segments=1) == 0
+    assert UserDataTableModel.get(user_uuid).expires == api_expiry